@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 import sys
 import os
 import pandas as pd
@@ -7,7 +7,14 @@ import math
 
 # Add src to path to import models
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
-from models import PricingModel, RentalModel, YieldCurveModel, UnifiedDataLoader
+from models import PricingModel, RentalModel, YieldCurveModel, ComparablesIndex, UnifiedDataLoader
+from location_index import LocationSearchIndex
+from response_encoder import frame_columns, records
+from listings_store import ListingsStore
+from pagination import encode_keyset_cursor, decode_keyset_cursor
+from portfolio import PortfolioValuer, LOCAL_CURRENCY, check_columns, csv_stream, parquet_stream, parquet_available
+from singleflight import SingleFlight
+from data_watcher import DataWatcher, Stage
 from sklearn.model_selection import train_test_split, KFold, cross_val_score
 from sklearn.metrics import mean_squared_error, r2_score
 import lightgbm as lgb
@@ -26,10 +33,17 @@ def after_request(response):
 price_model = PricingModel()
 rent_model = RentalModel()
 yield_model = YieldCurveModel()
+comparables_index = ComparablesIndex()
+listings_store = ListingsStore(os.environ.get('LISTINGS_DB_PATH') or os.path.join(price_model.loader.data_dir, 'listings.sqlite'))
 
 # --- DYNAMIC DATA LAB (Senior Engineer Architecture) ---
 import uuid
 import json
+import itertools
+import tempfile
+import hashlib
+import threading
+import time
 import requests
 
 class DatasetManager:
@@ -62,11 +76,13 @@ class GeminiAnalyst:
     AI Data Scientist.
     Uses Gemini API to analyze schema and propose modeling strategy.
     """
-    def __init__(self):
-        self.api_key = None # Set per request
+    def __init__(self, api_key=None):
+        self.api_key = api_key # Default key; requests pass their own to analyze_schema
         
-    def analyze_schema(self, schema_info, user_goal="Predict Demand/Price"):
-        if not self.api_key:
+    def analyze_schema(self, schema_info, user_goal="Predict Demand/Price", api_key=None):
+        """api_key is per call so concurrent requests never see each other's key."""
+        api_key = api_key or self.api_key
+        if not api_key:
             return {"error": "API Key missing"}
             
         prompt = f"""
@@ -82,7 +98,7 @@ class GeminiAnalyst:
         4. "reasoning": 1 sentence explanation.
         """
         
-        url = f"https://generativelanguage.googleapis.com/v1/models/gemini-flash-latest:generateContent?key={self.api_key}"
+        url = f"https://generativelanguage.googleapis.com/v1/models/gemini-flash-latest:generateContent?key={api_key}"
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
         
         try:
@@ -174,13 +190,30 @@ gemini_analyst = GeminiAnalyst()
 class ModelManager:
     """
     Manages trained model storage and retrieval with persistence.
+    Thread-safe: `models` is copy-on-write (writers build a new dict under a lock and swap it in,
+    entries are never mutated), so readers can iterate it without locking.
     """
     def __init__(self):
         self.models = {}  # In-memory storage: {model_id: {'model': lgb_model, 'metadata': {...}}}
         self.model_dir = '/tmp/models'
+        self._lock = threading.Lock()
+        self._load_locks = {}
         os.makedirs(self.model_dir, exist_ok=True)
         self._reload_saved_models()
     
+    def _set_entry(self, model_id, entry):
+        with self._lock:
+            self.models = {**self.models, model_id: entry}
+
+    def remove_model(self, model_id):
+        """Drops a model from the registry. Returns False if it was not registered."""
+        with self._lock:
+            if model_id not in self.models:
+                return False
+            self.models = {k: v for k, v in self.models.items() if k != model_id}
+            self._load_locks.pop(model_id, None)
+            return True
+
     def _reload_saved_models(self):
         """Scan disk for saved models and reload their metadata."""
         try:
@@ -200,20 +233,30 @@ class ModelManager:
                         
                         # We don't load the full model into memory unless needed, 
                         # but we keep metadata for the list view
-                        self.models[model_id] = {
+                        self._set_entry(model_id, {
                             'model': None, # Lazy load
                             'metadata': metadata
-                        }
+                        })
                         print(f"Loaded model metadata for: {model_id}")
         except Exception as e:
             print(f"Error reloading models: {e}")
 
     def _ensure_model_loaded(self, model_id):
-        """Lazy load model from disk if not in memory."""
-        if model_id in self.models and self.models[model_id]['model'] is None:
+        """Lazy load model from disk if not in memory (once per model, even under concurrent requests)."""
+        entry = self.models.get(model_id)
+        if entry is None or entry['model'] is not None:
+            return
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+        # Per-model lock: a slow load does not block lookups or loads of other models
+        with load_lock:
+            entry = self.models.get(model_id)
+            if entry is None or entry['model'] is not None:
+                return
             model_path = os.path.join(self.model_dir, f"{model_id}.txt")
             if os.path.exists(model_path):
-                self.models[model_id]['model'] = lgb.Booster(model_file=model_path)
+                model = lgb.Booster(model_file=model_path)
+                self._set_entry(model_id, {'model': model, 'metadata': entry['metadata']})
     
     def save_model_session(self, model, metadata):
         """
@@ -221,10 +264,10 @@ class ModelManager:
         Returns model_id.
         """
         model_id = str(uuid.uuid4())
-        self.models[model_id] = {
+        self._set_entry(model_id, {
             'model': model,
             'metadata': metadata
-        }
+        })
         
         # Immediate persistence
         filepath = os.path.join(self.model_dir, f"{model_id}.txt")
@@ -286,10 +329,10 @@ class ModelManager:
             with open(meta_path, 'w') as f:
                 json.dump(metadata, f)
         
-        self.models[model_id] = {
+        self._set_entry(model_id, {
             'model': model,
             'metadata': metadata
-        }
+        })
         
         return model_id, metadata
 
@@ -411,6 +454,7 @@ class ExchangeRateManager:
     def __init__(self):
         self.cache = {}
         self.base_url = "https://api.exchangerate-api.com/v4/latest/USD"
+        self._flight = SingleFlight()  # Concurrent misses for a pair share one HTTP fetch
     
     def get_rate(self, from_currency, to_currency='USD'):
         """
@@ -423,7 +467,10 @@ class ExchangeRateManager:
         cache_key = f"{from_currency}_{to_currency}"
         if cache_key in self.cache:
             return self.cache[cache_key]
-        
+        return self._flight.do(cache_key, self._fetch_rate, from_currency, to_currency)
+
+    def _fetch_rate(self, from_currency, to_currency):
+        cache_key = f"{from_currency}_{to_currency}"
         try:
             # Fetch rates from API
             response = requests.get(self.base_url, timeout=5)
@@ -463,7 +510,8 @@ class DynamicCountryManager:
         self.dynamic_dir = 'datasets/dynamic'
         self.config_file = os.path.join(self.dynamic_dir, 'countries.json')
         os.makedirs(self.dynamic_dir, exist_ok=True)
-        self.countries = self._load_config()
+        self.countries = self._load_config()  # Copy-on-write: replaced, never mutated in place
+        self._lock = threading.Lock()
     
     def _load_config(self):
         """Load saved country configurations."""
@@ -479,23 +527,47 @@ class DynamicCountryManager:
     
     def add_country(self, country_name, currency, dataset_path, exchange_rate):
         """Register a new country."""
-        self.countries[country_name] = {
+        config = {
             'currency': currency,
             'dataset_path': dataset_path,
             'exchange_rate_to_usd': exchange_rate,
             'added_at': pd.Timestamp.now().isoformat()
         }
-        self._save_config()
+        with self._lock:
+            self.countries = {**self.countries, country_name: config}
+            self._save_config()
+
+    def remove_country(self, country_name):
+        """Unregister a country. Returns its config, or None if it was not registered."""
+        with self._lock:
+            config = self.countries.get(country_name)
+            if config is not None:
+                self.countries = {k: v for k, v in self.countries.items() if k != country_name}
+                self._save_config()
+            return config
     
     def get_all_countries(self):
         """Get list of all available countries (original + dynamic)."""
         base_countries = ['Thailand', 'Philippines', 'Malaysia', 'Vietnam']
         return base_countries + list(self.countries.keys())
     
+    def version(self):
+        """Fingerprint of the registry and each registered dataset file (size, mtime)."""
+        countries = self.countries
+        digest = hashlib.sha1(json.dumps(countries, sort_keys=True).encode())
+        for name in sorted(countries):
+            path = countries[name].get('dataset_path', '')
+            try:
+                st = os.stat(path)
+                digest.update(f"{path}:{st.st_size}:{st.st_mtime_ns};".encode())
+            except OSError:
+                digest.update(f"{path}:missing;".encode())
+        return digest.hexdigest()[:16]
+
     def get_country_data(self, country_name):
         """Get data for a specific country."""
-        if country_name in self.countries:
-            config = self.countries[country_name]
+        config = self.countries.get(country_name)
+        if config is not None:
             df = pd.read_csv(config['dataset_path'])
             return df, config
         return None, None
@@ -504,67 +576,336 @@ country_detector = CountryDetector()
 exchange_rate_manager = ExchangeRateManager()
 dynamic_country_manager = DynamicCountryManager()
 
+def _find_location_column(df):
+    """First column that looks like a location field in a dynamic country dataset."""
+    for col in df.columns:
+        if any(keyword in col.lower() for keyword in ['location', 'city', 'neighbourhood', 'area', 'district']):
+            return col
+    return None
+
+def build_location_catalog():
+    """
+    Canonical location catalog: {country: {location: listing_count}} for base + dynamic countries.
+    """
+    catalog = {}
+    df = price_model.loader.load_unified_data()
+    if not df.empty:
+        counts = df.dropna(subset=['location']).groupby(['country', 'location']).size()
+        for (country, location), count in counts.items():
+            catalog.setdefault(country, {})[location] = int(count)
+
+    for country_name in list(dynamic_country_manager.countries.keys()):
+        try:
+            country_df, _ = dynamic_country_manager.get_country_data(country_name)
+        except Exception as e:
+            print(f"Skipping locations for {country_name}: {e}")
+            continue
+        location_col = _find_location_column(country_df) if country_df is not None else None
+        if location_col:
+            counts = country_df[location_col].dropna().astype(str).value_counts()
+            catalog[country_name] = {loc: int(n) for loc, n in counts.items()}
+    return catalog
+
+def build_locations_payload():
+    """Unique locations per country (base + up to 50 per dynamic country)."""
+    df = price_model.loader.load_unified_data()
+
+    # Get unique locations per country from base data
+    locations = {}
+    if not df.empty:
+        for country, locs in df.dropna(subset=['location']).groupby('country')['location']:
+            locations[country] = sorted(locs.unique().tolist())
+
+    # Add dynamic countries
+    for country_name in list(dynamic_country_manager.countries.keys()):
+        country_df, config = dynamic_country_manager.get_country_data(country_name)
+        if country_df is not None:
+            location_col = _find_location_column(country_df)
+            if location_col:
+                locations[country_name] = sorted(country_df[location_col].dropna().unique().tolist()[:50])  # Limit to 50
+            else:
+                # No location column, use placeholder
+                locations[country_name] = ['All Locations']
+    return locations
+
+location_search_index = LocationSearchIndex()
+
+class LocationCatalog:
+    """
+    Materialized /locations response and search index.
+    Rebuilt only when the base dataset or the dynamic-country registry version changes;
+    otherwise requests are served from the pre-serialized bytes with a strong ETag.
+    """
+    def __init__(self):
+        self.version = None
+        self.body = None
+        self.etag = None
+        self._lock = threading.Lock()
+
+    def current_version(self):
+        return f"{price_model.loader.data_version()}-{dynamic_country_manager.version()}"
+
+    def ensure_fresh(self):
+        version = self.current_version()
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            payload = build_locations_payload()
+            location_search_index.build(build_location_catalog())
+            body = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            self.body, self.etag = body, hashlib.sha1(body).hexdigest()
+            self.version = version
+            print(f"Location catalog rebuilt (version {version}).")
+
+location_catalog = LocationCatalog()
+
 
 
 def startup():
+    # Retrains only models whose training data changed since their current registry version.
+    # Runs before serving: under __main__ below, and in the gunicorn master's when_ready hook
     print("Loading Global Pricing Model...")
-    price_model.train()
+    price_model.retrain_if_needed()
     print("Loading Smart Rental Model...")
-    rent_model.train()
+    rent_model.retrain_if_needed()
     print("Loading Yield Curve Model...")
-    yield_model.train() # Train the new Yield Logic dummy
-
-# Initialize model by trying to predict a dummy
-try:
-    price_model.predict({
-        'country': 'Thailand', 'location': 'Sukhumvit', 
-        'bedrooms': 1, 'bathrooms': 1, 'area_sqm': 30, 'property_type': 'Condo'
-    })
-    print("Models loaded successfully.")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    print("Please ensure 'dataset_price_model.txt' exists in the root or src directory.")
+    yield_model.retrain_if_needed() # Train the new Yield Logic dummy
+
+service_state = {'ready': False, 'warm_up_seconds': None, 'components': {}}
+
+def warm_up():
+    """
+    Loads everything request handlers would otherwise load lazily: the unified dataset cache,
+    the three boosters, the location encodings, the comparables index and the location catalog.
+    Under a preforking server (see gunicorn.conf.py) this runs once in the master, and the
+    workers share the loaded pages copy-on-write instead of each loading its own copy.
+    """
+    start = time.time()
+    components = {}
+
+    # Initialize model by trying to predict a dummy
+    try:
+        UnifiedDataLoader().load_unified_data()
+        price_model.predict({
+            'country': 'Thailand', 'location': 'Sukhumvit', 
+            'bedrooms': 1, 'bathrooms': 1, 'area_sqm': 30, 'property_type': 'Condo'
+        })
+        components['price_model'] = price_model.model is not None
+        print("Models loaded successfully.")
+    except Exception as e:
+        components['price_model'] = False
+        print(f"Error loading model: {e}")
+        print("Please ensure 'dataset_price_model.txt' exists in the root or src directory.")
+
+    try:
+        rent_model.predict({
+            'country': 'Vietnam', 'location': 'Quận 1, Hồ Chí Minh',
+            'bedrooms': 1, 'bathrooms': 1, 'area_sqm': 30, 'property_type': 'Condo'
+        })
+        yield_model.predict_yield({'area_sqm': 30, 'bedrooms': 1, 'bathrooms': 1}, 100000)
+        components['rent_model'] = rent_model.model is not None
+        components['yield_model'] = yield_model.model is not None
+    except Exception as e:
+        print(f"Error loading rental/yield models: {e}")
+
+    try:
+        comparables_index.build()
+        components['comparables_index'] = True
+    except Exception as e:
+        components['comparables_index'] = False
+        print(f"Error building comparables index: {e}")
+
+    try:
+        location_catalog.ensure_fresh()
+        components['location_catalog'] = True
+    except Exception as e:
+        components['location_catalog'] = False
+        print(f"Error building location catalog: {e}")
+
+    try:
+        listings_store.ensure_fresh(price_model.loader)
+        components['listings_store'] = True
+    except Exception as e:
+        components['listings_store'] = False
+        print(f"Error building listings store: {e}")
+
+    service_state['components'] = components
+    service_state['warm_up_seconds'] = round(time.time() - start, 2)
+    # The price model is the only hard requirement; everything else degrades per endpoint
+    service_state['ready'] = components.get('price_model', False)
+    print(f"Warm-up finished in {service_state['warm_up_seconds']}s (ready: {service_state['ready']}).")
+
+warm_up()
+
+# Built-in models served from the versioned registry (src/model_registry.py)
+BUILTIN_MODELS = {'price': price_model, 'rent': rent_model, 'yield': yield_model}
+MODEL_POLL_SECONDS = float(os.environ.get('MODEL_POLL_SECONDS', 15))
+
+def reload_builtin_models():
+    """Swaps each built-in model to the registry's current version. Returns {name: active version}."""
+    versions = {}
+    for name, model in BUILTIN_MODELS.items():
+        try:
+            versions[name] = model.reload()
+        except Exception as e:
+            print(f"Error reloading {name} model: {e}")
+            versions[name] = model.model_version
+    return versions
+
+def retrain_builtin_models():
+    for name, model in BUILTIN_MODELS.items():
+        retrained = model.retrain_if_needed()
+        print(f"{name} model: {'retrained' if retrained else 'training data unchanged, kept'} ({model.model_version})")
+
+def rebuild_dataset_cache():
+    price_model.loader.load_unified_data()
+    price_model.rebuild_location_index()
+
+# Minimal rebuild on dataset changes: each stage skips itself when its own input is unchanged,
+# so a new dynamic country only refreshes the catalog and never retrains.
+data_watcher = DataWatcher(
+    paths=[price_model.loader.data_dir, dynamic_country_manager.dynamic_dir],
+    stages=[
+        Stage('dataset_cache', rebuild_dataset_cache, debounce_seconds=2, fingerprint=price_model.loader.data_version),
+        Stage('location_catalog', location_catalog.ensure_fresh, debounce_seconds=2),
+        Stage('comparables_index', comparables_index.build, debounce_seconds=2, fingerprint=price_model.loader.data_version),
+        Stage('listings_store', lambda: listings_store.ensure_fresh(price_model.loader), debounce_seconds=2, fingerprint=price_model.loader.data_version),
+        Stage('retrain', retrain_builtin_models, debounce_seconds=float(os.environ.get('RETRAIN_DEBOUNCE_SECONDS', 60)))
+    ],
+    poll_seconds=float(os.environ.get('DATA_POLL_SECONDS', 5))
+)
+
+def start_model_watcher():
+    """
+    Polls the registry's CURRENT pointers and hot-swaps models when a new version is published.
+    Each process needs its own watcher (gunicorn starts one per worker in post_fork).
+    """
+    if MODEL_POLL_SECONDS <= 0:
+        return None
+
+    def watch():
+        while True:
+            time.sleep(MODEL_POLL_SECONDS)
+            reload_builtin_models()
+
+    thread = threading.Thread(target=watch, name='model-watcher', daemon=True)
+    thread.start()
+    return thread
+
+def start_data_watcher(on_rebuilt=None):
+    """
+    Runs the rebuild pipeline above in this process. Exactly one process runs it: the app itself
+    when started directly, or the gunicorn master (gunicorn.conf.py), which rebuilds once and then
+    replaces its workers (on_rebuilt) so they fork from the refreshed state instead of each
+    rebuilding its own copy.
+    """
+    if os.environ.get('DATA_WATCH', '1') != '0':
+        data_watcher.on_rebuilt = on_rebuilt
+        data_watcher.start()
+
+def start_watchers():
+    """Background watchers for a standalone server (python api_server.py)."""
+    start_model_watcher()
+    start_data_watcher()
 
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'product': 'Global Market Intelligence'})
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 503 until warm-up has loaded the models and indexes."""
+    body = {
+        'ready': service_state['ready'],
+        'warm_up_seconds': service_state['warm_up_seconds'],
+        'components': service_state['components'],
+        'model_versions': {name: model.model_version for name, model in BUILTIN_MODELS.items()},
+        'deduplication': price_model.loader.dedup_report(),
+        'pid': os.getpid()
+    }
+    return jsonify(body), (200 if service_state['ready'] else 503)
+
 @app.route('/locations', methods=['GET'])
 def get_locations():
     """
     Returns unique locations per country (base + dynamic).
+    Served from a materialized payload with a strong ETag; send If-None-Match to get a 304.
     """
     try:
-        if not hasattr(price_model, 'loader'):
-             price_model.loader = UnifiedDataLoader()
-             
-        df = price_model.loader.load_unified_data()
-        
-        # Get unique locations per country from base data
-        locations = {}
-        for country in df['country'].unique():
-            locs = sorted(df[df['country'] == country]['location'].dropna().unique().tolist())
-            locations[country] = locs
-        
-        # Add dynamic countries
-        for country_name in dynamic_country_manager.countries.keys():
-            country_df, config = dynamic_country_manager.get_country_data(country_name)
-            if country_df is not None:
-                # Try to find location column
-                location_col = None
-                for col in country_df.columns:
-                    if any(keyword in col.lower() for keyword in ['location', 'city', 'neighbourhood', 'area', 'district']):
-                        location_col = col
-                        break
-                
-                if location_col:
-                    locs = sorted(country_df[location_col].dropna().unique().tolist()[:50])  # Limit to 50
-                    locations[country_name] = locs
-                else:
-                    # No location column, use placeholder
-                    locations[country_name] = ['All Locations']
-            
-        return jsonify(locations)
+        location_catalog.ensure_fresh()
+        response = Response(location_catalog.body, mimetype='application/json')
+        response.set_etag(location_catalog.etag)
+        response.headers['Cache-Control'] = 'no-cache'  # Always revalidate, usually a 304
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/locations/search', methods=['GET'])
+def search_locations():
+    """
+    Location autocomplete. ?q=<text>&country=<optional>&limit=<default 10, max 100>
+    Accent-insensitive: 'quan 1' matches 'Quận 1, Hồ Chí Minh'.
+    """
+    try:
+        query = request.args.get('q', '')
+        country = request.args.get('country') or None
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+        location_catalog.ensure_fresh()
+        results = location_search_index.search(query, country=country, limit=limit)
+        return jsonify({'query': query, 'country': country, 'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+LISTINGS_PAGE_SIZE = 50
+LISTINGS_MAX_PAGE_SIZE = 500
+
+@app.route('/listings/search', methods=['GET'])
+def search_listings():
+    """
+    Individual listings from the indexed SQLite store (src/listings_store.py).
+    ?country=&location=&transaction_type=&property_type=  exact match (first three case-insensitive)
+    &min_price=&max_price= (USD) &min_area=&max_area= (sqm) &min_bedrooms=&max_bedrooms=
+    &sort=price_usd|-price_usd|area_sqm|-area_sqm|price_per_sqm|-price_per_sqm (default price_usd)
+    &limit=<default 50, max 500>&cursor=<next_cursor of the previous page>
+    Serves the database on disk as it is; if the datasets have changed since it was built, a
+    rebuild is started in the background (normally the data watcher has already done it).
+    """
+    try:
+        args = request.args
+        filters = {field: args.get(field) for field in ('country', 'location', 'transaction_type', 'property_type')}
+        for field in ('price', 'area', 'bedrooms'):
+            for bound in ('min', 'max'):
+                value = args.get(f'{bound}_{field}')
+                filters[f'{bound}_{field}'] = float(value) if value not in (None, '') else None
+        sort = args.get('sort', 'price_usd')
+        limit = max(1, min(int(args.get('limit', LISTINGS_PAGE_SIZE)), LISTINGS_MAX_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+
+    try:
+        stored = listings_store.stored_version()
+        if stored != price_model.loader.data_version():
+            listings_store.refresh(price_model.loader)
+        if stored is None:
+            return jsonify({'error': 'Listings store is being built, retry shortly'}), 503
+        after, cursor_version = None, None
+        if args.get('cursor'):
+            try:
+                after, cursor_sort, cursor_version = decode_keyset_cursor(args['cursor'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if cursor_sort != sort:
+                return jsonify({'error': 'Cursor was issued for a different sort'}), 400
+        try:
+            rows, last, version = listings_store.search(filters, sort=sort, limit=limit, after=after)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if cursor_version is not None and cursor_version != version:
+            return jsonify({'error': 'Cursor expired: listings were refreshed, restart from the first page'}), 409
+        next_cursor = encode_keyset_cursor(last, sort, version) if len(rows) == limit else None
+        return jsonify({'results': rows, 'count': len(rows), 'next_cursor': next_cursor, 'version': version})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -621,14 +962,7 @@ def predict_price():
         # Currency Logic
         loader_rates = price_model.loader.exchange_rates
         
-        currency_map = {
-            'Thailand': 'THB',
-            'Philippines': 'PHP',
-            'Malaysia': 'MYR',
-            'Vietnam': 'VND'
-        }
-        
-        local_code = currency_map.get(data['country'], 'USD')
+        local_code = LOCAL_CURRENCY.get(data['country'], 'USD')
         local_rate = 1.0 / loader_rates.get(local_code, 1.0)
         
         price_local = price * local_rate
@@ -674,44 +1008,493 @@ def compare_markets():
             {'country': 'Philippines', 'location': 'Makati'},
             {'country': 'Vietnam', 'location': 'Quận 1, Hồ Chí Minh'}
         ],
+        'target_country': 'Vietnam',   # optional: compare against every known location in this country
+        'limit': 50,                   # optional: keep only the N cheapest targets
         'bedrooms': 2, 'bathrooms': 2, 'area_sqm': 80, 'property_type': 'Condo'
     }
+    Base and all targets are priced in a single vectorized model call.
     """
     data = request.json
-    
-    # 1. Get base price
-    base_features = {
-        'country': data['source_country'],
-        'location': data['source_location'],
-        'bedrooms': data.get('bedrooms', 2),
-        'bathrooms': data.get('bathrooms', 2),
-        'area_sqm': data.get('area_sqm', 80),
-        'property_type': data.get('property_type', 'Condo')
+    if not data or 'source_country' not in data or 'source_location' not in data:
+        return jsonify({'error': 'Missing source_country or source_location'}), 400
+
+    try:
+        base_features = {
+            'country': data['source_country'],
+            'location': data['source_location'],
+            'bedrooms': data.get('bedrooms', 2),
+            'bathrooms': data.get('bathrooms', 2),
+            'area_sqm': data.get('area_sqm', 80),
+            'property_type': data.get('property_type', 'Condo')
+        }
+
+        targets = [{'country': t['country'], 'location': t['location']} for t in data.get('target_locations', [])]
+
+        # "All locations in country X" mode
+        target_country = data.get('target_country')
+        if target_country:
+            country_name, country_locations = price_model.locations_for_country(target_country)
+            if not country_locations:
+                return jsonify({'error': f'No known locations for country: {target_country}'}), 404
+            targets += [
+                {'country': country_name, 'location': loc}
+                for loc in country_locations
+                if not (country_name == base_features['country'] and loc == base_features['location'])
+            ]
+
+        if not targets:
+            return jsonify({'error': 'Provide target_locations or target_country'}), 400
+
+        # 1. One prediction over base + targets
+        rows = [base_features] + [{**base_features, **target} for target in targets]
+        prices = price_model.predict_batch(rows)
+        if prices is None:
+            return jsonify({'error': 'Price model unavailable'}), 500
+
+        base_price = prices[0]
+        target_prices = prices[1:]
+        diff_pct = np.round((target_prices - base_price) / base_price * 100, 2)
+
+        # 2. Rank cheapest first when scanning a whole country
+        order = np.arange(len(targets))
+        if target_country:
+            order = np.argsort(diff_pct, kind='stable')
+        limit = data.get('limit')
+        if limit:
+            order = order[:int(limit)]
+
+        comparisons = []
+        for i in order:
+            pct = float(diff_pct[i])
+            comparisons.append({
+                'location': targets[i]['location'],
+                'country': targets[i]['country'],
+                'price_usd': float(target_prices[i]),
+                'difference_pct': pct,
+                'insight': f"{'Cheaper' if pct < 0 else 'More Expensive'} by {abs(pct)}%"
+            })
+
+        return jsonify({
+            'base_location': f"{data['source_location']}, {data['source_country']}",
+            'base_price_usd': float(base_price),
+            'targets_evaluated': len(targets),
+            'comparisons': comparisons
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+COMPARABLE_FIELDS = [
+    ('location', 'location', 'raw'),
+    ('property_type', 'property_type', 'rawn'),
+    ('price_usd', 'price_usd', 'float'),
+    ('price_local', 'price_local', 'floatn'),
+    ('area_sqm', 'area_sqm', 'float'),
+    ('bedrooms', 'bedrooms', 'floatn'),
+    ('bathrooms', 'bathrooms', 'floatn'),
+    ('price_per_sqm_usd', 'price_per_sqm', 'float', 2),
+    ('distance', 'distance', 'float', 4)
+]
+
+@app.route('/comparables', methods=['POST'])
+def comparables():
+    """
+    Returns the k real listings most similar to a property spec (same country).
+    Input: {
+        'country': str, 'area_sqm': float, 'bedrooms': int, 'bathrooms': int,
+        'price_per_sqm': float,                       # optional
+        'location': str, 'property_type': str,        # used to estimate price_per_sqm if omitted
+        'k': 10
     }
-    base_price = price_model.predict(base_features)
-    
-    comparisons = []
-    for target in data['target_locations']:
-        target_features = base_features.copy()
-        target_features['country'] = target['country']
-        target_features['location'] = target['location']
-        
-        target_price = price_model.predict(target_features)
-        
-        diff_pct = ((target_price - base_price) / base_price) * 100
-        comparisons.append({
-            'location': target['location'],
-            'country': target['country'],
-            'price_usd': float(target_price),
-            'difference_pct': round(diff_pct, 2),
-            'insight': f"{'Cheaper' if diff_pct < 0 else 'More Expensive'} by {abs(round(diff_pct, 2))}%"
+    """
+    data = request.json
+    if not data or 'country' not in data or 'area_sqm' not in data:
+        return jsonify({'error': 'Missing country or area_sqm'}), 400
+
+    try:
+        spec = {
+            'area_sqm': data['area_sqm'],
+            'bedrooms': data.get('bedrooms'),
+            'bathrooms': data.get('bathrooms'),
+            'price_per_sqm': data.get('price_per_sqm')
+        }
+        # Anchor the price dimension on the model's valuation when the caller has no price
+        if spec['price_per_sqm'] is None and data.get('location') and float(data['area_sqm']) > 0:
+            price = price_model.predict({
+                'country': data['country'],
+                'location': data['location'],
+                'bedrooms': data.get('bedrooms', 2),
+                'bathrooms': data.get('bathrooms', 2),
+                'area_sqm': data['area_sqm'],
+                'property_type': data.get('property_type', 'Condo')
+            })
+            if price is not None and price > 0:
+                spec['price_per_sqm'] = price / float(data['area_sqm'])
+
+        matches = comparables_index.query(data['country'], spec, k=data.get('k', 10))
+        if matches.empty:
+            return jsonify({'error': f"No listings indexed for country: {data['country']}"}), 404
+
+        results = records(frame_columns(matches, COMPARABLE_FIELDS))
+
+        return jsonify({
+            'country': data['country'],
+            'query': spec,
+            'comparables': results
         })
-        
-    return jsonify({
-        'base_location': f"{data['source_location']}, {data['source_country']}",
-        'base_price_usd': float(base_price),
-        'comparisons': comparisons
-    })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+MATRIX_BLOCK_ROWS = 256  # Rows of the N x N matrix materialized at once
+
+def _price_diff_block(prices, start, stop):
+    """
+    Rows [start, stop) of the pairwise price-difference matrix via broadcasting.
+    Cell (i, j) = % change in price moving the same property from location i to location j.
+    """
+    base = prices[start:stop, None]
+    return (prices[None, :] - base) / base * 100
+
+@app.route('/price_matrix', methods=['POST'])
+def price_matrix():
+    """
+    Cross-market price-difference matrix for one property spec.
+    Input: {
+        'bedrooms': 2, 'bathrooms': 2, 'area_sqm': 80, 'property_type': 'Condo',
+        'countries': ['Thailand', 'Vietnam'],        # optional, default: every known location
+        'locations': [{'country': ..., 'location': ...}],  # optional explicit list instead
+        'top_k': 20                                  # optional: only the k cheapest pairs
+    }
+    Every location is priced once through the batch path. The full matrix is streamed
+    row by row in columnar form: {"locations", "countries", "prices_usd", "matrix"}.
+    With top_k, returns {"columns": [...], "data": [[source_idx, target_idx, difference_pct], ...]}.
+    """
+    data = request.json or {}
+
+    try:
+        spec = {
+            'bedrooms': data.get('bedrooms', 2),
+            'bathrooms': data.get('bathrooms', 2),
+            'area_sqm': data.get('area_sqm', 80),
+            'property_type': data.get('property_type', 'Condo')
+        }
+        if data.get('locations'):
+            locations = [{'country': l['country'], 'location': l['location']} for l in data['locations']]
+        else:
+            locations = price_model.known_locations(data.get('countries'))
+
+        # Only an absent/null top_k means the full matrix; anything else must be a positive integer
+        top_k = data.get('top_k')
+        if top_k is not None:
+            if isinstance(top_k, bool) or not isinstance(top_k, (int, str)) or not str(top_k).strip().isdigit() \
+                    or int(top_k) < 1:
+                return jsonify({'error': 'top_k must be a positive integer'}), 400
+            top_k = int(top_k)
+
+        if len(locations) < 2:
+            return jsonify({'error': 'Need at least two locations to build a matrix'}), 400
+
+        prices = price_model.predict_batch([{**spec, **loc} for loc in locations])
+        if prices is None:
+            return jsonify({'error': 'Price model unavailable'}), 500
+
+        # Non-positive predictions make ratios meaningless; drop them from the matrix
+        valid = prices > 0
+        excluded = int((~valid).sum())
+        locations = [loc for loc, ok in zip(locations, valid) if ok]
+        prices = prices[valid]
+        n = len(prices)
+        if n < 2:
+            return jsonify({'error': 'Need at least two locations with a positive predicted price to build a matrix',
+                            'excluded_locations': excluded}), 400
+
+        if top_k is not None:
+            k = min(top_k, n * (n - 1))
+            best_vals = np.empty(0)
+            best_idx = np.empty(0, dtype=np.int64)
+            for start in range(0, n, MATRIX_BLOCK_ROWS):
+                stop = min(start + MATRIX_BLOCK_ROWS, n)
+                block = _price_diff_block(prices, start, stop)
+                block[np.arange(stop - start), np.arange(start, stop)] = np.inf  # skip i == j
+                flat = block.ravel()
+                take = min(k, flat.size)
+                cand = np.argpartition(flat, take - 1)[:take]
+                best_vals = np.concatenate([best_vals, flat[cand]])
+                best_idx = np.concatenate([best_idx, cand + start * n])
+                if best_vals.size > k:
+                    keep = np.argpartition(best_vals, k - 1)[:k]
+                    best_vals, best_idx = best_vals[keep], best_idx[keep]
+            order = np.argsort(best_vals, kind='stable')
+            src, dst = np.divmod(best_idx[order], n)
+            return jsonify({
+                'locations': [loc['location'] for loc in locations],
+                'countries': [loc['country'] for loc in locations],
+                'prices_usd': np.round(prices, 2).tolist(),
+                'excluded_locations': excluded,
+                'columns': ['source_idx', 'target_idx', 'difference_pct'],
+                'data': [[int(i), int(j), round(float(v), 2)] for i, j, v in zip(src, dst, best_vals[order])]
+            })
+
+        def generate():
+            header = {
+                'locations': [loc['location'] for loc in locations],
+                'countries': [loc['country'] for loc in locations],
+                'prices_usd': np.round(prices, 2).tolist(),
+                'excluded_locations': excluded
+            }
+            yield json.dumps(header, ensure_ascii=False)[:-1] + ', "matrix": ['
+            for start in range(0, n, MATRIX_BLOCK_ROWS):
+                stop = min(start + MATRIX_BLOCK_ROWS, n)
+                block = np.round(_price_diff_block(prices, start, stop), 2)
+                rows = ','.join(json.dumps(row) for row in block.tolist())
+                yield (',' if start else '') + rows
+            yield ']}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+MAX_SURFACE_POINTS = 20000
+SURFACE_DEFAULT_AXES = {
+    'area_sqm': {'min': 20, 'max': 200, 'step': 10},
+    'bedrooms': [1, 2, 3, 4],
+    'bathrooms': [1, 2, 3]
+}
+
+def _grid_axis(spec):
+    """Axis values from a list, a single number, or {'min', 'max', 'step'} (max inclusive)."""
+    if isinstance(spec, dict):
+        low, high, step = float(spec['min']), float(spec['max']), float(spec['step'])
+        if step <= 0 or high < low:
+            raise ValueError('Axis needs min <= max and step > 0')
+        if (high - low) / step + 1 > MAX_SURFACE_POINTS:
+            raise ValueError(f'Axis has more than {MAX_SURFACE_POINTS} values')
+        values = np.arange(low, high + step / 2, step)
+    elif isinstance(spec, (list, tuple)):
+        values = np.unique(np.asarray(spec, dtype=float))
+    else:
+        values = np.array([float(spec)])
+    if values.size == 0 or not np.isfinite(values).all():
+        raise ValueError('Axis values must be finite numbers')
+    return values
+
+@app.route('/price_surface', methods=['POST'])
+def price_surface():
+    """
+    Price sensitivity surface for one location and property type.
+    Input: {
+        'country': 'Thailand', 'location': 'Sukhumvit', 'property_type': 'Condo',
+        'area_sqm': {'min': 20, 'max': 200, 'step': 10},   # or a list, or one value
+        'bedrooms': [1, 2, 3, 4],
+        'bathrooms': [1, 2, 3]
+    }
+    The whole area x bedrooms x bathrooms grid is priced in one batch prediction.
+    Returns the axes, surface[bedroom_idx][bathroom_idx][area_idx] (USD), and marginal curves per axis:
+    mean price and price/sqm over the other two axes, plus dPrice/dArea (the marginal price of one more sqm).
+    """
+    data = request.json or {}
+    if 'country' not in data or 'location' not in data:
+        return jsonify({'error': 'Missing country or location'}), 400
+    try:
+        axes = {name: _grid_axis(data.get(name, default)) for name, default in SURFACE_DEFAULT_AXES.items()}
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid grid axis: {e}'}), 400
+    area, bedrooms, bathrooms = axes['area_sqm'], axes['bedrooms'], axes['bathrooms']
+    if (area <= 0).any():
+        return jsonify({'error': 'area_sqm values must be positive'}), 400
+    points = area.size * bedrooms.size * bathrooms.size
+    if points > MAX_SURFACE_POINTS:
+        return jsonify({'error': f'Grid has {points} points; the maximum is {MAX_SURFACE_POINTS}'}), 400
+
+    try:
+        # Grid in (bedrooms, bathrooms, area) order so the flat predictions reshape straight into the surface
+        bed_grid, bath_grid, area_grid = np.meshgrid(bedrooms, bathrooms, area, indexing='ij')
+        grid = pd.DataFrame({
+            'country': data['country'],
+            'location': data['location'],
+            'property_type': data.get('property_type', 'Condo'),
+            'bedrooms': bed_grid.ravel(),
+            'bathrooms': bath_grid.ravel(),
+            'area_sqm': area_grid.ravel()
+        })
+        prices = price_model.predict_batch(grid)
+        if prices is None:
+            return jsonify({'error': 'Price model unavailable'}), 500
+        surface = prices.reshape(bedrooms.size, bathrooms.size, area.size)
+        pps = surface / area[None, None, :]
+
+        by_area = surface.mean(axis=(0, 1))
+        marginal = {
+            'area_sqm': {
+                'price_usd': np.round(by_area, 2).tolist(),
+                'price_per_sqm_usd': np.round(pps.mean(axis=(0, 1)), 2).tolist(),
+                'marginal_price_per_sqm_usd': np.round(np.gradient(by_area, area), 2).tolist() if area.size > 1 else None
+            },
+            'bedrooms': {
+                'price_usd': np.round(surface.mean(axis=(1, 2)), 2).tolist(),
+                'price_per_sqm_usd': np.round(pps.mean(axis=(1, 2)), 2).tolist()
+            },
+            'bathrooms': {
+                'price_usd': np.round(surface.mean(axis=(0, 2)), 2).tolist(),
+                'price_per_sqm_usd': np.round(pps.mean(axis=(0, 2)), 2).tolist()
+            }
+        }
+
+        local_code = LOCAL_CURRENCY.get(data['country'], 'USD')
+        _, known = price_model.locations_for_country(data['country'])
+        return jsonify({
+            'country': data['country'],
+            'location': data['location'],
+            'property_type': grid['property_type'].iloc[0],
+            'known_location': data['location'] in known,
+            'axes': {name: values.tolist() for name, values in axes.items()},
+            'surface_order': ['bedrooms', 'bathrooms', 'area_sqm'],
+            'surface_usd': np.round(surface, 2).tolist(),
+            'marginal': marginal,
+            'currency_local': local_code,
+            'usd_to_local': 1.0 / price_model.loader.exchange_rates.get(local_code, 1.0)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+PORTFOLIO_CHUNK_ROWS = int(os.environ.get('PORTFOLIO_CHUNK_ROWS', 5000))
+portfolio_valuer = PortfolioValuer(price_model, rent_model, yield_model)
+
+class PortfolioJobTracker:
+    """
+    Progress of portfolio valuations streamed by this process (poll with the X-Job-Id header value).
+    Under gunicorn each worker tracks its own jobs.
+    """
+    KEEP_FINISHED = 100
+
+    def __init__(self):
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, filename, total_bytes):
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            finished = [k for k, job in self.jobs.items() if job['status'] != 'running']
+            for k in finished[:max(0, len(finished) - self.KEEP_FINISHED)]:
+                del self.jobs[k]
+            self.jobs[job_id] = {
+                'job_id': job_id, 'filename': filename, 'status': 'running',
+                'rows_processed': 0, 'chunks_processed': 0,
+                'bytes_read': 0, 'total_bytes': total_bytes, 'progress_pct': 0.0,
+                'started_at': time.time(), 'finished_at': None, 'error': None
+            }
+        return job_id
+
+    def update(self, job_id, rows, bytes_read):
+        with self._lock:
+            job = self.jobs[job_id]
+            job['rows_processed'] = rows
+            job['chunks_processed'] += 1
+            job['bytes_read'] = bytes_read
+            if job['total_bytes']:
+                job['progress_pct'] = round(min(100.0, 100.0 * bytes_read / job['total_bytes']), 1)
+
+    def finish(self, job_id, error=None):
+        with self._lock:
+            job = self.jobs[job_id]
+            job['status'] = 'failed' if error else 'completed'
+            job['error'] = error
+            job['finished_at'] = time.time()
+            if not error:
+                job['progress_pct'] = 100.0
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+portfolio_jobs = PortfolioJobTracker()
+
+@app.route('/value_portfolio', methods=['POST'])
+def value_portfolio():
+    """
+    Values a portfolio CSV (multipart field 'file', one property per row with the /predict_price
+    fields) and streams back one result row per input row: price, rent (USD and local), gross
+    yield and method, or an error for rows with missing/invalid fields.
+    ?format=csv (default) or parquet  &chunk_size=<rows per batch, default PORTFOLIO_CHUNK_ROWS>
+    The upload is read, valued (one booster call per model per chunk) and written chunk by chunk,
+    so memory is bounded by the chunk size, not the portfolio size.
+    Progress: GET /value_portfolio/<X-Job-Id response header>.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    output_format = request.args.get('format', 'csv').lower()
+    if output_format not in ('csv', 'parquet'):
+        return jsonify({'error': "format must be 'csv' or 'parquet'"}), 400
+    if output_format == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Parquet output requires pyarrow'}), 400
+    try:
+        chunk_size = max(1, min(int(request.args.get('chunk_size', PORTFOLIO_CHUNK_ROWS)), 100000))
+    except ValueError:
+        return jsonify({'error': 'chunk_size must be an integer'}), 400
+
+    # Flask closes the request's files when the view returns, before the response is streamed,
+    # so the upload is spooled to a file owned by the response
+    upload = request.files['file']
+    fd, source_path = tempfile.mkstemp(prefix='portfolio-', suffix='.csv')
+    os.close(fd)
+    upload.save(source_path)
+    source = open(source_path, 'rb')
+
+    def cleanup():
+        source.close()
+        os.remove(source_path)
+
+    try:
+        reader = pd.read_csv(source, chunksize=chunk_size,
+                             dtype={'country': str, 'location': str, 'property_type': str})
+        first = next(reader, None)
+        if first is None:
+            raise ValueError('Portfolio has no rows')
+        check_columns(first.columns)
+    except ValueError as e:  # Includes pandas parser errors
+        cleanup()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        cleanup()
+        return jsonify({'error': str(e)}), 500
+
+    job_id = portfolio_jobs.start(upload.filename, os.path.getsize(source_path))
+
+    def valued_chunks():
+        rows = 0
+        for chunk in itertools.chain([first], reader):
+            valued = portfolio_valuer.value(chunk, first_row=rows)
+            rows += len(chunk)
+            portfolio_jobs.update(job_id, rows, source.tell())
+            yield valued
+
+    def generate():
+        writer = csv_stream if output_format == 'csv' else parquet_stream
+        try:
+            yield from writer(valued_chunks())
+        except Exception as e:
+            # Headers are already sent: record the failure and cut the response short
+            portfolio_jobs.finish(job_id, error=str(e))
+            print(f"Portfolio job {job_id} failed: {e}")
+            raise
+        portfolio_jobs.finish(job_id)
+        job = portfolio_jobs.get(job_id)
+        print(f"Portfolio job {job_id}: {job['rows_processed']} rows in {job['finished_at'] - job['started_at']:.2f}s")
+
+    base_name = os.path.splitext(os.path.basename(upload.filename or 'portfolio'))[0]
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/vnd.apache.parquet'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{base_name}_valued.{output_format}"'
+    response.headers['X-Job-Id'] = job_id
+    response.call_on_close(cleanup)
+    return response
+
+@app.route('/value_portfolio/<job_id>', methods=['GET'])
+def portfolio_progress(job_id):
+    job = portfolio_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
 
 # --- DYNAMIC DATA LAB ENDPOINTS ---
 
@@ -784,8 +1567,7 @@ def analyze_dataset():
         
         # Try Gemini first if API key provided
         if api_key:
-            gemini_analyst.api_key = api_key
-            strategy = gemini_analyst.analyze_schema(preview)
+            strategy = gemini_analyst.analyze_schema(preview, api_key=api_key)
             
             # If Gemini failed, use fallback
             if 'error' in strategy:
@@ -1089,6 +1871,7 @@ def integrate_country():
         
         # Register country
         dynamic_country_manager.add_country(country_name, currency, permanent_path, exchange_rate)
+        location_catalog.ensure_fresh()
         
         return jsonify({
             'message': f'{country_name} integrated successfully!',
@@ -1165,22 +1948,17 @@ def delete_country(country_name):
         if country_name in base_countries:
             return jsonify({'error': f'Cannot delete base country: {country_name}'}), 403
         
-        # Check if country exists
-        if country_name not in dynamic_country_manager.countries:
+        # Remove from manager (404 if it was never registered)
+        config = dynamic_country_manager.remove_country(country_name)
+        if config is None:
             return jsonify({'error': f'Country not found: {country_name}'}), 404
-        
-        # Get dataset path before deletion
-        config = dynamic_country_manager.countries[country_name]
         dataset_path = config['dataset_path']
         
         # Delete dataset file
         if os.path.exists(dataset_path):
             os.remove(dataset_path)
             print(f"Deleted dataset file: {dataset_path}")
-        
-        # Remove from manager
-        del dynamic_country_manager.countries[country_name]
-        dynamic_country_manager._save_config()
+        location_catalog.ensure_fresh()
         
         return jsonify({
             'message': f'{country_name} deleted successfully',
@@ -1192,6 +1970,53 @@ def delete_country(country_name):
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/builtin_models', methods=['GET'])
+def list_builtin_models():
+    """Active and published versions of the built-in price, rent and yield models."""
+    try:
+        return jsonify({
+            name: {
+                'active_version': model.model_version,
+                'current_version': model.registry.current_version(name),
+                'versions': model.registry.versions(name)
+            }
+            for name, model in BUILTIN_MODELS.items()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/builtin_models/reload', methods=['POST'])
+def reload_builtin_models_endpoint():
+    """
+    Switches this process to the current registry versions now (other workers follow
+    within MODEL_POLL_SECONDS). In-flight requests finish on the booster they started with.
+    """
+    try:
+        return jsonify({'active_versions': reload_builtin_models()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/builtin_models/activate', methods=['POST'])
+def activate_builtin_model():
+    """Points a built-in model at a published version (e.g. rollback). Body: {model, version}"""
+    try:
+        data = request.json or {}
+        model = BUILTIN_MODELS.get(data.get('model'))
+        if model is None:
+            return jsonify({'error': f"model must be one of {sorted(BUILTIN_MODELS)}"}), 400
+        try:
+            model.registry.activate(data['model'], data.get('version', ''))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 404
+        return jsonify({'model': data['model'], 'active_version': model.reload()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/data_watcher', methods=['GET'])
+def data_watcher_status():
+    """Watcher backend, pending rebuild stages and recent stage timings."""
+    return jsonify(data_watcher.status())
+
 @app.route('/list_saved_models', methods=['GET'])
 def list_saved_models():
     """Get list of all saved models with metadata."""
@@ -1216,13 +2041,10 @@ def list_saved_models():
 def delete_model(model_id):
     """Delete a saved model from memory and disk."""
     try:
-        # Check if model exists
-        if model_id not in model_manager.models:
+        # Delete from memory (404 if it was never there)
+        if not model_manager.remove_model(model_id):
             return jsonify({'error': f'Model not found: {model_id}'}), 404
         
-        # Delete from memory
-        del model_manager.models[model_id]
-        
         # Delete files from disk if they exist
         model_file = os.path.join(model_manager.model_dir, f"{model_id}.txt")
         meta_file = os.path.join(model_manager.model_dir, f"{model_id}_meta.json")
@@ -1248,5 +2070,6 @@ def delete_model(model_id):
 if __name__ == '__main__':
     # Train/Load models on startup
     startup()
+    start_watchers()
     port = int(os.environ.get('PORT', 5001))
     app.run(host='0.0.0.0', port=port)
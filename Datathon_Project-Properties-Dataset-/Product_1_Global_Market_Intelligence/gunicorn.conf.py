@@ -0,0 +1,68 @@
+"""
+Production serving for Product 1 (preforking).
+
+    # from the repository root (model files and datasets/ are resolved relative to it)
+    gunicorn -c Product_1_Global_Market_Intelligence/gunicorn.conf.py wsgi:app
+
+The app is imported once in the master (preload_app), which runs warm_up(): dataset cache,
+boosters, comparables index and location catalog. Workers are forked afterwards and share
+those pages copy-on-write, so N workers cost roughly one copy of the models plus per-worker
+request memory. The master then retrains any model whose training data changed since its
+registry version (startup()), still before forking. Poll GET /ready before routing traffic.
+
+Dataset changes are handled by the master alone: its data watcher rebuilds the dataset cache,
+catalog, comparables index, listings store and models once, then gracefully replaces the
+workers (as on SIGHUP), which fork from the rebuilt state and share it copy-on-write again.
+Workers never run rebuild stages; they only hot-swap model versions from the registry.
+"""
+import gc
+import multiprocessing
+import os
+import signal
+
+# LightGBM's OpenMP pool must not be started before fork; one thread per worker,
+# parallelism comes from the worker count instead.
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))  # >1 runs gthread workers; model loading and registries are thread-safe
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Recycle workers now and then; the copy-on-write shared pages are unaffected
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+
+def _replace_workers():
+    # Runs in the master after a rebuild: new workers fork from the refreshed state (preload_app
+    # keeps the loaded app across the reload), old ones finish their requests and exit
+    from api_server import reload_builtin_models
+    reload_builtin_models()
+    os.kill(os.getpid(), signal.SIGHUP)
+
+
+def when_ready(server):
+    from api_server import data_watcher, start_data_watcher, startup
+    # Same retrain check as a direct start, done once before any worker is forked
+    startup()
+    # The watcher thread lives in the master, which forks workers: forks wait for a running stage
+    data_watcher.hold_across_forks()
+    start_data_watcher(on_rebuilt=_replace_workers)
+    server.log.info(f"Master warmed up; forking {workers} workers")
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far into the permanent generation so the cyclic GC in the
+    # workers never touches (and therefore never copies) the shared model and dataset pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork: each worker polls the registry for model versions published
+    # or activated elsewhere (rebuilds themselves run in the master, see when_ready)
+    from api_server import start_model_watcher
+    start_model_watcher()
+    server.log.info(f"Worker {worker.pid} forked")
@@ -0,0 +1,2 @@
+"""WSGI entry point for gunicorn.conf.py. Importing api_server runs warm_up()."""
+from api_server import app
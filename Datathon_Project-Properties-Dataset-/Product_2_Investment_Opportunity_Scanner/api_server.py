@@ -1,13 +1,23 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import sys
 import os
+import time
+import threading
+import traceback
 import pandas as pd
 import numpy as np
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
-from models import YieldAnalyzer, GapScorer, MEICalculator
+from models import YieldAnalyzer, GapScorer, MEICalculator, HotspotFinder
 from data_loader import UnifiedDataLoader
+from singleflight import SingleFlight
+from pagination import ResultSet, decode_cursor, encode_cursor
+from data_watcher import DataWatcher, Stage
+from return_simulator import ReturnSimulator, DEFAULT_ASSUMPTIONS
+from market_similarity import MarketSimilarityIndex, market_features, FEATURES as SIMILARITY_FEATURES
+from market_segmentation import MarketSegmenter, SEGMENTS
+from approximate import ApproximateScanner
 
 app = Flask(__name__)
 
@@ -24,41 +34,417 @@ print("Initializing Analyzers...")
 yield_analyzer = YieldAnalyzer()
 gap_scorer = GapScorer()
 mei_calculator = MEICalculator()
+hotspot_finder = HotspotFinder()
 data_loader = UnifiedDataLoader()
+market_segmenter = MarketSegmenter()
+approximate_scanner = ApproximateScanner(data_loader, yield_analyzer.proxy_model)
+
+# --- RESPONSE BUILDERS (shared by the live path and the snapshot) ---
+# Output field -> (source column, kind[, round digits]); encoded column-wise, see response_encoder
+
+YIELD_FIELDS = [
+    ('location', 'location', 'raw'),
+    ('country', 'country', 'raw'),
+    ('median_sale_price_usd', 'sale', 'float0'),
+    ('median_rental_price_usd', 'rent', 'float0'),
+    ('annual_yield_pct', 'annual_yield_pct', 'float')
+]
+
+HOTSPOT_FIELDS = [
+    ('country', 'country', 'raw'),
+    ('location', 'location', 'raw'),
+    ('avg_price_per_sqm_usd', 'median', 'float'),
+    ('listings_count', 'count', 'int'),
+    ('tag', 'tag', 'raw')
+]
+
+GAP_FIELDS = [
+    ('country', 'country', 'raw'),
+    ('location', 'location', 'raw'),
+    ('gap_score', 'gap_score', 'float0'),
+    ('supply_count', 'supply', 'int'),
+    ('avg_price_usd', 'avg_price', 'float0')
+]
+
+MEI_FIELDS = [
+    ('country', 'country', 'raw'),
+    ('location', 'location', 'raw'),
+    ('mei_score', 'mei_score', 'float', 4),
+    ('search_volume_index', 'search_volume_index', 'float', 4),
+    ('interest_density', 'interest_density', 'float', 4),
+    ('median_price_per_sqm_usd', 'median_pps', 'float', 2),
+    ('supply_count', 'supply_count', 'int'),
+    ('interpretation', 'interpretation', 'raw')
+]
+
+def interval_fields(fields, intervals):
+    """fields plus <field>_ci_low/_ci_high for each (output field, source column) estimate (?approx=true)."""
+    return fields + [(f'{name}_ci_{bound}', f'{source}_ci_{bound}', 'floatn')
+                     for name, source in intervals for bound in ('low', 'high')]
+
+APPROX_YIELD_FIELDS = interval_fields(YIELD_FIELDS, [('annual_yield_pct', 'annual_yield_pct'), ('median_sale_price_usd', 'sale')])
+APPROX_HOTSPOT_FIELDS = interval_fields(HOTSPOT_FIELDS, [('avg_price_per_sqm_usd', 'median')])
+APPROX_GAP_FIELDS = interval_fields(GAP_FIELDS, [('gap_score', 'gap_score'), ('avg_price_usd', 'avg_price')])
+APPROX_MEI_FIELDS = interval_fields(MEI_FIELDS, [('mei_score', 'mei_score'), ('median_price_per_sqm_usd', 'median_pps')])
+
+LOCATION_LEVELS = UnifiedDataLoader.LOCATION_LEVELS
+
+def level_meta(meta, level):
+    """Rolled-up results say which level they are at; per-location responses are unchanged."""
+    return meta if level == 'location' else {**meta, 'level': level}
+
+def yields_result(yields, country_filter=None, level='location', fields=YIELD_FIELDS):
+    if yields is None or yields.empty:
+        return ResultSet.from_frame(level_meta({'insight': 'Scanning complete'}, level), None, fields)
+    return ResultSet.from_frame(level_meta({'insight': f'Investment Locations ({country_filter or "Global"})'}, level), yields, fields)
+
+def hotspots_result(location_stats, level='location', fields=HOTSPOT_FIELDS):
+    if not location_stats.empty:
+        location_stats = location_stats.assign(tag='Value Investment')
+    return ResultSet.from_frame(level_meta({'insight': 'Emerging Hotspots (Value Entry)'}, level), location_stats, fields)
+
+def gap_result(gaps, country_filter=None, level='location', fields=GAP_FIELDS):
+    return ResultSet.from_frame(level_meta({'insight': f'Market Gaps ({country_filter or "Global"})'}, level), gaps, fields)
+
+def mei_result(mei_results, country_filter=None, level='location', fields=MEI_FIELDS):
+    if mei_results.empty:
+        return ResultSet.from_frame(level_meta({'insight': 'MEI Analysis complete'}, level), None, fields)
+    return ResultSet.from_frame(level_meta({
+        'insight': f'Market Efficiency Index — MEI ({country_filter or "Global"})',
+        'formula': 'MEI = (Search_Volume_Index + Interest_Density) / Median_Price_Per_Sqm'
+    }, level), mei_results, fields)
+
+def filter_gaps(gaps, country_filter):
+    if country_filter and not gaps.empty:
+        gaps = gaps[gaps['country'].str.lower() == country_filter.lower()]
+    return gaps
+
+# --- LIVE COMPUTATION (used until the first snapshot is ready) ---
+
+# Concurrent identical live requests (same endpoint + country + level) share one computation
+live_flight = SingleFlight()
+
+def coalesced(endpoint, country_filter, level, compute, *args):
+    key = (endpoint, country_filter.lower() if country_filter else None, level)
+    return live_flight.do(key, compute, *args)
+
+def compute_yields(country_filter=None, level='location'):
+    return yields_result(yield_analyzer.analyze_market(country_filter, level), country_filter, level)
+
+def compute_hotspots(level='location'):
+    return hotspots_result(hotspot_finder.find_hotspots(level), level)
+
+def compute_gaps(country_filter=None, level='location'):
+    gaps = gap_scorer.analyze_gap(level)  # Returns DataFrame sorted by gap_score
+    return gap_result(filter_gaps(gaps, country_filter), country_filter, level)
+
+def compute_mei(country_filter=None, level='location'):
+    return mei_result(mei_calculator.calculate_mei(country_filter, level), country_filter, level)
+
+def compute_approximate(endpoint, country_filter=None, level='location'):
+    """
+    ?approx=true: the endpoint's result estimated from the stratified sample (src/approximate.py),
+    with confidence-interval columns and the sample size in the meta.
+    """
+    if endpoint == 'get_yields':
+        result = yields_result(approximate_scanner.yields(country_filter, level), country_filter, level, APPROX_YIELD_FIELDS)
+    elif endpoint == 'hotspots':
+        result = hotspots_result(approximate_scanner.hotspots(level), level, APPROX_HOTSPOT_FIELDS)
+    elif endpoint == 'gap_analysis':
+        result = gap_result(filter_gaps(approximate_scanner.gap(level), country_filter), country_filter, level, APPROX_GAP_FIELDS)
+    else:
+        result = mei_result(approximate_scanner.mei(country_filter, level), country_filter, level, APPROX_MEI_FIELDS)
+    meta = {**result.meta, 'approximate': True, **approximate_scanner.sample_info(level)}
+    return result.subset(range(len(result)), meta)
+
+def level_market_features(level='location', yields=None, mei=None):
+    """Per-market feature vectors (src/market_similarity.py) shared by the similarity index and segmentation."""
+    if yields is None:
+        yields = yield_analyzer.analyze_market(level=level)
+    if mei is None:
+        mei = mei_calculator.calculate_mei(level=level)
+    return market_features(data_loader.load_level_data(level), yields, mei)
+
+def build_similarity_index(level='location', features=None):
+    """Nearest-neighbour index over every market's feature vector."""
+    return MarketSimilarityIndex().build(level_market_features(level) if features is None else features)
+
+def build_segments(level='location', features=None):
+    """{'labels': {(country, location): segment}, 'profiles': per-segment DataFrame} (src/market_segmentation.py)."""
+    labels, profiles = market_segmenter.fit(level_market_features(level) if features is None else features)
+    return {
+        'labels': dict(zip(zip(labels['country'], labels['location']), labels['segment'])),
+        'profiles': profiles
+    }
+
+def segment_subset(result, labels, segment):
+    """The rows of a scanner ResultSet whose market is labelled `segment` (markets without a label are dropped)."""
+    columns = result.columns
+    indices = [i for i, market in enumerate(zip(columns['country'], columns['location'])) if labels.get(market) == segment]
+    return result.subset(indices, {**result.meta, 'segment': segment})
+
+class ScannerSnapshot:
+    """
+    Versioned, pre-serialized scanner outputs.
+    Every endpoint is computed once per data version (globally and per country, at every
+    location level) and stored as JSON bytes, so request latency no longer depends on dataset size.
+    A background thread builds the first snapshot and rebuilds when it ages out; data changes are
+    picked up by the data watcher (or by this thread's own version polling when the watcher is off).
+    """
+    def __init__(self, refresh_seconds=3600, poll_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self.poll_seconds = poll_seconds
+        self.version = None
+        self.built_at = None
+        self.build_seconds = None
+        self.payloads = {}  # (endpoint or '<endpoint>:approx', country_key or None, level) -> ResultSet
+        self.similarity = {}  # level -> MarketSimilarityIndex
+        self.segments = {}  # level -> build_segments() output
+        self.segment_payloads = {}  # (endpoint, country_key or None, level, segment) -> ResultSet, cut in build()
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.track_data_version = True  # Switched off when the data watcher drives rebuilds
+
+    def get(self, endpoint, country=None, level='location'):
+        """Pre-serialized ResultSet, or None if not in the snapshot (not built yet / unknown country)."""
+        return self.payloads.get((endpoint, country.lower() if country else None, level))
+
+    def get_segment(self, endpoint, country=None, level='location', segment=None):
+        """Snapshot ResultSet restricted to one segment (cut in build()), or None if not in the snapshot."""
+        return self.segment_payloads.get((endpoint, country.lower() if country else None, level, segment))
+
+    def is_stale(self, check_data_version=True):
+        if self.version is None:
+            return True
+        if check_data_version and self.version != data_loader.data_version():
+            return True
+        return (time.time() - self.built_at) > self.refresh_seconds
+
+    def build(self):
+        with self._build_lock:
+            start = time.time()
+            version = data_loader.data_version()
+            df = data_loader.load_unified_data()
+            if yield_analyzer.engine is not None:
+                yield_analyzer.engine.refresh()  # Sketch engine: re-ingests only the markets that changed
+            approximate_scanner.refresh()  # ?approx=true samples, likewise per changed market
+            countries = sorted(df['country'].dropna().unique().tolist()) if not df.empty else []
+
+            payloads = {}
+            similarity = {}
+            segments = {}
+
+            def store(endpoint, key, level, result):
+                result.version = version
+                payloads[(endpoint, key, level)] = result
+
+            for level in LOCATION_LEVELS:
+                yields = yield_analyzer.analyze_market(level=level)
+                gaps = gap_scorer.analyze_gap(level)
+                mei = mei_calculator.calculate_mei(level=level)
+                store('get_yields', None, level, yields_result(yields, None, level))
+                store('gap_analysis', None, level, gap_result(gaps, None, level))
+                store('mei_analysis', None, level, mei_result(mei, None, level))
+                store('hotspots', None, level, hotspots_result(hotspot_finder.find_hotspots(level), level))
+
+                for country in countries:
+                    key = country.lower()
+                    country_yields = yields[yields['country'].str.lower() == key] if yields is not None and not yields.empty else yields
+                    store('get_yields', key, level, yields_result(country_yields, country, level))
+                    store('gap_analysis', key, level, gap_result(filter_gaps(gaps, country), country, level))
+                    # MEI percentile cuts and labels are relative to the filtered market, so compute per country
+                    store('mei_analysis', key, level, mei_result(mei_calculator.calculate_mei(country, level), country, level))
+
+                # ?approx=true answers, from the samples refreshed above (stored as '<endpoint>:approx')
+                if approximate_scanner.sample(level) is not None:
+                    for endpoint in ('get_yields', 'gap_analysis', 'mei_analysis', 'hotspots'):
+                        for country in ([None] if endpoint == 'hotspots' else [None, *countries]):
+                            store(f'{endpoint}:approx', country.lower() if country else None, level,
+                                  compute_approximate(endpoint, country, level))
+
+                features = level_market_features(level, yields, mei)
+                similarity[level] = build_similarity_index(level, features)
+                segments[level] = build_segments(level, features)
+
+            # Every payload cut by every segment, so ?segment= requests only read the snapshot
+            segment_payloads = {
+                (endpoint, key, level, segment): segment_subset(result, segments[level]['labels'], segment)
+                for (endpoint, key, level), result in payloads.items() if level in segments
+                for segment in SEGMENTS
+            }
+
+            # Published together with the payloads they were cut from
+            self.payloads = payloads
+            self.similarity = similarity
+            self.segments = segments
+            self.segment_payloads = segment_payloads
+            self.version = version
+            self.built_at = time.time()
+            self.build_seconds = self.built_at - start
+            print(f"Scanner snapshot {version} built in {self.build_seconds:.2f}s ({len(payloads)} payloads)")
+
+    def start_background_refresh(self):
+        """Builds the first snapshot off the request path, then keeps it fresh."""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    if self.is_stale(check_data_version=self.track_data_version):
+                        self.build()
+                except Exception as e:
+                    print(f"Scanner snapshot refresh failed: {e}")
+                    traceback.print_exc()
+                self._stop.wait(self.poll_seconds)
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=loop, name='scanner-snapshot', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+scanner_snapshot = ScannerSnapshot(
+    refresh_seconds=int(os.environ.get('SCANNER_REFRESH_SECONDS', 3600)),
+    poll_seconds=int(os.environ.get('SCANNER_POLL_SECONDS', 30))
+)
+
+MAX_PAGE_SIZE = 1000
+
+def market_segments(level='location'):
+    """The snapshot's segment labels for this level, or a coalesced live segmentation until the first snapshot."""
+    segments = scanner_snapshot.segments.get(level)
+    if segments is None:
+        segments = coalesced('market_segments', None, level, build_segments, level)
+    return segments
+
+def scanner_result(endpoint, country_filter, compute, *args, level='location', segment=None, approx=False):
+    """
+    Snapshot ResultSet when available, otherwise a coalesced live computation.
+    segment: keep only markets with this market_segmentation label.
+    approx: the sample-based estimate with confidence intervals instead (see compute_approximate),
+        prebuilt in the snapshot like the exact results; the exact result until the samples exist.
+    """
+    if approx and approximate_scanner.sample(level) is not None:
+        endpoint, compute, args = f'{endpoint}:approx', compute_approximate, (endpoint, country_filter)
+    if segment:
+        result = scanner_snapshot.get_segment(endpoint, country_filter, level, segment)
+        if result is None:
+            full = coalesced(endpoint, country_filter, level, compute, *args, level)
+            result = segment_subset(full, market_segments(level)['labels'], segment)
+        return result
+    result = scanner_snapshot.get(endpoint, country_filter, level)
+    if result is None:
+        result = coalesced(endpoint, country_filter, level, compute, *args, level)
+    return result
+
+def request_level():
+    """The ?level= drill-down level (default 'location'); ValueError if unknown."""
+    level = request.args.get('level', 'location')
+    if level not in LOCATION_LEVELS:
+        raise ValueError(f"Unknown level '{level}'. Levels: {list(LOCATION_LEVELS)}")
+    return level
+
+def request_segment():
+    """The ?segment= archetype filter (None when absent); ValueError if unknown."""
+    segment = request.args.get('segment') or None
+    if segment is not None and segment not in SEGMENTS:
+        raise ValueError(f"Unknown segment '{segment}'. Segments: {list(SEGMENTS)}")
+    return segment
+
+def request_approx():
+    """?approx=true asks for the sample-based estimate with confidence intervals."""
+    return request.args.get('approx', 'false').lower() == 'true'
+
+def serve_result(result):
+    """
+    Shapes a ResultSet per the request query:
+    - no paging params: the full pre-serialized response (unchanged contract)
+    - ?limit=&sort=&cursor=: one page via top-k selection, with total and next_cursor
+      (sort=<field> ascending, sort=-<field> descending; the cursor carries its sort, an explicit
+      different ?sort= is a 400, as are a non-positive or non-integer limit)
+    - ?format=ndjson or Accept: application/x-ndjson: one JSON row per line, streamed
+    - ?format=columnar: {"columns": [...], "data": [[...], ...]} instead of row objects
+    """
+    version = getattr(result, 'version', None)
+    sort = request.args.get('sort') or None
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return jsonify({'error': f"Invalid limit '{request.args['limit']}': expected a positive integer"}), 400
+        limit = min(limit, MAX_PAGE_SIZE)
+    ndjson = request.args.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    orient = 'columnar' if request.args.get('format') == 'columnar' else 'records'
+
+    offset = 0
+    if cursor:
+        try:
+            offset, cursor_sort, cursor_version = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if sort and sort != cursor_sort:
+            return jsonify({'error': 'Cursor was issued for a different sort'}), 400
+        sort = cursor_sort
+        if version and cursor_version and cursor_version != version:
+            return jsonify({'error': 'Cursor expired: scanner data was refreshed, restart from the first page'}), 409
+
+    if not (sort or cursor or limit is not None or ndjson):
+        body = result.columnar_body() if orient == 'columnar' else result.body
+        response = Response(body, mimetype='application/json')
+    else:
+        try:
+            indices = result.select(sort, offset, limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if ndjson:
+            response = Response(result.ndjson(indices), mimetype='application/x-ndjson')
+        else:
+            end = offset + len(indices)
+            extra = {'total': len(result), 'sort': sort}
+            extra['next_cursor'] = encode_cursor(end, sort, version) if limit is not None and end < len(result) else None
+            response = Response(result.page_body(indices, extra, orient), mimetype='application/json')
+
+    if version:
+        response.headers['X-Snapshot-Version'] = version
+    return response
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy', 'product': 'Investment Opportunity Scanner'})
+    return jsonify({
+        'status': 'healthy',
+        'product': 'Investment Opportunity Scanner',
+        'snapshot_version': scanner_snapshot.version,
+        'snapshot_age_seconds': round(time.time() - scanner_snapshot.built_at, 1) if scanner_snapshot.built_at else None,
+        'deduplication': data_loader.dedup_report(),
+        # Live computations running right now (snapshot misses), each shared by all its concurrent callers
+        'live_computations': [{'endpoint': endpoint, 'country': country, 'level': level}
+                              for endpoint, country, level in live_flight.in_flight()]
+    })
 
 @app.route('/get_yields', methods=['GET'])
 def get_yields():
     """
     Returns high-yield locations. Optional ?country filter.
-    Returns ALL valid results so frontend can paginate.
+    ?level=city|province rolls locations up to their city/province (default: location).
+    ?segment=value-entry|high-yield|premium|thin-supply keeps one market archetype.
+    ?approx=true answers from a stratified sample, with 95% confidence intervals (flagged "approximate").
+    Returns ALL valid results unless paged with ?limit=&sort=&cursor= (see serve_result).
     """
+    try:
+        level = request_level()
+        segment = request_segment()
+        approx = request_approx()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         country_filter = request.args.get('country')
-        yields = yield_analyzer.analyze_market(country_filter)
-
-        if yields is None or yields.empty:
-            return jsonify({'insight': 'Scanning complete', 'data': []})
-
-        results = []
-        for _, row in yields.iterrows():
-            results.append({
-                'location': row['location'],
-                'country': row['country'],
-                'median_sale_price_usd': float(row['sale']) if pd.notna(row['sale']) else 0,
-                'median_rental_price_usd': float(row['rent']) if pd.notna(row['rent']) else 0,
-                'annual_yield_pct': float(row['annual_yield_pct'])
-            })
-
-        return jsonify({
-            'insight': f'Investment Locations ({country_filter or "Global"})',
-            'data': results
-        })
+        return serve_result(scanner_result('get_yields', country_filter, compute_yields, country_filter, level=level, segment=segment, approx=approx))
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -66,37 +452,18 @@ def get_yields():
 def hotspots():
     """
     Identifies emerging hotspots based on price-per-sqm analysis (undervalued areas).
+    ?level=city|province rolls locations up to their city/province (default: location).
+    ?segment= keeps one market archetype (see /market_segments).
+    ?approx=true for a sample-based estimate with confidence intervals.
     """
     try:
-        df = data_loader.load_unified_data()
-        sales = df[(df['transaction_type'] == 'sale') & (df['area_sqm'] > 0) & (df['price_usd'] > 0)].copy()
-        sales['price_per_sqm'] = sales['price_usd'] / sales['area_sqm']
-
-        # Filter outliers
-        sales = sales[sales['price_per_sqm'].between(
-            sales['price_per_sqm'].quantile(0.05),
-            sales['price_per_sqm'].quantile(0.95)
-        )]
-
-        # Group by location
-        location_stats = sales.groupby(['country', 'location'])['price_per_sqm'].agg(['count', 'median']).reset_index()
-        location_stats = location_stats[location_stats['count'] > 5]  # Min 5 listings
-
-        hotspots_list = []
-        for _, row in location_stats.sort_values('median').iterrows():
-            hotspots_list.append({
-                'country': row['country'],
-                'location': row['location'],
-                'avg_price_per_sqm_usd': float(row['median']),
-                'listings_count': int(row['count']),
-                'tag': 'Value Investment'
-            })
-
-        return jsonify({
-            'insight': 'Emerging Hotspots (Value Entry)',
-            'data': hotspots_list
-        })
-
+        level = request_level()
+        segment = request_segment()
+        approx = request_approx()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return serve_result(scanner_result('hotspots', None, compute_hotspots, level=level, segment=segment, approx=approx))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -104,32 +471,21 @@ def hotspots():
 def gap_analysis():
     """
     Identifies zones with High Gap Score. Optional ?country filter.
-    Returns ALL results so frontend can paginate.
+    ?level=city|province rolls thin locations up to their city/province (default: location).
+    ?segment= keeps one market archetype (see /market_segments).
+    ?approx=true for a sample-based estimate with confidence intervals.
+    Returns ALL results unless paged with ?limit=&sort=&cursor= (see serve_result).
     """
+    try:
+        level = request_level()
+        segment = request_segment()
+        approx = request_approx()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         country_filter = request.args.get('country')
-        gaps = gap_scorer.analyze_gap()  # Returns DataFrame sorted by gap_score
-
-        if country_filter:
-            gaps = gaps[gaps['country'].str.lower() == country_filter.lower()]
-
-        top_gaps = []
-        for i in range(len(gaps)):
-            row = gaps.iloc[i]
-            top_gaps.append({
-                'country': row['country'],
-                'location': row['location'],
-                'gap_score': float(row['gap_score']) if pd.notna(row['gap_score']) else 0,
-                'supply_count': int(row['supply']),
-                'avg_price_usd': float(row['avg_price']) if pd.notna(row['avg_price']) else 0
-            })
-
-        return jsonify({
-            'insight': f'Market Gaps ({country_filter or "Global"})',
-            'data': top_gaps
-        })
+        return serve_result(scanner_result('gap_analysis', country_filter, compute_gaps, country_filter, level=level, segment=segment, approx=approx))
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -145,38 +501,228 @@ def mei_analysis():
     - Interest Density    = normalized listing density (demand signal per area)
 
     Returns ranked zones where community interest outpaces listing prices.
-    Optional ?country filter.
+    Optional ?country filter; ?level=city|province for city/province rollups; ?segment= for one archetype.
+    ?approx=true for a sample-based estimate with confidence intervals.
     """
+    try:
+        level = request_level()
+        segment = request_segment()
+        approx = request_approx()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         country_filter = request.args.get('country')
-        mei_results = mei_calculator.calculate_mei(country_filter)
-
-        if mei_results.empty:
-            return jsonify({'insight': 'MEI Analysis complete', 'data': []})
-
-        results = []
-        for _, row in mei_results.iterrows():
-            results.append({
-                'country': row['country'],
-                'location': row['location'],
-                'mei_score': round(float(row['mei_score']), 4),
-                'search_volume_index': round(float(row['search_volume_index']), 4),
-                'interest_density': round(float(row['interest_density']), 4),
-                'median_price_per_sqm_usd': round(float(row['median_pps']), 2),
-                'supply_count': int(row['supply_count']),
-                'interpretation': row['interpretation']
-            })
+        return serve_result(scanner_result('mei_analysis', country_filter, compute_mei, country_filter, level=level, segment=segment, approx=approx))
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+return_simulator = ReturnSimulator()
+MAX_SIMULATION_PATHS = 1000000
+MAX_SIMULATION_LOCATIONS = 100
+
+def simulation_inputs(yields, country_filter=None, locations=None, limit=10):
+    """
+    (inputs, not_found) for the simulator from a yields ResultSet: the requested locations,
+    or the `limit` highest-yield locations (optionally within one country).
+    """
+    cols = yields.columns
+    rows = {
+        (country.lower(), location.lower()): (country, location, price, pct)
+        for country, location, price, pct in zip(cols['country'], cols['location'],
+                                                 cols['median_sale_price_usd'], cols['annual_yield_pct'])
+        if price and pct is not None
+    }
+    if locations:
+        wanted = [(str(l.get('country', '')).lower(), str(l.get('location', '')).lower()) for l in locations]
+        found = [rows[key] for key in wanted if key in rows]
+        not_found = [l for l, key in zip(locations, wanted) if key not in rows]
+    else:
+        candidates = [r for r in rows.values() if not country_filter or r[0].lower() == country_filter.lower()]
+        found = sorted(candidates, key=lambda r: -r[3])[:limit]
+        not_found = []
+    inputs = [{
+        'country': country, 'location': location,
+        'currency': data_loader.COUNTRY_CURRENCY.get(country, 'USD'),
+        'price_usd': float(price), 'gross_yield': float(pct) / 100
+    } for country, location, price, pct in found]
+    return inputs, not_found
+
+@app.route('/simulate_returns', methods=['POST'])
+def simulate_returns():
+    """
+    Monte Carlo IRR/ROI bands per location (src/return_simulator.py).
+    Input: {
+        'locations': [{'country': 'Vietnam', 'location': 'Quận 1, Hồ Chí Minh'}],  # optional
+        'country': 'Vietnam', 'limit': 10,   # otherwise: the top `limit` locations by yield
+        'paths': 100000, 'seed': 0,          # same seed -> same results
+        'assumptions': {'horizon_years': 10, 'vacancy_mean': 0.08, ...}  # overrides DEFAULT_ASSUMPTIONS
+    }
+    Each location starts from its median sale price and current yield (real or proxy).
+    """
+    data = request.json or {}
+    try:
+        paths = int(data.get('paths', 100000))
+        seed = int(data.get('seed', 0))
+        limit = int(data.get('limit', 10))
+        # null means "use the default" (for fx_vol that is the per-currency volatility)
+        assumptions = {k: float(v) for k, v in (data.get('assumptions') or {}).items() if v is not None}
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    unknown = sorted(set(assumptions) - set(DEFAULT_ASSUMPTIONS))
+    if unknown:
+        return jsonify({'error': f'Unknown assumptions: {unknown}', 'assumptions': DEFAULT_ASSUMPTIONS}), 400
+    if not 1 <= assumptions.get('horizon_years', 10) <= 50 or not 0 < assumptions.get('vacancy_mean', 0.08) < 1:
+        return jsonify({'error': 'horizon_years must be 1-50 and vacancy_mean between 0 and 1'}), 400
+    if not assumptions.get('vacancy_concentration', 20.0) > 0:
+        return jsonify({'error': 'vacancy_concentration must be positive'}), 400
+    negative = [k for k in ('rent_growth_vol', 'appreciation_vol', 'fx_vol') if k in assumptions and not assumptions[k] >= 0]
+    if negative:
+        return jsonify({'error': f'Volatilities must be zero or positive: {negative}'}), 400
+    if 'horizon_years' in assumptions:
+        assumptions['horizon_years'] = int(assumptions['horizon_years'])
+    paths = max(1000, min(paths, MAX_SIMULATION_PATHS))
+    limit = max(1, min(limit, MAX_SIMULATION_LOCATIONS))
 
+    try:
+        country_filter = data.get('country')
+        yields = scanner_result('get_yields', country_filter, compute_yields, country_filter)
+        inputs, not_found = simulation_inputs(yields, country_filter, (data.get('locations') or [])[:MAX_SIMULATION_LOCATIONS], limit)
+        start = time.time()
+        results = return_simulator.run(inputs, paths=paths, seed=seed, assumptions=assumptions)
+        for result, loc in zip(results, inputs):
+            result['currency_local'] = loc['currency']
+            result['median_sale_price_local'] = round(loc['price_usd'] / data_loader.exchange_rates.get(loc['currency'], 1.0), 0)
         return jsonify({
-            'insight': f'Market Efficiency Index — MEI ({country_filter or "Global"})',
-            'formula': 'MEI = (Search_Volume_Index + Interest_Density) / Median_Price_Per_Sqm',
+            'insight': 'Simulated investment returns (USD, unlevered)',
+            'paths': paths,
+            'seed': seed,
+            'assumptions': {**DEFAULT_ASSUMPTIONS, **assumptions},
+            'simulation_seconds': round(time.time() - start, 3),
+            'not_found': not_found,
             'data': results
         })
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+MAX_SIMILAR_MARKETS = 100
+
+def similarity_index(level='location'):
+    """The snapshot's index for this level, or a coalesced live build until the first snapshot is ready."""
+    index = scanner_snapshot.similarity.get(level)
+    if index is None:
+        index = coalesced('similar_markets', None, level, build_similarity_index, level)
+    return index
+
+def market_profile(index, row):
+    market = index.markets.iloc[row]
+    profile = {'country': market['country'], 'location': market['location'],
+               'median_price_per_sqm_usd': round(float(market['median_pps']), 2), 'supply_count': int(market['supply'])}
+    for feature in SIMILARITY_FEATURES:
+        if feature not in ('log_median_pps', 'log_supply'):
+            profile[feature] = None if pd.isna(market[feature]) else round(float(market[feature]), 4)
+    return profile
+
+@app.route('/similar_markets', methods=['GET'])
+def similar_markets():
+    """
+    Markets most similar to ?location= (optional ?country= to disambiguate) across all countries,
+    by price level, depth, yield, size mix and MEI components (src/market_similarity.py).
+    ?k= neighbours (default 10), ?other_countries=true to skip the market's own country,
+    ?level=city|province to compare city/province rollups.
+    """
+    try:
+        level = request_level()
+        k = max(1, min(int(request.args.get('k', 10)), MAX_SIMILAR_MARKETS))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    location = request.args.get('location')
+    if not location:
+        return jsonify({'error': 'Missing required parameter: location'}), 400
+    try:
+        index = similarity_index(level)
+        row = index.find(location, request.args.get('country'))
+        if row is None:
+            return jsonify({'error': f"Unknown market '{location}' (needs at least 5 priced sale listings)"}), 404
+        allowed = None
+        if request.args.get('other_countries', 'false').lower() == 'true':
+            allowed = (index.markets['country'] != index.markets['country'].iloc[row]).to_numpy()
+        rows, distances, examined = index.query(row, k, allowed)
+        data = []
+        for neighbour, distance in zip(rows.tolist(), distances.tolist()):
+            data.append({**market_profile(index, neighbour),
+                         'distance': round(distance, 4), 'similarity': round(1 / (1 + distance), 4)})
+        return jsonify(level_meta({
+            'insight': f"Markets similar to {index.markets['location'].iloc[row]}",
+            'market': market_profile(index, row),
+            'candidates_examined': examined,
+            'markets_indexed': len(index.markets),
+            'snapshot_version': scanner_snapshot.version,
+            'data': data
+        }, level))
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/market_segments', methods=['GET'])
+def market_segments_view():
+    """
+    Investment archetypes (value-entry, high-yield, premium, thin-supply) from mini-batch k-means
+    over the market feature vectors: each segment's size and median profile, and every market's label.
+    Optional ?country, ?segment and ?level=city|province.
+    """
+    try:
+        level = request_level()
+        segment = request_segment()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        segments = market_segments(level)
+        country_filter = request.args.get('country')
+        profiles = segments['profiles'].astype(object).where(segments['profiles'].notna(), None)
+        data = [
+            {'country': country, 'location': location, 'segment': label}
+            for (country, location), label in segments['labels'].items()
+            if (not segment or label == segment) and (not country_filter or country.lower() == country_filter.lower())
+        ]
+        return jsonify(level_meta({
+            'insight': f'Market Segments ({country_filter or "Global"})',
+            'segments': profiles.to_dict(orient='records'),
+            'snapshot_version': scanner_snapshot.version,
+            'data': data
+        }, level))
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+# Rebuild on dataset changes: debounced, and skipped when the source files' data version is unchanged
+data_watcher = DataWatcher(
+    paths=[data_loader.data_dir],
+    stages=[
+        Stage('dataset_cache', data_loader.load_unified_data, debounce_seconds=2, fingerprint=data_loader.data_version),
+        Stage('scanner_snapshot', scanner_snapshot.build, debounce_seconds=5, fingerprint=data_loader.data_version)
+    ],
+    poll_seconds=float(os.environ.get('DATA_POLL_SECONDS', 5))
+)
+
+def start_watchers():
+    """
+    Background snapshot refresher and data watcher for this process. Called at server startup,
+    not on import, so importing the module (tests, scripts) starts no threads and builds nothing;
+    until the first snapshot is ready, requests compute live.
+    """
+    scanner_snapshot.start_background_refresh()
+    if os.environ.get('DATA_WATCH', '1') != '0':
+        scanner_snapshot.track_data_version = False
+        data_watcher.start()
+
+@app.route('/data_watcher', methods=['GET'])
+def data_watcher_status():
+    """Watcher backend, pending rebuild stages and recent stage timings."""
+    return jsonify(data_watcher.status())
+
 if __name__ == '__main__':
+    start_watchers()
     port = int(os.environ.get('PORT', 5002))
     app.run(host='0.0.0.0', port=port)
@@ -28,7 +28,7 @@ interface ComparisonResult {
 }
 
 export default function MarketIntelligence() {
-    const [locationMap, setLocationMap] = useState<Record<string, string[]>>({});
+    const [locationOptions, setLocationOptions] = useState<string[]>([]);
     const [countries, setCountries] = useState<string[]>([]);
 
     // Form State
@@ -47,30 +47,46 @@ export default function MarketIntelligence() {
     const [error, setError] = useState("");
 
     useEffect(() => {
-        fetch(`${API_PRODUCT1}/locations`)
+        fetch(`${API_PRODUCT1}/countries`)
             .then(res => res.json())
             .then(data => {
-                setLocationMap(data);
-                const countriesList = Object.keys(data).sort();
+                const countriesList = (data.countries || []).map((c: { name: string }) => c.name).sort();
                 setCountries(countriesList);
                 if (countriesList.length > 0) {
                     setCountry(countriesList[0]);
                 }
             })
-            .catch(err => console.error("Failed to load locations:", err));
+            .catch(err => console.error("Failed to load countries:", err));
     }, []);
 
-    // Update location when country changes
+    // Reset the filter when country changes
     useEffect(() => {
-        if (country && locationMap[country]) {
-            setLocationSearch("");
-            setLocation(locationMap[country][0] || "");
-        }
-    }, [country, locationMap]);
+        setLocationSearch("");
+        setLocation("");
+    }, [country]);
 
-    const filteredLocations = (locationMap[country] || []).filter(loc =>
-        loc.toLowerCase().includes(locationSearch.toLowerCase())
-    );
+    // Server-side autocomplete (debounced) instead of downloading every location
+    useEffect(() => {
+        if (!country) return;
+        const controller = new AbortController();
+        const timer = setTimeout(() => {
+            const params = new URLSearchParams({ q: locationSearch, country, limit: "50" });
+            fetch(`${API_PRODUCT1}/locations/search?${params}`, { signal: controller.signal })
+                .then(res => res.json())
+                .then(data => {
+                    const locs: string[] = (data.results || []).map((r: { location: string }) => r.location);
+                    setLocationOptions(locs);
+                    setLocation(current => (current && locs.includes(current)) ? current : (locs[0] || ""));
+                })
+                .catch(err => {
+                    if (err.name !== "AbortError") console.error("Failed to search locations:", err);
+                });
+        }, 150);
+        return () => {
+            clearTimeout(timer);
+            controller.abort();
+        };
+    }, [country, locationSearch]);
 
     const handleSubmit = async (e: React.FormEvent) => {
         e.preventDefault();
@@ -185,7 +201,7 @@ export default function MarketIntelligence() {
                                         value={location} onChange={e => setLocation(e.target.value)}
                                     >
                                         <option value="" disabled>Select location...</option>
-                                        {filteredLocations.map(loc => <option key={loc} value={loc}>{loc}</option>)}
+                                        {locationOptions.map(loc => <option key={loc} value={loc}>{loc}</option>)}
                                     </select>
                                 </div>
                             </div>
@@ -0,0 +1,172 @@
+import os
+import threading
+
+try:
+    import duckdb
+except ImportError:  # Optional: the pandas implementations are used without it
+    duckdb = None
+
+from quantile_sketch import SketchEngine
+
+
+class DuckDBEngine:
+    """
+    Runs the scanner aggregations (gap, hotspots, yields, MEI) as SQL over the unified
+    listings frame with an in-process DuckDB: columnar, multi-threaded, no intermediate
+    pandas frames, and spilling to disk when DUCKDB_MEMORY_LIMIT is exceeded.
+
+    Only the row-level scan and group aggregates run here; the small per-location results go
+    back through the same pandas code as the default engine, so both return identical frames.
+    DuckDB's median/quantile_cont use the same linear interpolation as pandas and skip NaN.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.con = duckdb.connect(database=':memory:')
+        if os.environ.get('DUCKDB_THREADS'):
+            self.con.execute(f"SET threads = {int(os.environ['DUCKDB_THREADS'])}")
+        if os.environ.get('DUCKDB_MEMORY_LIMIT'):
+            self.con.execute("SET memory_limit = ?", [os.environ['DUCKDB_MEMORY_LIMIT']])
+        if os.environ.get('DUCKDB_TEMP_DIRECTORY'):
+            self.con.execute("SET temp_directory = ?", [os.environ['DUCKDB_TEMP_DIRECTORY']])
+
+    def refresh(self):
+        """Nothing to precompute: every query scans the current frame."""
+        return 0
+
+    def query(self, sql, params=None, level='location'):
+        """
+        Runs sql with the current unified frame registered as `listings` (scanned in place, not copied).
+        level: a UnifiedDataLoader.LOCATION_LEVELS rollup, whose `location` column is the city/province.
+        """
+        listings = self.loader.load_level_data(level)
+        cursor = self.con.cursor()  # One cursor per call: connections are not shared across threads
+        try:
+            cursor.register('listings', listings)
+            return cursor.execute(sql, params or []).df()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _country_clause(country_filter):
+        if country_filter:
+            return "AND lower(country) = ?", [country_filter.lower()]
+        return "", []
+
+    def gap_stats(self, level='location'):
+        """Per-location sale stats for GapScorer (locations with >= 5 valid listings), in groupby order."""
+        return self.query("""
+            SELECT country, location,
+                   count(*) AS supply,
+                   median(price_usd) AS median_price,
+                   median(price_usd / area_sqm) AS median_pps
+            FROM listings
+            WHERE transaction_type = 'sale' AND price_usd > 0 AND area_sqm > 0
+              AND country IS NOT NULL AND location IS NOT NULL
+            GROUP BY country, location
+            HAVING count(*) >= 5
+            ORDER BY country, location
+        """, level=level)
+
+    def hotspot_stats(self, level='location'):
+        """Price-per-sqm count/median per location after the 5-95% outlier cut, in groupby order."""
+        return self.query("""
+            WITH sales AS (
+                SELECT country, location, price_usd / area_sqm AS price_per_sqm
+                FROM listings
+                WHERE transaction_type = 'sale' AND area_sqm > 0 AND price_usd > 0
+            ), bounds AS (
+                SELECT quantile_cont(price_per_sqm, 0.05) AS low, quantile_cont(price_per_sqm, 0.95) AS high
+                FROM sales
+            )
+            SELECT country, location, count(*) AS count, median(price_per_sqm) AS median
+            FROM sales, bounds
+            WHERE price_per_sqm BETWEEN low AND high
+              AND country IS NOT NULL AND location IS NOT NULL
+            GROUP BY country, location
+            ORDER BY country, location
+        """, level=level)
+
+    def yield_medians(self, country_filter=None, level='location'):
+        """Long-form median price per (country, location, transaction_type)."""
+        clause, params = self._country_clause(country_filter)
+        return self.query(f"""
+            SELECT country, location, transaction_type, median(price_usd) AS price_usd
+            FROM listings
+            WHERE country IS NOT NULL AND location IS NOT NULL AND transaction_type IS NOT NULL {clause}
+            GROUP BY country, location, transaction_type
+            ORDER BY country, location, transaction_type
+        """, params, level)
+
+    def location_feature_medians(self, country_filter=None, level='location'):
+        """Median area/bedrooms/bathrooms per location (all transaction types)."""
+        clause, params = self._country_clause(country_filter)
+        return self.query(f"""
+            SELECT country, location,
+                   median(area_sqm) AS area_sqm, median(bedrooms) AS bedrooms, median(bathrooms) AS bathrooms
+            FROM listings
+            WHERE country IS NOT NULL AND location IS NOT NULL {clause}
+            GROUP BY country, location
+            ORDER BY country, location
+        """, params, level)
+
+    def mei_stats(self, country_filter=None, level='location'):
+        """
+        MEI inputs after the 5-95% price-per-sqm cut: per-location supply and median price/sqm,
+        and per-country listing totals and distinct location counts.
+        """
+        clause, params = self._country_clause(country_filter)
+        sales_cte = f"""
+            WITH sales AS (
+                SELECT country, location, price_usd, price_usd / area_sqm AS price_per_sqm
+                FROM listings
+                WHERE transaction_type = 'sale' AND price_usd > 0 AND area_sqm > 0 {clause}
+            ), bounds AS (
+                SELECT quantile_cont(price_per_sqm, 0.05) AS low, quantile_cont(price_per_sqm, 0.95) AS high
+                FROM sales
+            ), kept AS (
+                SELECT sales.* FROM sales, bounds WHERE price_per_sqm BETWEEN low AND high
+            )
+        """
+        locations = self.query(sales_cte + """
+            SELECT country, location, count(price_usd) AS supply_count, median(price_per_sqm) AS median_pps
+            FROM kept
+            WHERE country IS NOT NULL AND location IS NOT NULL
+            GROUP BY country, location
+            ORDER BY country, location
+        """, params, level)
+        countries = self.query(sales_cte + """
+            SELECT country, count(*) AS country_total, count(DISTINCT location) AS location_count
+            FROM kept
+            WHERE country IS NOT NULL
+            GROUP BY country
+            ORDER BY country
+        """, params, level)
+        return locations, countries
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def analytics_engine(loader):
+    """
+    The engine selected for this deployment by ANALYTICS_ENGINE ('pandas', the default, 'duckdb'
+    or 'sketch'). Returns a DuckDBEngine or SketchEngine, or None for the pandas implementations.
+    """
+    global _engine
+    choice = os.environ.get('ANALYTICS_ENGINE', 'pandas').lower()
+    if choice == 'sketch':
+        with _engine_lock:
+            if _engine is None:
+                _engine = SketchEngine(loader)
+            return _engine
+    if choice != 'duckdb':
+        return None
+    if duckdb is None:
+        print("ANALYTICS_ENGINE=duckdb but duckdb is not installed; using pandas.")
+        return None
+    with _engine_lock:
+        if _engine is None:
+            _engine = DuckDBEngine(loader)
+        return _engine
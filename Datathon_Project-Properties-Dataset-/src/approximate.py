@@ -0,0 +1,364 @@
+import os
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+from scipy.stats import binom
+
+from models import GapScorer, MEICalculator
+
+STRATUM = ['country', 'location', 'transaction_type']
+SAMPLE_COLUMNS = STRATUM + ['price_usd', 'area_sqm', 'bedrooms', 'bathrooms']
+CONFIDENCE = 0.95
+
+
+def _strata(frame):
+    """(stratum code per row, stratum tuples with None for missing parts, rows per stratum)."""
+    grouped = frame.groupby(STRATUM, sort=False, dropna=False)
+    sizes = grouped.size()
+    keys = [tuple(None if pd.isna(part) else part for part in key) for key in sizes.index]
+    return grouped.ngroup().to_numpy(), keys, sizes.to_numpy()
+
+
+class StratifiedSample:
+    """
+    Up to `per_stratum` listings per (country, location, transaction_type), kept as a bottom-k
+    sample: every listing gets a random priority and each stratum keeps its lowest priorities.
+    update() folds in a batch and keeps exactly the rows a single pass over all batches would,
+    so the sample is maintained chunk by chunk at ingestion. Stratum sizes are counted in full,
+    giving each sampled row a weight of stratum size / stratum sample size.
+    """
+
+    def __init__(self, per_stratum=100, seed=0):
+        self.per_stratum = per_stratum
+        self._rng = np.random.default_rng(seed)
+        self.rows = None
+        self.totals = {}  # stratum tuple -> listings seen
+        self.population = 0
+        self._weighted = None
+
+    def _bottom_k(self, frame, codes):
+        """Rows of frame with one of the per_stratum lowest priorities of their stratum."""
+        order = np.lexsort((frame['_priority'].to_numpy(), codes))
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        return frame.iloc[np.sort(order[rank < self.per_stratum])]
+
+    def update(self, frame):
+        if frame.empty:
+            return self
+        codes, keys, sizes = _strata(frame)
+        for key, size in zip(keys, sizes):
+            self.totals[key] = self.totals.get(key, 0) + int(size)
+        batch = self._bottom_k(frame[SAMPLE_COLUMNS].assign(_priority=self._rng.random(len(frame))), codes)
+        if self.rows is not None:
+            combined = pd.concat([self.rows, batch], ignore_index=True)
+            batch = self._bottom_k(combined, _strata(combined)[0])
+        self.rows = batch.reset_index(drop=True)
+        self.population += len(frame)
+        self._weighted = None
+        return self
+
+    @classmethod
+    def combine(cls, samples, per_stratum=100):
+        """One sample made of samples over disjoint strata (e.g. one per market)."""
+        combined = cls(per_stratum)
+        parts = [sample.rows for sample in samples if sample.rows is not None]
+        combined.rows = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=SAMPLE_COLUMNS + ['_priority'])
+        for sample in samples:
+            combined.totals.update(sample.totals)
+            combined.population += sample.population
+        return combined
+
+    def weighted(self):
+        """The sampled rows with their `weight` (listings each one stands for)."""
+        if self._weighted is None:
+            rows = self.rows.drop(columns='_priority')
+            codes, keys, sizes = _strata(rows)
+            weights = np.array([self.totals[key] for key in keys], dtype=float) / sizes
+            self._weighted = rows.assign(weight=weights[codes])
+        return self._weighted
+
+
+def weighted_quantiles(values, weights, qs):
+    """Quantiles of weighted values (each weight read as that many copies, linear interpolation)."""
+    order = np.argsort(values, kind='stable')
+    values, weights = np.asarray(values, dtype=float)[order], np.asarray(weights, dtype=float)[order]
+    if not len(values):
+        return np.full(len(qs), np.nan)
+    positions = np.cumsum(weights) - weights / 2  # Mid-point rank of each item
+    return np.interp(np.asarray(qs) * weights.sum(), positions, values)
+
+
+def weighted_group_medians(values, weights, codes, n_groups):
+    """Weighted median of the non-missing values of each group code (NaN for empty groups)."""
+    known = ~np.isnan(values)
+    values, weights, codes = values[known], weights[known], codes[known]
+    order = np.lexsort((values, codes))
+    values, weights, codes = values[order], weights[order], codes[order]
+    medians = np.full(n_groups, np.nan)
+    if not len(values):
+        return medians
+    cumulative = np.cumsum(weights)
+    group_end = np.cumsum(np.bincount(codes, weights=weights, minlength=n_groups))
+    group_start = group_end - np.bincount(codes, weights=weights, minlength=n_groups)
+    present = np.unique(codes)
+    # First value whose running weight reaches half of its group's weight
+    half = group_start[present] + (group_end[present] - group_start[present]) / 2
+    medians[present] = values[np.minimum(np.searchsorted(cumulative, half - 1e-9), len(values) - 1)]
+    return medians
+
+
+class MedianBootstrap:
+    """
+    Percentile-bootstrap intervals for the median of each group of sampled values.
+    The bootstrap distribution of a resampled median is known in closed form: with the group's
+    values sorted x1 <= ... <= xs, P(median* <= xj) = P(Binomial(s, j/s) >= ceil(s/2)). So the
+    intervals are those of an infinite number of resamples, at the cost of one pass over the
+    sample; replicates() draws from the same distributions when a statistic combines medians.
+    """
+
+    def __init__(self, values, groups):
+        """values: 1-D array; groups: integer group code per value (0..n_groups-1)."""
+        order = np.lexsort((values, groups))
+        self.values = np.asarray(values, dtype=float)[order]
+        codes = np.asarray(groups)[order]
+        self.n_groups = int(codes.max()) + 1 if len(codes) else 0
+        sizes = np.bincount(codes, minlength=self.n_groups)
+        starts = np.r_[0, np.cumsum(sizes)[:-1]]
+        rank = np.arange(len(codes)) - starts[codes] + 1
+        size = sizes[codes]
+        cdf = binom.sf((size + 1) // 2 - 1, size, rank / size)
+        cdf[rank == size] = 1.0
+        self._keys = codes * 2.0 + cdf  # Increasing across groups, cdf in [0, 1] within one
+
+    def _pick(self, group, u):
+        return self.values[np.searchsorted(self._keys, group * 2.0 + u)]
+
+    def interval(self, confidence=CONFIDENCE):
+        """(low, high) arrays per group."""
+        groups = np.arange(self.n_groups)
+        alpha = (1 - confidence) / 2
+        return self._pick(groups, alpha), self._pick(groups, 1 - alpha)
+
+    def replicates(self, draws, rng):
+        """(draws, n_groups) bootstrap medians."""
+        groups = np.arange(self.n_groups)
+        return self._pick(groups[None, :], rng.random((draws, self.n_groups)))
+
+
+class ApproximateScanner:
+    """
+    Scanner results (gap, hotspots, yields, MEI) estimated from a StratifiedSample per location
+    level, with CONFIDENCE bootstrap intervals for the medians behind every score. Counts are
+    weighted estimates (exact for strata smaller than the sample size). Scores use the same
+    GapScorer / MEICalculator / yield model logic as the exact path.
+    refresh(), run by the ingestion path when the data changes, samples each market (country)
+    separately in INGEST_CHUNK_ROWS batches and resamples only the markets whose source files
+    changed; requests only read the latest samples.
+    """
+
+    def __init__(self, loader, yield_model, per_stratum=None, draws=1000, seed=0, chunk_rows=None):
+        self.loader = loader
+        self.yield_model = yield_model
+        self.per_stratum = per_stratum or int(os.environ.get('APPROX_SAMPLE_PER_LOCATION', 100))
+        self.draws = draws
+        self.seed = seed
+        self.chunk_rows = chunk_rows or int(os.environ.get('INGEST_CHUNK_ROWS', 500000))
+        self._samples = (None, {})  # (data_version, {level: StratifiedSample})
+        self._markets = {}  # (level, country) -> (its source files' fingerprint, StratifiedSample)
+        self._lock = threading.Lock()
+
+    def _ingest(self, frame, country):
+        # Seeded per market, so a market's sample does not depend on the other markets
+        sample = StratifiedSample(self.per_stratum, [self.seed, zlib.crc32(str(country).encode())])
+        for begin in range(0, len(frame), self.chunk_rows):
+            sample.update(frame.iloc[begin:begin + self.chunk_rows])
+        return sample
+
+    def refresh(self):
+        """Brings the samples up to the current data version (every level). Returns the number of market samples rebuilt."""
+        with self._lock:
+            version = self.loader.data_version()
+            if self._samples[0] == version:
+                return 0
+            stamps = self.loader.market_versions()
+            markets, samples, changed = {}, {}, 0
+            for level in self.loader.LOCATION_LEVELS:
+                frame = self.loader.load_level_data(level)
+                countries = frame['country'].to_numpy() if not frame.empty else np.empty(0, dtype=object)
+                parts = []
+                for country in pd.unique(countries):
+                    # Rows without a known market are resampled on every data change
+                    key = None if pd.isna(country) else country
+                    stamp = version if key is None else stamps.get(key, version)
+                    market = self._markets.get((level, key))
+                    if market is None or market[0] != stamp:
+                        market = (stamp, self._ingest(frame[pd.isna(countries) if key is None else countries == country], key))
+                        changed += 1
+                    markets[(level, key)] = market
+                    parts.append(market[1])
+                sample = StratifiedSample.combine(parts, self.per_stratum)
+                sample.weighted()  # Cached now, so requests never fill it
+                samples[level] = sample
+            self._markets = markets
+            self._samples = (version, samples)
+            print(f"Approximate samples refreshed for data version {version}: {changed} market samples rebuilt")
+            return changed
+
+    def sample(self, level='location'):
+        """The latest sample for a level, or None until refresh() has built one."""
+        return self._samples[1].get(level)
+
+    def sample_info(self, level='location'):
+        sample = self.sample(level)
+        return {'sample_rows': len(sample.rows), 'population_rows': int(sample.population),
+                'sample_per_location': self.per_stratum, 'confidence': CONFIDENCE}
+
+    def _sales(self, level, country_filter=None):
+        rows = self.sample(level).weighted()
+        if country_filter:
+            rows = rows[rows['country'].str.lower() == country_filter.lower()]
+        sales = rows[(rows['transaction_type'] == 'sale') & (rows['price_usd'] > 0) & (rows['area_sqm'] > 0)]
+        return sales.assign(price_per_sqm=sales['price_usd'] / sales['area_sqm'])
+
+    @staticmethod
+    def _located(frame):
+        return frame[frame['country'].notna() & frame['location'].notna()]
+
+    def gap(self, level='location'):
+        sales = self._located(self._sales(level))
+        if sales.empty:
+            return pd.DataFrame()
+        codes, markets = pd.MultiIndex.from_frame(sales[['country', 'location']]).factorize()
+        grouped = sales.groupby(codes)
+        supply = grouped['weight'].sum().round().astype(int).to_numpy()
+        median_price = grouped['price_usd'].median().to_numpy()
+        median_pps = grouped['price_per_sqm'].median().to_numpy()
+        pps_low, pps_high = MedianBootstrap(sales['price_per_sqm'].to_numpy(), codes).interval()
+        price_low, price_high = MedianBootstrap(sales['price_usd'].to_numpy(), codes).interval()
+
+        results = []
+        for i, (country, loc) in enumerate(markets):
+            clean_loc = str(loc).strip().lower()
+            if supply[i] < 5 or clean_loc == 'unknown' or clean_loc == '':
+                continue
+            row = GapScorer._gap_row(country, loc, median_price[i], median_pps[i], int(supply[i]))
+            # Gap score falls as price/sqm rises: the interval bounds swap
+            row['gap_score_ci_low'] = GapScorer._gap_row(country, loc, 0, pps_high[i], int(supply[i]))['gap_score']
+            row['gap_score_ci_high'] = GapScorer._gap_row(country, loc, 0, pps_low[i], int(supply[i]))['gap_score']
+            row['avg_price_ci_low'], row['avg_price_ci_high'] = price_low[i], price_high[i]
+            results.append(row)
+        if not results:
+            return pd.DataFrame()
+        return pd.DataFrame(results).sort_values('gap_score', ascending=False)
+
+    def _cut(self, sales):
+        """Sales within the weighted 5th-95th price/sqm percentiles."""
+        low, high = weighted_quantiles(sales['price_per_sqm'], sales['weight'], [0.05, 0.95])
+        return sales[sales['price_per_sqm'].between(low, high)]
+
+    def hotspots(self, level='location'):
+        sales = self._sales(level)
+        if sales.empty:
+            return pd.DataFrame()
+        kept = self._located(self._cut(sales))
+        codes, markets = pd.MultiIndex.from_frame(kept[['country', 'location']]).factorize()
+        grouped = kept.groupby(codes)
+        low, high = MedianBootstrap(kept['price_per_sqm'].to_numpy(), codes).interval()
+        stats = pd.DataFrame({
+            'country': markets.get_level_values(0), 'location': markets.get_level_values(1),
+            'count': grouped['weight'].sum().round().astype(int).to_numpy(),
+            'median': grouped['price_per_sqm'].median().to_numpy(),
+            'median_ci_low': low, 'median_ci_high': high
+        })
+        stats = stats[stats['count'] > 5]  # Min 5 listings
+        return stats.sort_values('median')
+
+    def mei(self, country_filter=None, level='location'):
+        sales = self._sales(level, country_filter)
+        if sales.empty:
+            return pd.DataFrame()
+        kept = self._cut(sales)
+        located = self._located(kept)
+        codes, markets = pd.MultiIndex.from_frame(located[['country', 'location']]).factorize()
+        grouped = located.groupby(codes)
+        pps_low, pps_high = MedianBootstrap(located['price_per_sqm'].to_numpy(), codes).interval()
+        location_stats = pd.DataFrame({
+            'country': markets.get_level_values(0), 'location': markets.get_level_values(1),
+            'supply_count': grouped['weight'].sum().round().astype(int).to_numpy(),
+            'median_pps': grouped['price_per_sqm'].median().to_numpy(),
+            'median_pps_ci_low': pps_low, 'median_pps_ci_high': pps_high
+        })
+        location_stats = location_stats[location_stats['supply_count'] >= 5]
+        if location_stats.empty:
+            return pd.DataFrame()
+        country_total = kept.groupby('country')['weight'].sum().round()
+        country_locations = kept.groupby('country')['location'].nunique()
+        avg_per_loc = country_total / country_locations.clip(lower=1)
+        location_stats['country_avg_per_loc'] = location_stats['country'].map(avg_per_loc).to_numpy()
+
+        base = location_stats.drop(columns=['median_pps_ci_low', 'median_pps_ci_high'])
+        result = MEICalculator._mei_scores(base.copy())
+        # MEI falls as price/sqm rises: score at the upper price bound is the lower MEI bound
+        for bound, pps in (('mei_score_ci_low', 'median_pps_ci_high'), ('mei_score_ci_high', 'median_pps_ci_low')):
+            scores = MEICalculator._mei_scores(base.assign(median_pps=location_stats[pps].to_numpy()))
+            result = result.merge(scores[['country', 'location', 'mei_score']].rename(columns={'mei_score': bound}),
+                                  on=['country', 'location'], how='left')
+        bounds = location_stats[['country', 'location', 'median_pps_ci_low', 'median_pps_ci_high']]
+        return result.merge(bounds, on=['country', 'location'], how='left')
+
+    def yields(self, country_filter=None, level='location'):
+        rows = self._located(self.sample(level).weighted())
+        if country_filter:
+            rows = rows[rows['country'].str.lower() == country_filter.lower()]
+        rows = rows[rows['transaction_type'].notna()]
+        if rows.empty:
+            return pd.DataFrame()
+        market_codes, markets = pd.MultiIndex.from_frame(rows[['country', 'location']]).factorize()
+        summary = pd.DataFrame({'country': markets.get_level_values(0), 'location': markets.get_level_values(1)})
+        summary['annual_yield_pct_ci_low'] = summary['annual_yield_pct_ci_high'] = np.nan
+        rng = np.random.default_rng(self.seed)
+        replicates = {}
+        for kind in ('sale', 'rent'):
+            priced = (rows['transaction_type'] == kind).to_numpy() & rows['price_usd'].notna().to_numpy()
+            codes, present = pd.factorize(market_codes[priced])
+            values = rows['price_usd'].to_numpy()[priced]
+            bootstrap = MedianBootstrap(values, codes)
+            low, high = bootstrap.interval()
+            summary[kind] = pd.Series(pd.Series(values).groupby(codes).median().to_numpy(), index=present)
+            summary[f'{kind}_ci_low'] = pd.Series(low, index=present)
+            summary[f'{kind}_ci_high'] = pd.Series(high, index=present)
+            reps = np.full((self.draws, len(summary)), np.nan)
+            reps[:, present] = bootstrap.replicates(self.draws, rng)
+            replicates[kind] = reps
+
+        # 1. REAL yield where both medians exist: percentile interval of the bootstrapped ratio
+        real = (summary['rent'].notna() & summary['sale'].notna()).to_numpy()
+        summary['annual_yield_pct'] = summary['rent'] * 12 / summary['sale'] * 100
+        ratio = replicates['rent'][:, real] * 12 / replicates['sale'][:, real] * 100
+        alpha = (1 - CONFIDENCE) / 2 * 100
+        summary.loc[real, 'annual_yield_pct_ci_low'] = np.percentile(ratio, alpha, axis=0)
+        summary.loc[real, 'annual_yield_pct_ci_high'] = np.percentile(ratio, 100 - alpha, axis=0)
+
+        # 2. PROXY yield where only sales exist: the model at the sale median and its interval bounds
+        proxy = np.flatnonzero(~real & summary['sale'].notna().to_numpy())
+        if len(proxy):
+            in_proxy = np.isin(market_codes, proxy)
+            features = pd.DataFrame({
+                f: weighted_group_medians(rows[f].to_numpy(dtype=float)[in_proxy], rows['weight'].to_numpy()[in_proxy],
+                                          market_codes[in_proxy], len(summary))[proxy]
+                for f in ('area_sqm', 'bedrooms', 'bathrooms')
+            })
+            estimates = [self.yield_model.predict_yield_batch(features, summary[column].to_numpy()[proxy]) * 100
+                         for column in ('sale', 'sale_ci_low', 'sale_ci_high')]
+            summary.loc[proxy, 'annual_yield_pct'] = estimates[0]
+            summary.loc[proxy, 'annual_yield_pct_ci_low'] = np.min(estimates, axis=0)
+            summary.loc[proxy, 'annual_yield_pct_ci_high'] = np.max(estimates, axis=0)
+
+        summary['annual_yield_pct'] = summary['annual_yield_pct'].fillna(5.0)
+        valid = summary[(summary['annual_yield_pct'] > 1) & (summary['annual_yield_pct'] < 25)]
+        valid = valid[valid['location'].astype(str).str.lower().str.strip() != 'unknown']
+        return valid.sort_values(['country', 'location']).sort_values('annual_yield_pct', ascending=False, kind='stable')
@@ -1,8 +1,49 @@
 import pandas as pd
 import numpy as np
 import os
+import hashlib
+import threading
+from shared_dataset import SharedDatasetStore
+from deduplication import ListingDeduplicator
 
 class UnifiedDataLoader:
+    # Source CSVs under data_dir, one per market feed
+    SOURCE_FILES = {
+        'thailand': "Bangkok Housing Condo Apartment Prices.csv",
+        'philippines': "Housing Prices Philippines Lamudi.csv",
+        'malaysia': "malaysia_house_price_data_2025.csv",
+        'vietnam_buying': "house_buying_dec29th_2025.csv",
+        'vietnam_rental': "house_rental_dec29th_2025.csv"
+    }
+    # Market (the unified 'country' value) each source feeds
+    SOURCE_COUNTRIES = {
+        'thailand': 'Thailand',
+        'philippines': 'Philippines',
+        'malaysia': 'Malaysia',
+        'vietnam_buying': 'Vietnam',
+        'vietnam_rental': 'Vietnam'
+    }
+
+    # Local currency of each market (keys of exchange_rates)
+    COUNTRY_CURRENCY = {
+        'Thailand': 'THB',
+        'Philippines': 'PHP',
+        'Malaysia': 'MYR',
+        'Vietnam': 'VND'
+    }
+
+    # Drill-down levels, finest first: the listing's own location, its city, its province/region
+    LOCATION_LEVELS = ('location', 'city', 'province')
+    # Sources covering a single city, whose locations are districts of it
+    SINGLE_CITY_MARKETS = {'Thailand': 'Bangkok'}
+
+    # Process-wide unified frame cache: abs data_dir -> (data_version, DataFrame)
+    _unified_cache = {}
+    _level_cache = {}  # abs data_dir -> (data_version, {level: DataFrame})
+    _dedup_reports = {}  # abs data_dir -> (data_version, ListingDeduplicator report)
+    _cache_lock = threading.Lock()
+    _shared_stores = {}
+
     def __init__(self, data_dir=None):
         if data_dir is None:
             # Make path absolute relative to this file
@@ -23,7 +64,7 @@ class UnifiedDataLoader:
         }
 
     def load_thailand(self):
-        filepath = os.path.join(self.data_dir, "Bangkok Housing Condo Apartment Prices.csv")
+        filepath = os.path.join(self.data_dir, self.SOURCE_FILES['thailand'])
         if not os.path.exists(filepath):
             return pd.DataFrame()
         
@@ -67,7 +108,7 @@ class UnifiedDataLoader:
             return pd.DataFrame()
 
     def load_philippines(self):
-        filepath = os.path.join(self.data_dir, "Housing Prices Philippines Lamudi.csv")
+        filepath = os.path.join(self.data_dir, self.SOURCE_FILES['philippines'])
         if not os.path.exists(filepath):
             return pd.DataFrame()
 
@@ -103,7 +144,8 @@ class UnifiedDataLoader:
                 'Bathrooms': 'bathrooms',
                 'Bath': 'bathrooms',
                 'Floor area (m²)': 'area_sqm',
-                'Floor_area': 'area_sqm'
+                'Floor_area': 'area_sqm',
+                'Title': 'title'
             }
             df = df.rename(columns=col_map)
             
@@ -120,13 +162,13 @@ class UnifiedDataLoader:
             for c in cols:
                 if c not in df.columns:
                     df[c] = np.nan
-            return df[cols].dropna(subset=['price_usd'])
+            return df[self._with_title(df, cols)].dropna(subset=['price_usd'])
         except Exception as e:
             print(f"Error loading Philippines data: {e}")
             return pd.DataFrame()
 
     def load_malaysia(self):
-        filepath = os.path.join(self.data_dir, "malaysia_house_price_data_2025.csv")
+        filepath = os.path.join(self.data_dir, self.SOURCE_FILES['malaysia'])
         if not os.path.exists(filepath):
             return pd.DataFrame()
             
@@ -158,7 +200,7 @@ class UnifiedDataLoader:
             return pd.DataFrame()
 
     def load_vietnam_buying(self):
-        filepath = os.path.join(self.data_dir, "house_buying_dec29th_2025.csv")
+        filepath = os.path.join(self.data_dir, self.SOURCE_FILES['vietnam_buying'])
         if not os.path.exists(filepath):
             return pd.DataFrame()
             
@@ -169,7 +211,8 @@ class UnifiedDataLoader:
                 'price_million_vnd': 'price_local_million',
                 'location': 'location', # Ensure mapped
                 'bedrooms': 'bedrooms',
-                'bathrooms': 'bathrooms'
+                'bathrooms': 'bathrooms',
+                'Title': 'title'
             })
             
             if 'price_local_million' in df.columns:
@@ -185,13 +228,13 @@ class UnifiedDataLoader:
             for c in cols:
                 if c not in df.columns:
                     df[c] = np.nan
-            return df[cols].dropna(subset=['price_usd', 'area_sqm'])
+            return df[self._with_title(df, cols)].dropna(subset=['price_usd', 'area_sqm'])
         except Exception as e:
             print(f"Error loading Vietnam Buying data: {e}")
             return pd.DataFrame()
 
     def load_vietnam_rental(self):
-        filepath = os.path.join(self.data_dir, "house_rental_dec29th_2025.csv")
+        filepath = os.path.join(self.data_dir, self.SOURCE_FILES['vietnam_rental'])
         if not os.path.exists(filepath):
             return pd.DataFrame()
         
@@ -202,7 +245,8 @@ class UnifiedDataLoader:
                 'price_million_vnd': 'price_local_million',
                 'location': 'location',
                 'bedrooms': 'bedrooms',
-                'bathrooms': 'bathrooms'
+                'bathrooms': 'bathrooms',
+                'Title': 'title'
             })
             
             # Rental price in million VND? Or assuming typical rental.
@@ -220,12 +264,150 @@ class UnifiedDataLoader:
             for c in cols:
                 if c not in df.columns:
                     df[c] = np.nan
-            return df[cols].dropna(subset=['price_usd', 'area_sqm'])
+            return df[self._with_title(df, cols)].dropna(subset=['price_usd', 'area_sqm'])
         except Exception as e:
             print(f"Error loading Vietnam Rental data: {e}")
             return pd.DataFrame()
 
+    @staticmethod
+    def _with_title(df, cols):
+        """Loader output columns, plus the listing title when the feed has one (for deduplication, dropped after)."""
+        return cols + ['title'] if 'title' in df.columns else cols
+
+    def data_version(self):
+        """
+        Cheap fingerprint of the source CSVs (name, size, mtime).
+        Changes whenever a file is added, removed or rewritten.
+        """
+        return self._files_version(self.SOURCE_FILES.values())
+
+    def market_versions(self):
+        """{country: fingerprint of its own source files}, so a consumer can tell which markets a change touched."""
+        files = {}
+        for source, country in self.SOURCE_COUNTRIES.items():
+            files.setdefault(country, []).append(self.SOURCE_FILES[source])
+        return {country: self._files_version(names) for country, names in files.items()}
+
+    def _files_version(self, names):
+        digest = hashlib.sha1()
+        for name in sorted(names):
+            try:
+                st = os.stat(os.path.join(self.data_dir, name))
+                digest.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode())
+            except OSError:
+                digest.update(f"{name}:missing;".encode())
+        return digest.hexdigest()[:16]
+
     def load_unified_data(self):
+        """
+        Unified listings across all markets.
+        Cached per process and reused until data_version() changes, so every model and
+        analyzer shares one parsed copy. The frame is shared: filter or copy it, never mutate it.
+        With SHARED_DATASET_DIR set, the copy is also shared across processes (see shared_dataset.py).
+        """
+        key = os.path.abspath(self.data_dir)
+        version = self.data_version()
+        cached = self._unified_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        with self._cache_lock:
+            cached = self._unified_cache.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            store = self._shared_store()
+            if store is not None:
+                unified = store.load(version, self._load_unified_uncached, metadata=self._published_metadata)
+                report = store.metadata(version).get('dedup_report')
+                if report is not None and self.dedup_report() is None:
+                    # Attached to a file another process built: its deduplication report came with it
+                    self._dedup_reports[key] = (version, report)
+            else:
+                unified = self._load_unified_uncached()
+            self._unified_cache[key] = (version, unified)
+            return unified
+
+    @classmethod
+    def parse_location(cls, country, location):
+        """
+        (city, province) for a location string. Parts are comma-separated, finest first:
+        'Quận 1, Hồ Chí Minh' (district, city), 'Poblacion, San Juan, La Union'
+        (barangay, municipality, province), 'Quezon City, Metro Manila' (city, region).
+        """
+        if country in cls.SINGLE_CITY_MARKETS:
+            city = cls.SINGLE_CITY_MARKETS[country]
+            return city, city
+        parts = [part.strip() for part in str(location).split(',') if part.strip()]
+        if not parts:
+            return location, location
+        # Vietnamese locations end with the city, which is also the province-level unit
+        city = parts[-1] if country == 'Vietnam' or len(parts) == 1 else parts[-2]
+        return city, parts[-1]
+
+    def location_hierarchy(self):
+        """One row per (country, location) with its city and province."""
+        df = self.load_unified_data()
+        if df.empty:
+            return pd.DataFrame(columns=['country', 'location', 'city', 'province'])
+        pairs = df[['country', 'location']].dropna().drop_duplicates().reset_index(drop=True)
+        parsed = [self.parse_location(c, l) for c, l in zip(pairs['country'], pairs['location'])]
+        pairs['city'] = [city for city, _ in parsed]
+        pairs['province'] = [province for _, province in parsed]
+        return pairs
+
+    def load_level_data(self, level='location'):
+        """
+        The unified listings rolled up to one of LOCATION_LEVELS: 'location' holds the listing's
+        city or province name instead, so every per-location analysis runs unchanged at that level.
+        All levels are built together once per data version (one grouping pass shared by every
+        level); other columns are shared with the unified frame, never copied. Do not mutate.
+        """
+        if level not in self.LOCATION_LEVELS:
+            raise ValueError(f"Unknown level '{level}'. Levels: {list(self.LOCATION_LEVELS)}")
+        unified = self.load_unified_data()
+        if level == 'location' or unified.empty:
+            return unified
+
+        key = os.path.abspath(self.data_dir)
+        version = self.data_version()
+        cached = self._level_cache.get(key)
+        if cached is None or cached[0] != version:
+            with self._cache_lock:
+                cached = self._level_cache.get(key)
+                if cached is None or cached[0] != version:
+                    cached = (version, self._build_levels(unified))
+                    self._level_cache[key] = cached
+        return cached[1][level]
+
+    def _build_levels(self, unified):
+        # Group code per row for every (country, location) pair; each level maps the pairs once
+        grouped = unified.groupby(['country', 'location'], sort=False, dropna=False)
+        codes = grouped.ngroup().to_numpy()
+        pairs = grouped.size().index.tolist()  # In ngroup() order
+        parsed = [
+            (np.nan, np.nan) if pd.isna(country) or pd.isna(location) else self.parse_location(country, location)
+            for country, location in pairs
+        ]
+        levels = {}
+        for i, level in enumerate(self.LOCATION_LEVELS[1:]):
+            names = np.array([p[i] for p in parsed], dtype=object)
+            data = {c: (names[codes] if c == 'location' else unified[c]) for c in unified.columns}
+            levels[level] = pd.DataFrame(data, copy=False)
+        return levels
+
+    @classmethod
+    def _shared_store(cls):
+        directory = os.environ.get('SHARED_DATASET_DIR')
+        if not directory:
+            return None
+        if not SharedDatasetStore.available():
+            print("SHARED_DATASET_DIR is set but pyarrow is not installed; using a per-process copy.")
+            return None
+        if directory not in cls._shared_stores:
+            cls._shared_stores[directory] = SharedDatasetStore(directory)
+        return cls._shared_stores[directory]
+
+    def _load_unified_uncached(self):
         dfs = []
         for loader in [self.load_thailand, self.load_philippines, self.load_malaysia, self.load_vietnam_buying, self.load_vietnam_rental]:
             d = loader()
@@ -236,7 +418,32 @@ class UnifiedDataLoader:
             return pd.DataFrame()
             
         unified = pd.concat(dfs, ignore_index=True)
-        return unified
+        return self._deduplicate(unified)
+
+    def _deduplicate(self, unified):
+        """
+        Drops reposted listings (see deduplication.py) so every model and analyzer sees each listing once.
+        DEDUP_MODE: 'near' (default: exact + near duplicates), 'exact', or 'off'.
+        """
+        mode = os.environ.get('DEDUP_MODE', 'near').lower()
+        if mode != 'off':
+            unified, report = ListingDeduplicator().dedupe(unified, near=(mode != 'exact'))
+            report['mode'] = mode
+            self._dedup_reports[os.path.abspath(self.data_dir)] = (self.data_version(), report)
+            print(f"Deduplication ({mode}): {report['rows_in']} -> {report['rows_out']} rows "
+                  f"({report['exact_removed']} exact, {report['near_removed']} near duplicates removed)")
+        return unified.drop(columns='title', errors='ignore')
+
+    def _published_metadata(self):
+        """Stored with the shared Arrow file, for processes that attach instead of ingesting."""
+        return {'dedup_report': self.dedup_report()}
+
+    def dedup_report(self):
+        """Removal counts from the last ingestion of the current data version (here or by the process that published the shared file), or None."""
+        cached = self._dedup_reports.get(os.path.abspath(self.data_dir))
+        if cached is not None and cached[0] == self.data_version():
+            return cached[1]
+        return None
 
 if __name__ == "__main__":
     loader = UnifiedDataLoader()
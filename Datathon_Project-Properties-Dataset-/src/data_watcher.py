@@ -0,0 +1,206 @@
+import hashlib
+import os
+import threading
+import time
+import traceback
+from collections import deque
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # Optional: Linux only; falls back to polling
+    INotify = None
+
+
+class Stage:
+    """
+    One rebuild step run by DataWatcher.
+    action: callable doing the work.
+    debounce_seconds: quiet time required after the last file change before the stage runs
+        (expensive stages like retraining wait longer, so a burst of uploads triggers them once).
+    fingerprint: optional callable; the stage is skipped when it returns the same value as
+        at the last successful run (e.g. the loader's data_version for a cache rebuild).
+    """
+
+    def __init__(self, name, action, debounce_seconds=2.0, fingerprint=None):
+        self.name = name
+        self.action = action
+        self.debounce_seconds = debounce_seconds
+        self.fingerprint = fingerprint
+        self.pending = False
+        self.last_fingerprint = None
+
+
+class DataWatcher:
+    """
+    Watches dataset directories and runs an ordered pipeline of rebuild stages when source files change.
+
+    Change detection is always by fingerprint (path, size, mtime_ns of every data file), so a
+    spurious event does nothing. With inotify_simple installed, filesystem events wake the watcher
+    immediately; otherwise it polls every poll_seconds. Stages run in order: a stage waits for
+    the ones before it, and each waits for its own debounce window since the last change.
+    on_rebuilt: optional callable run once all stages have finished after a change that made
+    at least one of them do work (e.g. to replace forked workers, see gunicorn.conf.py).
+    """
+
+    DATA_SUFFIXES = ('.csv', '.json', '.parquet')
+    HISTORY_SIZE = 50
+
+    def __init__(self, paths, stages, poll_seconds=5.0, on_rebuilt=None):
+        self.paths = list(dict.fromkeys(os.path.abspath(p) for p in paths))
+        self.stages = list(stages)
+        self.poll_seconds = poll_seconds
+        self.on_rebuilt = on_rebuilt
+        self._rebuilt = False  # A stage did work since on_rebuilt last ran
+        self.backend = 'inotify' if INotify is not None else 'polling'
+        self.history = deque(maxlen=self.HISTORY_SIZE)  # Recent stage runs with timings
+        self.last_change = None
+        self._files_fingerprint = self.fingerprint()
+        self._last_change_monotonic = None
+        self._lock = threading.RLock()  # Held for a whole tick, including the stages it runs
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+        self._watched_dirs = set()
+        for stage in self.stages:
+            # Start from the current state so only real changes make a stage run
+            if stage.fingerprint:
+                try:
+                    stage.last_fingerprint = stage.fingerprint()
+                except Exception:
+                    pass
+
+    def fingerprint(self):
+        """Hash of (path, size, mtime_ns) for every data file under the watched paths."""
+        digest = hashlib.sha1()
+        for path in sorted(self._data_files()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # Deleted between listing and stat
+            digest.update(f"{path}:{st.st_size}:{st.st_mtime_ns};".encode())
+        return digest.hexdigest()[:16]
+
+    def _data_files(self):
+        files = set()
+        for root in self.paths:
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    if filename.endswith(self.DATA_SUFFIXES) and not filename.startswith('.'):
+                        files.add(os.path.realpath(os.path.join(dirpath, filename)))
+        return files
+
+    def check(self):
+        """
+        One watcher tick: detect file changes, then run every stage that is due.
+        Called by the background thread; also usable synchronously.
+        """
+        with self._lock:
+            current = self.fingerprint()
+            if current != self._files_fingerprint:
+                self._files_fingerprint = current
+                self._last_change_monotonic = time.monotonic()
+                self.last_change = time.time()
+                for stage in self.stages:
+                    stage.pending = True
+                print(f"Data change detected under {self.paths}; rebuild pending")
+
+            for stage in self.stages:
+                if not stage.pending:
+                    continue
+                if time.monotonic() - self._last_change_monotonic < stage.debounce_seconds:
+                    break  # Later stages depend on this one; wait for it
+                self._run(stage)
+                if stage.pending:
+                    break  # Failed; retried on the next tick
+
+            if self._rebuilt and not any(stage.pending for stage in self.stages):
+                self._rebuilt = False
+                if self.on_rebuilt is not None:
+                    self.on_rebuilt()
+
+    def _run(self, stage):
+        start = time.time()
+        record = {'stage': stage.name, 'started_at': start}
+        try:
+            key = stage.fingerprint() if stage.fingerprint else None
+            if key is not None and key == stage.last_fingerprint:
+                record['status'] = 'skipped'
+            else:
+                stage.action()
+                stage.last_fingerprint = key
+                record['status'] = 'ok'
+                self._rebuilt = True
+            stage.pending = False
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+            traceback.print_exc()
+        record['seconds'] = round(time.time() - start, 3)
+        self.history.append(record)
+        print(f"Rebuild stage {stage.name}: {record['status']} in {record['seconds']}s")
+
+    def _sleep(self):
+        """Waits until the next tick: a filesystem event (inotify) or the poll interval."""
+        pending = any(stage.pending for stage in self.stages)
+        timeout = min(self.poll_seconds, 0.5) if pending else self.poll_seconds
+        if self._inotify is None:
+            self._stop.wait(timeout)
+            return
+        self._watch_new_dirs()
+        self._inotify.read(timeout=int(timeout * 1000))
+
+    def _watch_new_dirs(self):
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.CREATE | flags.DELETE
+        for root in self.paths:
+            for dirpath, _, _ in os.walk(root):
+                if dirpath not in self._watched_dirs:
+                    try:
+                        self._inotify.add_watch(dirpath, mask)
+                        self._watched_dirs.add(dirpath)
+                    except OSError:
+                        pass
+
+    def start(self):
+        """Runs the watcher in a daemon thread (one per process)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.check()
+                except Exception as e:
+                    print(f"Data watcher tick failed: {e}")
+                self._sleep()
+
+        if INotify is not None:
+            try:
+                self._inotify = INotify()
+            except OSError as e:
+                print(f"inotify unavailable ({e}); polling instead")
+                self.backend = 'polling'
+        self._thread = threading.Thread(target=loop, name='data-watcher', daemon=True)
+        self._thread.start()
+
+    def hold_across_forks(self):
+        """
+        Makes every fork() of this process wait for the current tick to finish (and hold off the
+        next one until it is done), so a child never inherits a lock taken mid-rebuild.
+        For processes that run the watcher and also fork workers (the gunicorn master).
+        """
+        os.register_at_fork(before=self._lock.acquire,
+                            after_in_parent=self._lock.release,
+                            after_in_child=self._lock.release)
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return {
+            'backend': self.backend,
+            'paths': self.paths,
+            'files_fingerprint': self._files_fingerprint,
+            'last_change': self.last_change,
+            'pending': [stage.name for stage in self.stages if stage.pending],
+            'history': list(self.history)
+        }
@@ -0,0 +1,141 @@
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Listings are only compared within the same market feed
+GROUP_COLUMNS = ['country', 'transaction_type']
+
+
+def _shingles(text, size=4):
+    """crc32 of each character `size`-gram of a normalized text (the whole text when shorter)."""
+    if len(text) <= size:
+        return [zlib.crc32(text.encode())]
+    return list({zlib.crc32(text[i:i + size].encode()) for i in range(len(text) - size + 1)})
+
+
+class ListingDeduplicator:
+    """
+    Removes reposted listings before anything else reads the unified frame.
+
+    1. Exact duplicates: identical rows (64-bit row hash of every column), first copy kept.
+    2. Near duplicates: MinHash over character shingles of title + location, banded into LSH
+       buckets that also carry the market (GROUP_COLUMNS) and log-scale area/price buckets (grids
+       offset by half a bucket on each axis, so close values always share one). Each row is checked
+       against its bucket's first row only: estimated Jaccard >= min_similarity, area and price
+       within `tolerance` (`untitled_tolerance` when either has no title: the location alone says
+       little), same bedrooms/bathrooms where known. Verified pairs are merged into groups and the
+       first listing of each group is kept.
+    Every step is a fixed number of passes over the rows, so the cost grows linearly.
+    """
+
+    def __init__(self, num_perm=32, bands=8, min_similarity=0.7, tolerance=0.02, untitled_tolerance=0.005, seed=0):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.min_similarity = min_similarity
+        self.tolerance = tolerance
+        self.untitled_tolerance = untitled_tolerance
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: (a * x + b) mod 2^64, top 32 bits
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def dedupe(self, df, near=True):
+        """Returns (deduplicated frame with a fresh index, report dict with per-country removal counts)."""
+        report = {'rows_in': len(df), 'exact_removed': 0, 'near_removed': 0, 'by_country': {}}
+        if df.empty:
+            report['rows_out'] = 0
+            return df, report
+
+        exact = pd.util.hash_pandas_object(df, index=False).duplicated().to_numpy()
+        kept = df[~exact]
+        near_dup = self.near_duplicates(kept) if near else np.zeros(len(kept), dtype=bool)
+        out = kept[~near_dup].reset_index(drop=True)
+
+        exact_by_country = df.loc[exact, 'country'].value_counts()
+        near_by_country = kept.loc[near_dup, 'country'].value_counts()
+        for country in sorted(df['country'].dropna().unique()):
+            report['by_country'][country] = {
+                'exact_removed': int(exact_by_country.get(country, 0)),
+                'near_removed': int(near_by_country.get(country, 0))
+            }
+        report.update(exact_removed=int(exact.sum()), near_removed=int(near_dup.sum()), rows_out=len(out))
+        return out, report
+
+    def signatures(self, texts):
+        """(n, num_perm) uint32 MinHash signatures of the texts' shingle sets."""
+        texts = list(texts)
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for begin in range(0, len(texts), 20000):  # Bounds the (shingles, num_perm) temporary
+            tokens = [_shingles(text) for text in texts[begin:begin + 20000]]
+            counts = np.fromiter((len(t) for t in tokens), dtype=np.int64, count=len(tokens))
+            flat = np.fromiter((h for t in tokens for h in t), dtype=np.uint64, count=int(counts.sum()))
+            hashed = (flat[:, None] * self._a + self._b) >> np.uint64(32)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            signatures[begin:begin + len(tokens)] = np.minimum.reduceat(hashed, starts, axis=0)
+        return signatures
+
+    def near_duplicates(self, df):
+        """Boolean mask (positional) of rows that repeat an earlier listing."""
+        n = len(df)
+        if n < 2:
+            return np.zeros(n, dtype=bool)
+        title = df['title'] if 'title' in df.columns else pd.Series(np.nan, index=df.index)
+        titled = title.notna().to_numpy()
+        texts = (title.fillna('').astype(str) + ' ' + df['location'].fillna('').astype(str)).str.lower()
+        codes, unique_texts = pd.factorize(texts)  # Reposts share texts: hash each distinct one once
+        signatures = self.signatures(re.sub(r'\W+', ' ', t).strip() for t in unique_texts)[codes]
+
+        area = df['area_sqm'].to_numpy(dtype=float)
+        price = df['price_usd'].to_numpy(dtype=float)
+        rooms = [df[column].to_numpy(dtype=float) for column in ('bedrooms', 'bathrooms')]
+        step = np.log1p(2 * self.tolerance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_area, log_price = np.log(area) / step, np.log(price) / step
+        log_area = np.nan_to_num(log_area, nan=-1e9, posinf=-1e9, neginf=-1e9)
+        log_price = np.nan_to_num(log_price, nan=-1e9, posinf=-1e9, neginf=-1e9)
+        market = pd.util.hash_pandas_object(df[GROUP_COLUMNS], index=False).to_numpy()
+        # Numeric part of the bucket key for each half-bucket offset of area and price
+        numeric_keys = [
+            np.floor(log_area + area_offset).astype(np.int64).view(np.uint64) * self._a[-1]
+            ^ np.floor(log_price + price_offset).astype(np.int64).view(np.uint64) * self._a[-2]
+            for area_offset in (0.0, 0.5) for price_offset in (0.0, 0.5)
+        ]
+
+        def verified(rows, reps):
+            """The candidate pairs that really are the same listing (cheap numeric checks first)."""
+            tolerance = np.where(titled[rows] & titled[reps], self.tolerance, self.untitled_tolerance)
+            with np.errstate(invalid='ignore'):
+                keep = np.abs(area[rows] - area[reps]) <= tolerance * np.maximum(area[rows], area[reps])
+                keep &= np.abs(price[rows] - price[reps]) <= tolerance * np.maximum(price[rows], price[reps])
+            for values in rooms:
+                keep &= (values[rows] == values[reps]) | np.isnan(values[rows]) | np.isnan(values[reps])
+            rows, reps = rows[keep], reps[keep]
+            keep = (signatures[rows] == signatures[reps]).mean(axis=1) >= self.min_similarity
+            return rows[keep], reps[keep]
+
+        rows_per_band = self.num_perm // self.bands
+        sources, targets = [], []
+        for band in range(self.bands):
+            band_values = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype(np.uint64)
+            band_key = market ^ (band_values * self._a[:rows_per_band]).sum(axis=1)  # Wraps mod 2^64
+            for numeric_key in numeric_keys:
+                codes = pd.factorize(band_key ^ numeric_key)[0]  # Codes are numbered in order of first appearance
+                running = np.maximum.accumulate(codes)
+                first = np.flatnonzero(np.r_[True, running[1:] > running[:-1]])
+                representative = first[codes]
+                candidate = np.flatnonzero(representative != np.arange(n))
+                rows, reps = verified(candidate, representative[candidate])
+                sources.append(rows)
+                targets.append(reps)
+        rows = np.concatenate(sources)
+        reps = np.concatenate(targets)
+
+        graph = coo_matrix((np.ones(len(rows)), (rows, reps)), shape=(n, n))
+        _, component = connected_components(graph, directed=False)
+        first_of_component = np.full(component.max() + 1, n)
+        np.minimum.at(first_of_component, component, np.arange(n))
+        return first_of_component[component] != np.arange(n)
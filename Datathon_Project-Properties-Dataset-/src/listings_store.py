@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent builders are not serialized
+    fcntl = None
+
+
+class ListingsStore:
+    """
+    Indexed SQLite copy of the unified listings, for filtered lookups of individual listings.
+
+    ingest() writes a complete database to a temp file and swaps it in with os.replace, so
+    readers (one short-lived read-only connection per query) always see a full snapshot.
+    Requests only read: a stale store keeps serving while refresh() rebuilds it in the background.
+    Filters on country/location/transaction_type and price/area/bedroom ranges are narrowed by
+    composite indexes (equality columns, then range columns), and the matching rows are then read
+    from the table; pages use keyset pagination ((sort value, id) > last row served), so page N
+    costs the same as page 1.
+    """
+
+    COLUMNS = ['country', 'location', 'transaction_type', 'property_type',
+               'price_usd', 'price_local', 'area_sqm', 'bedrooms', 'bathrooms']
+    SORTABLE = ('price_usd', 'area_sqm', 'price_per_sqm')
+    BATCH_ROWS = 50000
+    SCHEMA_VERSION = '2'  # Bump when SCHEMA or INDEXES change, so existing databases are rebuilt
+
+    SCHEMA = """
+        CREATE TABLE listings (
+            id INTEGER PRIMARY KEY,
+            country TEXT COLLATE NOCASE,
+            location TEXT COLLATE NOCASE,
+            transaction_type TEXT COLLATE NOCASE,
+            property_type TEXT,
+            price_usd REAL,
+            price_local REAL,
+            area_sqm REAL,
+            bedrooms REAL,
+            bathrooms REAL,
+            price_per_sqm REAL
+        );
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+    # Range columns trail the equality columns so range filters are checked inside the index
+    INDEXES = """
+        CREATE INDEX idx_listings_market ON listings (country, location, transaction_type, price_usd, area_sqm, bedrooms);
+        CREATE INDEX idx_listings_location ON listings (location, transaction_type, price_usd, area_sqm, bedrooms);
+        CREATE INDEX idx_listings_country_price ON listings (country, transaction_type, price_usd, area_sqm, bedrooms);
+        CREATE INDEX idx_listings_country_area ON listings (country, transaction_type, area_sqm, price_usd, bedrooms);
+        CREATE INDEX idx_listings_country_pps ON listings (country, transaction_type, price_per_sqm);
+        CREATE INDEX idx_listings_price ON listings (transaction_type, price_usd, area_sqm);
+        CREATE INDEX idx_listings_area ON listings (transaction_type, area_sqm, price_usd);
+        ANALYZE;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._refresh_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def stored_version(self, key='data_version'):
+        """Data version the database on disk was built from (or another meta key), or None."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = ?", [key]).fetchone()
+                return row[0] if row else None
+        except sqlite3.Error:
+            return None
+
+    def ensure_fresh(self, loader):
+        """Rebuilds the database if it was built from another data version (one builder across processes)."""
+        version = loader.data_version()
+        if self.version == version:
+            return
+        with self._lock:
+            if self.version == version:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path + '.lock', 'w') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                if self.stored_version() != version or self.stored_version('schema_version') != self.SCHEMA_VERSION:
+                    self.ingest(loader.load_unified_data(), version)
+            self.version = version
+
+    def refresh(self, loader):
+        """Runs ensure_fresh() in a background thread unless one is already running. Returns True if started."""
+        with self._refresh_lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return False
+            self._refresh_thread = threading.Thread(target=self._refresh, args=(loader,), name='listings-refresh', daemon=True)
+            self._refresh_thread.start()
+            return True
+
+    def _refresh(self, loader):
+        try:
+            self.ensure_fresh(loader)
+        except Exception as e:
+            print(f"Error refreshing listings store: {e}")
+
+    def ingest(self, df, version):
+        """Writes df into a new database file and atomically replaces the current one."""
+        start = time.time()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-listings-')
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                conn.execute("PRAGMA journal_mode = OFF")
+                conn.execute("PRAGMA synchronous = OFF")
+                conn.executescript(self.SCHEMA)
+                frame = df.reindex(columns=self.COLUMNS)
+                frame['price_per_sqm'] = frame['price_usd'] / frame['area_sqm'].where(frame['area_sqm'] > 0)
+                # SQLite stores a bound NaN as NULL, so missing values need no conversion
+                sql = f"INSERT INTO listings ({', '.join(self.COLUMNS)}, price_per_sqm) VALUES ({', '.join('?' * (len(self.COLUMNS) + 1))})"
+                for begin in range(0, len(frame), self.BATCH_ROWS):
+                    conn.executemany(sql, frame.iloc[begin:begin + self.BATCH_ROWS].itertuples(index=False, name=None))
+                conn.executescript(self.INDEXES)
+                conn.executemany("INSERT INTO meta VALUES (?, ?)", [('data_version', version), ('schema_version', self.SCHEMA_VERSION)])
+                conn.commit()
+            finally:
+                conn.close()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        print(f"Listings store built: {len(df)} rows in {time.time() - start:.2f}s ({self.path})")
+
+    def search(self, filters, sort='price_usd', limit=50, after=None):
+        """
+        filters: dict with any of country, location, transaction_type, property_type (exact,
+            case-insensitive except property_type), min_/max_price, min_/max_area, min_/max_bedrooms.
+        sort: one of SORTABLE, '-' prefix for descending. Rows without a value for it are skipped.
+        after: (sort value, id) of the last row of the previous page.
+        Returns (rows as dicts, (sort value, id) of the last row or None, data version of the database read).
+        """
+        descending = sort.startswith('-')
+        column = sort.lstrip('-')
+        if column not in self.SORTABLE:
+            raise ValueError(f"Cannot sort by '{column}'. Sortable fields: {list(self.SORTABLE)}")
+
+        clauses, params = [f"{column} IS NOT NULL"], []
+        for field in ('country', 'location', 'transaction_type', 'property_type'):
+            if filters.get(field):
+                clauses.append(f"{field} = ?")
+                params.append(filters[field])
+        for field, column_name in (('price', 'price_usd'), ('area', 'area_sqm'), ('bedrooms', 'bedrooms')):
+            if filters.get(f'min_{field}') is not None:
+                clauses.append(f"{column_name} >= ?")
+                params.append(filters[f'min_{field}'])
+            if filters.get(f'max_{field}') is not None:
+                clauses.append(f"{column_name} <= ?")
+                params.append(filters[f'max_{field}'])
+        if after is not None:
+            clauses.append(f"({column}, id) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+
+        direction = 'DESC' if descending else 'ASC'
+        sql = (f"SELECT id, {', '.join(self.COLUMNS)}, price_per_sqm FROM listings "
+               f"WHERE {' AND '.join(clauses)} ORDER BY {column} {direction}, id {direction} LIMIT ?")
+        params.append(int(limit))
+
+        with closing(self._connect()) as conn:
+            # One connection reads the version and the page, so both come from the same database file
+            version = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()[0]
+            rows = [dict(row) for row in conn.execute(sql, params)]
+        last = (rows[-1][column], rows[-1]['id']) if rows else None
+        return rows, last, version
+
+
+if __name__ == "__main__":
+    # Build (or refresh) the store from the current datasets
+    from data_loader import UnifiedDataLoader
+    loader = UnifiedDataLoader()
+    store = ListingsStore(os.environ.get('LISTINGS_DB_PATH', os.path.join(loader.data_dir, 'listings.sqlite')))
+    store.ensure_fresh(loader)
+    print(f"Listings store at {store.path} (data version {store.version})")
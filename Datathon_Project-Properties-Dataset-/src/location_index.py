@@ -0,0 +1,142 @@
+import bisect
+import re
+import unicodedata
+from collections import defaultdict
+
+
+def normalize_text(text):
+    """
+    Lowercase, accent-free form used for matching.
+    'Quận 1, Hồ Chí Minh' -> 'quan 1, ho chi minh' (Vietnamese đ/Đ has no decomposition, so map it explicitly).
+    """
+    text = str(text).replace('đ', 'd').replace('Đ', 'D')
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.lower().split())
+
+
+def _word_suffixes(normalized):
+    """'quan 1, ho chi minh' -> ['quan 1, ho chi minh', '1, ho chi minh', 'ho chi minh', 'chi minh', 'minh']"""
+    return [normalized[m.start():] for m in re.finditer(r'[0-9a-z]+', normalized)]
+
+
+def _trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Index:
+    """Sorted prefix keys + trigram postings over one set of catalog entries."""
+
+    MAX_PREFIX_SCAN = 5000  # Bound work for one-letter queries on huge catalogs
+
+    def __init__(self, entries, entry_ids):
+        pairs = []
+        trigrams = defaultdict(list)
+        for eid in entry_ids:
+            normalized = entries[eid]['normalized']
+            pairs.append((normalized, eid))
+            for suffix in set(_word_suffixes(normalized)) - {normalized}:
+                pairs.append((suffix, eid))
+            for gram in _trigrams(normalized):
+                trigrams[gram].append(eid)
+        pairs.sort()
+        self.keys = [k for k, _ in pairs]
+        self.ids = [eid for _, eid in pairs]
+        self.trigrams = dict(trigrams)
+        self.by_weight = sorted(entry_ids, key=lambda eid: (-entries[eid]['weight'], entries[eid]['normalized']))
+
+    def prefix_matches(self, prefix):
+        start = bisect.bisect_left(self.keys, prefix)
+        stop = min(len(self.keys), start + self.MAX_PREFIX_SCAN)
+        for pos in range(start, stop):
+            if not self.keys[pos].startswith(prefix):
+                break
+            yield self.keys[pos], self.ids[pos]
+
+
+class LocationSearchIndex:
+    """
+    Autocomplete over the canonical location catalog.
+    Prefix matches come from a sorted key array (binary search), fuzzy/substring
+    matches from a trigram index; both are built once per catalog.
+    Ranking: exact > name prefix > prefix at a word start > substring > trigram overlap, then listing count.
+    """
+
+    def __init__(self, catalog=None):
+        self.entries = []
+        self.indexes = {}
+        if catalog is not None:
+            self.build(catalog)
+
+    def build(self, catalog):
+        """
+        catalog: {country: {location: listing_count}} (a plain list of locations is also accepted).
+        """
+        entries = []
+        per_country = defaultdict(list)
+        for country, locations in catalog.items():
+            weights = locations if isinstance(locations, dict) else {loc: 0 for loc in locations}
+            for location, weight in weights.items():
+                eid = len(entries)
+                entries.append({
+                    'country': country,
+                    'location': location,
+                    'normalized': normalize_text(location),
+                    'weight': int(weight or 0)
+                })
+                per_country[country.lower()].append(eid)
+
+        indexes = {None: _Index(entries, range(len(entries)))}
+        for country_key, ids in per_country.items():
+            indexes[country_key] = _Index(entries, ids)
+
+        # Swap in one assignment so concurrent searches see either the old or the new index
+        self.entries, self.indexes = entries, indexes
+
+    def search(self, query, country=None, limit=10):
+        entries, indexes = self.entries, self.indexes
+        index = indexes.get(country.lower() if country else None)
+        if index is None:
+            return []
+
+        q = normalize_text(query)
+        if not q:
+            return [self._result(entries[eid], 0.0) for eid in index.by_weight[:limit]]
+
+        scores = {}
+        for key, eid in index.prefix_matches(q):
+            normalized = entries[eid]['normalized']
+            if normalized == q:
+                score = 4.0
+            elif key == normalized:
+                score = 3.0
+            else:
+                score = 2.0
+            if score > scores.get(eid, 0):
+                scores[eid] = score
+
+        if len(scores) < limit:
+            grams = _trigrams(q)
+            overlap = defaultdict(int)
+            for gram in grams:
+                for eid in index.trigrams.get(gram, ()):
+                    if eid not in scores:
+                        overlap[eid] += 1
+            for eid, hits in overlap.items():
+                if q in entries[eid]['normalized']:
+                    scores[eid] = 1.5
+                elif hits / len(grams) >= 0.5:
+                    scores[eid] = hits / len(grams)
+
+        ranked = sorted(scores, key=lambda eid: (-scores[eid], -entries[eid]['weight'], entries[eid]['normalized']))
+        return [self._result(entries[eid], scores[eid]) for eid in ranked[:limit]]
+
+    @staticmethod
+    def _result(entry, score):
+        return {
+            'country': entry['country'],
+            'location': entry['location'],
+            'listings': entry['weight'],
+            'score': round(score, 3)
+        }
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+
+from market_similarity import FEATURES, standardized
+
+SEGMENTS = ('value-entry', 'high-yield', 'premium', 'thin-supply')
+
+
+class MarketSegmenter:
+    """
+    Groups markets into investment archetypes with mini-batch k-means over the standardized
+    market feature vectors (src/market_similarity.py).
+
+    The model is fed with partial_fit one shuffled batch at a time for `epochs` passes, so memory
+    stays bounded by batch_size however many markets (or listings) are segmented. Clusters are then
+    named from their centroids, one name each:
+    thin-supply = lowest supply, premium = highest price/sqm of the rest,
+    high-yield = highest yield of the rest, value-entry = the remaining cluster.
+    """
+
+    def __init__(self, batch_size=1024, epochs=5, seed=0):
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.seed = seed
+
+    def fit(self, features):
+        """
+        features: market_features() output.
+        Returns (labels, profiles): the features' country/location with a `segment` column, and
+        one row per segment with its size and median feature values.
+        """
+        labels = features[['country', 'location']].reset_index(drop=True).assign(segment=pd.Series(dtype=object))
+        if features.empty:
+            return labels, pd.DataFrame(columns=['segment', 'markets'] + FEATURES)
+
+        vectors = standardized(features)
+        n_clusters = min(len(SEGMENTS), len(vectors))
+        model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=self.batch_size, random_state=self.seed, n_init=3)
+        rng = np.random.default_rng(self.seed)
+        for _ in range(self.epochs):
+            order = rng.permutation(len(vectors))
+            for begin in range(0, len(order), self.batch_size):
+                batch = vectors[order[begin:begin + self.batch_size]]
+                if len(batch) >= n_clusters:  # partial_fit needs at least one sample per centroid
+                    model.partial_fit(batch)
+        if not hasattr(model, 'cluster_centers_'):
+            model.partial_fit(vectors)
+
+        names = self._name_clusters(model.cluster_centers_)
+        labels['segment'] = [names[c] for c in model.predict(vectors)]
+        profiles = features[FEATURES].reset_index(drop=True).assign(segment=labels['segment'])
+        profiles = profiles.groupby('segment').median().reindex([s for s in SEGMENTS if s in names.values()])
+        profiles.insert(0, 'markets', labels['segment'].value_counts().reindex(profiles.index).fillna(0).astype(int))
+        return labels, profiles.reset_index()
+
+    @staticmethod
+    def _name_clusters(centers):
+        """cluster -> segment name, picking each archetype's cluster from the centroids in the order above."""
+        remaining = list(range(len(centers)))
+        column = {name: FEATURES.index(name) for name in ('log_supply', 'log_median_pps', 'annual_yield_pct')}
+        names = {}
+        for segment, feature, pick in (('thin-supply', 'log_supply', np.argmin),
+                                       ('premium', 'log_median_pps', np.argmax),
+                                       ('high-yield', 'annual_yield_pct', np.argmax)):
+            if len(remaining) <= 1:
+                break
+            chosen = remaining[int(pick(centers[remaining, column[feature]]))]
+            names[chosen] = segment
+            remaining.remove(chosen)
+        for cluster in remaining:
+            names[cluster] = 'value-entry'
+        return names
+
+
+if __name__ == "__main__":
+    # Segment the current datasets and print the archetype profiles
+    from data_loader import UnifiedDataLoader
+    from market_similarity import market_features
+    from models import YieldAnalyzer, MEICalculator
+    loader = UnifiedDataLoader()
+    features = market_features(loader.load_unified_data(), YieldAnalyzer().analyze_market(), MEICalculator().calculate_mei())
+    labels, profiles = MarketSegmenter().fit(features)
+    print(profiles.to_string(index=False))
@@ -0,0 +1,162 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+FEATURES = [
+    'log_median_pps',        # Price level
+    'log_supply',            # Market depth
+    'annual_yield_pct',      # Real or proxy yield (YieldAnalyzer)
+    'median_area_sqm',       # Size mix: typical unit size ...
+    'share_studio_1br',      # ... and the share of small / mid / large units
+    'share_2br',
+    'share_3br_plus',
+    'search_volume_index',   # MEI components (MEICalculator)
+    'interest_density'
+]
+
+
+def market_features(listings, yields=None, mei=None):
+    """
+    One feature row per (country, location) with at least 5 priced sales.
+    listings: unified frame (or a level rollup); yields / mei: the analyzers' output frames.
+    """
+    sales = listings[(listings['transaction_type'] == 'sale') & (listings['price_usd'] > 0) & (listings['area_sqm'] > 0)]
+    sales = sales[sales['location'].notna() & (sales['location'].astype(str).str.strip().str.lower() != 'unknown')]
+    if sales.empty:
+        return pd.DataFrame(columns=['country', 'location'] + FEATURES)
+    sales = sales.assign(
+        price_per_sqm=sales['price_usd'] / sales['area_sqm'],
+        small=sales['bedrooms'] <= 1,
+        mid=sales['bedrooms'] == 2,
+        large=sales['bedrooms'] >= 3,
+        has_rooms=sales['bedrooms'].notna()
+    )
+    grouped = sales.groupby(['country', 'location'])
+    features = grouped.agg(
+        median_pps=('price_per_sqm', 'median'),
+        supply=('price_usd', 'size'),
+        median_area_sqm=('area_sqm', 'median'),
+        small=('small', 'sum'), mid=('mid', 'sum'), large=('large', 'sum'), has_rooms=('has_rooms', 'sum')
+    ).reset_index()
+    features = features[features['supply'] >= 5]
+    features['log_median_pps'] = np.log(features['median_pps'])
+    features['log_supply'] = np.log(features['supply'])
+    rooms = features['has_rooms'].where(features['has_rooms'] > 0)  # No bedroom data: mix unknown (NaN)
+    features['share_studio_1br'] = features['small'] / rooms
+    features['share_2br'] = features['mid'] / rooms
+    features['share_3br_plus'] = features['large'] / rooms
+
+    if yields is not None and not yields.empty:
+        features = features.merge(yields[['country', 'location', 'annual_yield_pct']], on=['country', 'location'], how='left')
+    else:
+        features['annual_yield_pct'] = np.nan
+    if mei is not None and not mei.empty:
+        features = features.merge(mei[['country', 'location', 'search_volume_index', 'interest_density']],
+                                  on=['country', 'location'], how='left')
+    else:
+        features['search_volume_index'] = np.nan
+        features['interest_density'] = np.nan
+    return features[['country', 'location', 'median_pps', 'supply'] + FEATURES].reset_index(drop=True)
+
+
+def standardized(features):
+    """(n, len(FEATURES)) z-scores; a missing feature sits at the mean (0) so it does not count."""
+    values = features[FEATURES].to_numpy(dtype=float)
+    if not len(values):
+        return np.empty((0, len(FEATURES)))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN feature columns
+        mean = np.nan_to_num(np.nanmean(values, axis=0))
+        std = np.nan_to_num(np.nanstd(values, axis=0))
+    return np.nan_to_num((values - mean) / np.where(std > 0, std, 1.0))
+
+
+class MarketSimilarityIndex:
+    """
+    Approximate nearest-neighbour search over market feature vectors.
+
+    Features are standardized (missing values sit at the mean, i.e. contribute nothing) and
+    indexed with random-projection LSH: each of n_tables hashes a vector to the sign pattern of
+    n_bits random hyperplanes, so markets pointing the same way in feature space share buckets.
+    A query reads its bucket in every table (plus the buckets one bit away, when that is still
+    too few), then ranks only those candidates by exact Euclidean distance. n_bits grows with
+    log2(n) so buckets stay around BUCKET_SIZE markets and query cost stays flat as n grows.
+    """
+
+    BUCKET_SIZE = 8
+
+    def __init__(self, n_tables=8, seed=0):
+        self.n_tables = n_tables
+        self.seed = seed
+        self.markets = pd.DataFrame(columns=['country', 'location'] + FEATURES)
+        self.vectors = np.empty((0, len(FEATURES)))
+        self.n_bits = 0
+        self.tables = []
+
+    def build(self, features):
+        self.markets = features.reset_index(drop=True)
+        self.vectors = standardized(self.markets)
+
+        n = len(self.vectors)
+        self.n_bits = int(np.clip(np.round(np.log2(max(n, 1) / self.BUCKET_SIZE)), 1, 24))
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((self.n_tables, len(FEATURES), self.n_bits))
+        self._weights = 1 << np.arange(self.n_bits)
+        self.tables = []
+        for t in range(self.n_tables):
+            buckets = {}
+            for i, code in enumerate(self._hash(self.vectors, t).tolist()):
+                buckets.setdefault(code, []).append(i)
+            self.tables.append(buckets)
+        self._keys = {
+            (c.lower(), l.lower()): i for i, (c, l) in enumerate(zip(self.markets['country'], self.markets['location']))
+        }
+        return self
+
+    def _hash(self, vectors, table):
+        return ((vectors @ self.planes[table]) > 0).astype(np.int64) @ self._weights
+
+    def find(self, location, country=None):
+        """Row of a market: exact (case-insensitive) match, else the deepest market whose name contains the query."""
+        location = str(location).strip().lower()
+        if country:
+            row = self._keys.get((country.lower(), location))
+            if row is not None:
+                return row
+        names = self.markets['location'].str.lower()
+        exact = names == location
+        candidates = exact if exact.any() else names.str.contains(location, regex=False)
+        if country:
+            candidates &= self.markets['country'].str.lower() == country.lower()
+        if not candidates.any():
+            return None
+        return int(self.markets.loc[candidates, 'supply'].idxmax())
+
+    def query(self, row, k=10, allowed=None):
+        """
+        (neighbour rows, distances, candidates examined) for the market at `row`, nearest first.
+        allowed: optional boolean mask of rows that may be returned (e.g. other countries only).
+        """
+        vector = self.vectors[row]
+        codes = [int(self._hash(vector[None, :], t)[0]) for t in range(self.n_tables)]
+
+        def eligible(rows):
+            rows = np.fromiter(rows, dtype=np.int64)
+            rows = rows[rows != row]
+            return rows[allowed[rows]] if allowed is not None else rows
+
+        candidates = set()
+        for t, code in enumerate(codes):
+            candidates.update(self.tables[t].get(code, ()))
+        rows = eligible(candidates)
+        if len(rows) <= k:
+            for t, code in enumerate(codes):  # Multi-probe: buckets differing in one hyperplane
+                for bit in range(self.n_bits):
+                    candidates.update(self.tables[t].get(code ^ (1 << bit), ()))
+            rows = eligible(candidates)
+        if len(rows) < k:
+            rows = eligible(range(len(self.vectors)))  # Tiny or degenerate index: exact scan
+        distances = np.linalg.norm(self.vectors[rows] - vector, axis=1)
+        order = np.lexsort((rows, distances))[:k]
+        return rows[order], distances[order], len(rows)
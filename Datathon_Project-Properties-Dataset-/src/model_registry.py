@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process locking is skipped
+    fcntl = None
+
+
+def _atomic_write(path, text):
+    """Write to a temp file in the same directory, fsync, then os.replace (readers never see a partial file)."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# <repo root>/model_registry, whatever directory the server or tests are started from
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model_registry')
+
+
+class ModelRegistry:
+    """
+    Versioned storage for the built-in LightGBM models.
+
+    Layout (under MODEL_REGISTRY_DIR, default DEFAULT_ROOT at the repo root):
+        model_registry/<name>/<version>.txt   immutable artifacts, never overwritten
+        model_registry/<name>/<version>.json  metadata, e.g. the training data fingerprint
+        model_registry/<name>/CURRENT         pointer file holding the active version
+
+    Publishing writes a new artifact, then swaps CURRENT with os.replace, so any process
+    reading the registry sees either the old or the new version, never a half-written file.
+    """
+
+    KEEP_VERSIONS = 5  # Older inactive artifacts are pruned after each publish
+    VERSION_PATTERN = re.compile(r'\d{8}-\d{6}-[0-9a-f]{8}')  # <YYYYmmdd-HHMMSS>-<sha1 prefix>
+
+    def __init__(self, root=None):
+        self.root = root or os.environ.get('MODEL_REGISTRY_DIR', DEFAULT_ROOT)
+
+    def _model_dir(self, name):
+        return os.path.join(self.root, name)
+
+    def _pointer_path(self, name):
+        return os.path.join(self._model_dir(name), 'CURRENT')
+
+    def artifact_path(self, name, version):
+        return os.path.join(self._model_dir(name), f"{version}.txt")
+
+    def current_version(self, name):
+        """Active version, or None if nothing has been published for this model."""
+        try:
+            with open(self._pointer_path(name)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self, name):
+        """Published versions, oldest first (version ids sort by publish time)."""
+        try:
+            files = os.listdir(self._model_dir(name))
+        except FileNotFoundError:
+            return []
+        return sorted(f[:-len('.txt')] for f in files if f.endswith('.txt') and not f.startswith('.'))
+
+    def metadata(self, name, version=None):
+        """Metadata stored with a version (default: the current one); {} if there is none."""
+        version = version or self.current_version(name)
+        if version is None:
+            return {}
+        try:
+            with open(self._metadata_path(name, version)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _metadata_path(self, name, version):
+        return os.path.join(self._model_dir(name), f"{version}.json")
+
+    @contextmanager
+    def lock(self, name):
+        """Exclusive cross-process lock for one model (e.g. so only one worker retrains it)."""
+        os.makedirs(self._model_dir(name), exist_ok=True)
+        with open(os.path.join(self._model_dir(name), '.lock'), 'w') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def publish(self, name, booster, activate=True, metadata=None):
+        """
+        Stores a trained booster as a new version (and makes it current). Returns the version id.
+        An identical model to the current one is not stored again: its metadata is refreshed and
+        the current version returned, so CURRENT does not move.
+        """
+        model_str = booster.model_to_string()
+        digest = hashlib.sha1(model_str.encode()).hexdigest()[:8]
+        current = self.current_version(name)
+        if current is not None and current.endswith(f"-{digest}"):
+            _atomic_write(self._metadata_path(name, current), json.dumps(metadata or {}, sort_keys=True))
+            return current
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{digest}"
+        _atomic_write(self._metadata_path(name, version), json.dumps(metadata or {}, sort_keys=True))
+        _atomic_write(self.artifact_path(name, version), model_str)
+        if activate:
+            self.activate(name, version)
+        self.prune(name)
+        return version
+
+    def activate(self, name, version):
+        """Points CURRENT at an existing version (also used for rollbacks). Raises ValueError for anything else."""
+        # Checked before the version is used in a path: request bodies reach this via /builtin_models/activate
+        if not isinstance(version, str) or not self.VERSION_PATTERN.fullmatch(version) or version not in self.versions(name):
+            raise ValueError(f"Unknown version for {name}: {version}")
+        _atomic_write(self._pointer_path(name), version + '\n')
+
+    def prune(self, name, keep=None):
+        keep = self.KEEP_VERSIONS if keep is None else keep
+        current = self.current_version(name)
+        stale = [v for v in self.versions(name) if v != current]
+        for version in stale[:max(0, len(stale) - keep)]:
+            for path in (self.artifact_path(name, version), self._metadata_path(name, version)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
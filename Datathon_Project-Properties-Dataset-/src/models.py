@@ -1,14 +1,103 @@
+import hashlib
+import threading
 import pandas as pd
 import numpy as np
 import lightgbm as lgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.neighbors import KDTree
 from data_loader import UnifiedDataLoader
+from model_registry import ModelRegistry
+from analytics_engine import analytics_engine
+
+class SavedBoosterMixin:
+    """
+    One-time, thread-safe loading of a saved LightGBM booster, plus hot-swapping.
+    Concurrent first calls wait for a single load instead of each reading the model file;
+    afterwards the fast path is a plain attribute read. Boosters are only replaced whole
+    (train(), reload()), so a request keeps using the booster it started with.
+
+    The active artifact comes from the versioned ModelRegistry; model_file (the legacy,
+    unversioned dataset_*_model.txt) is only used until a version has been published.
+    """
+    model_file = None
+    registry_name = None
+    registry = ModelRegistry()
+    model_version = None
+
+    def _load_booster(self):
+        """Returns the booster, loading the current version on first use. Raises if it cannot be loaded."""
+        model = self.model
+        if model is None:
+            with self._load_lock:
+                if self.model is None:
+                    self.model, self.model_version = self._read_current()
+                model = self.model
+        return model
+
+    def _read_current(self):
+        version = self.registry.current_version(self.registry_name)
+        if version is None:
+            return lgb.Booster(model_file=self.model_file), 'legacy'
+        return lgb.Booster(model_file=self.registry.artifact_path(self.registry_name, version)), version
+
+    def reload(self):
+        """
+        Switches to the registry's current version if it differs from the loaded one.
+        Returns the active version. The new booster is fully loaded before the swap.
+        """
+        with self._load_lock:
+            current = self.registry.current_version(self.registry_name)
+            if self.model is not None and (current is None or current == self.model_version):
+                return self.model_version
+            model, version = self._read_current()
+            self.model, self.model_version = model, version
+            print(f"{self.registry_name} model now serving version {version}")
+            return version
+
+    def training_data(self, df):
+        """Rows and columns of the unified frame this model is trained on (overridden per model)."""
+        raise NotImplementedError
+
+    def training_fingerprint(self, df=None):
+        """Content hash of the training data; unchanged data means retraining would be a no-op."""
+        df = self.loader.load_unified_data() if df is None else df
+        rows = self.training_data(df)
+        hashed = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+        return hashlib.sha1(hashed.tobytes() + ','.join(rows.columns).encode()).hexdigest()[:16]
+
+    def retrain_if_needed(self):
+        """
+        Retrains only if the training data differs from what the current registry version was
+        trained on. The registry lock makes concurrent processes retrain once: the others wait,
+        then find the new fingerprint recorded and skip. Returns True if this call retrained.
+        """
+        fingerprint = self.training_fingerprint()
+        with self.registry.lock(self.registry_name):
+            if self.registry.metadata(self.registry_name).get('data_fingerprint') == fingerprint:
+                self.reload()
+                return False
+            self.train()
+            return True
+
+    def _publish(self, model):
+        """Stores a freshly trained booster as a new registry version and serves it."""
+        metadata = {'data_fingerprint': self.training_fingerprint()}
+        version = self.registry.publish(self.registry_name, model, metadata=metadata)
+        with self._load_lock:
+            self.model, self.model_version = model, version
+        print(f"{self.registry_name} model published as version {version}")
+        return version
+
+class PricingModel(SavedBoosterMixin):
+    model_file = 'dataset_price_model.txt'
+    registry_name = 'price'
 
-class PricingModel:
     def __init__(self):
         self.loader = UnifiedDataLoader()
         self.model = None
+        self._load_lock = threading.Lock()
+        self._index_lock = threading.Lock()
         self.features = ['country', 'location', 'bedrooms', 'bathrooms', 'area_sqm', 'property_type']
         
     def prepare_data(self):
@@ -60,11 +149,11 @@ class PricingModel:
             'verbose': -1
         }
         
-        self.model = lgb.train(params, train_data, num_boost_round=1000, valid_sets=[test_data], 
-                               callbacks=[lgb.early_stopping(stopping_rounds=50), lgb.log_evaluation(100)])
+        model = lgb.train(params, train_data, num_boost_round=1000, valid_sets=[test_data], 
+                          callbacks=[lgb.early_stopping(stopping_rounds=50), lgb.log_evaluation(100)])
         
         # Evaluation
-        y_pred = self.model.predict(X_test)
+        y_pred = model.predict(X_test)
         rmse = np.sqrt(mean_squared_error(y_test, y_pred))
         r2 = r2_score(y_test, y_pred)
         
@@ -72,9 +161,8 @@ class PricingModel:
         print(f"RMSE: ${rmse:.2f}")
         print(f"R2 Score: {r2:.4f}")
         
-        # Save model
-        self.model.save_model('dataset_price_model.txt')
-        print("Model saved to dataset_price_model.txt")
+        # Publish a new version; requests switch to it atomically
+        self._publish(model)
         
         return self.model, df
 
@@ -82,39 +170,156 @@ class PricingModel:
         """
         features: dict containing 'country', 'location', 'bedrooms', 'bathrooms', 'area_sqm', 'property_type'
         """
-        if self.model is None:
-            try:
-                self.model = lgb.Booster(model_file='dataset_price_model.txt')
-            except Exception:
-                print("Model not found. Please train first.")
-                return None
+        prices = self.predict_batch([features])
+        if prices is None:
+            return None
+        return prices[0]
+
+    def predict_batch(self, features):
+        """
+        Vectorized prediction: one booster call for many properties.
+        features: list of feature dicts (same keys as predict) or a DataFrame with those columns.
+        Returns a numpy array of USD prices in input order, or None if no model is available.
+        """
+        try:
+            model = self._load_booster()
+        except Exception:
+            print("Model not found. Please train first.")
+            return None
 
         # Create DataFrame from input features
-        input_df = pd.DataFrame([features])
-        
+        if isinstance(features, pd.DataFrame):
+            input_df = features.copy()
+        else:
+            input_df = pd.DataFrame(list(features))
+
         # Simple preprocessing matching training (in real prod, use a saved pipeline)
-        if not hasattr(self, 'location_freq'):
-            df = self.loader.load_unified_data()
-            sales_data = df[df['transaction_type'] == 'sale']
-            self.location_freq = sales_data['location'].value_counts(normalize=True)
-            
+        self._ensure_location_index()
         input_df['location_freq'] = input_df['location'].map(self.location_freq).fillna(0)
-        
+
         for col in ['country', 'property_type']:
             input_df[col] = input_df[col].astype('category')
-            
+
         X = input_df[['country', 'location_freq', 'bedrooms', 'bathrooms', 'area_sqm', 'property_type']]
-        return self.model.predict(X)[0]
+        return model.predict(X)
+
+    def training_data(self, df):
+        return df.loc[df['transaction_type'] == 'sale', self.features + ['price_usd']]
+
+    def _ensure_location_index(self):
+        """Builds the location frequency encoding and per-country location lists once (thread-safe)."""
+        if hasattr(self, 'location_freq'):
+            return
+        with self._index_lock:
+            if hasattr(self, 'location_freq'):
+                return
+            self.rebuild_location_index()
+
+    def rebuild_location_index(self):
+        """(Re)computes the location encodings from the current unified data."""
+        df = self.loader.load_unified_data()
+        sales_data = df[df['transaction_type'] == 'sale']
+        self.country_locations = {
+            country: sorted(group.dropna().unique().tolist())
+            for country, group in sales_data.groupby('country')['location']
+        }
+        # Assigned last: its presence is what marks the index as built
+        self.location_freq = sales_data['location'].value_counts(normalize=True)
+
+    def locations_for_country(self, country):
+        """All known sale locations for a country (case-insensitive), sorted."""
+        self._ensure_location_index()
+        for name, locations in self.country_locations.items():
+            if name.lower() == str(country).lower():
+                return name, locations
+        return country, []
+
+    def known_locations(self, countries=None):
+        """Every known sale location as {'country', 'location'} dicts, optionally limited to some countries."""
+        self._ensure_location_index()
+        wanted = {str(c).lower() for c in countries} if countries else None
+        return [
+            {'country': country, 'location': loc}
+            for country, locations in self.country_locations.items()
+            if wanted is None or country.lower() in wanted
+            for loc in locations
+        ]
+
+class ComparablesIndex:
+    """
+    Nearest real listings for a property spec.
+    One KD-tree per country over standardized (area, bedrooms, bathrooms, price/sqm),
+    built once at load time so each query is O(log n) in that country's listing count.
+    """
+    FEATURES = ['area_sqm', 'bedrooms', 'bathrooms', 'price_per_sqm']
+
+    def __init__(self):
+        self.loader = UnifiedDataLoader()
+        self.indexes = {}  # country -> {'tree', 'mean', 'std', 'fill', 'listings'}
+
+    def build(self):
+        df = self.loader.load_unified_data()
+        if df.empty:
+            self.indexes = {}
+            return
+        sales = df[(df['transaction_type'] == 'sale') & (df['price_usd'] > 0) & (df['area_sqm'] > 0)].copy()
+        sales['price_per_sqm'] = sales['price_usd'] / sales['area_sqm']
+
+        indexes = {}
+        for country, listings in sales.groupby('country'):
+            listings = listings.reset_index(drop=True)
+            # Missing room counts (e.g. Malaysia) fall back to the country median, or 0 if unknown
+            fill = listings[self.FEATURES].median().fillna(0)
+            X = listings[self.FEATURES].fillna(fill).to_numpy(dtype=float)
+            mean = X.mean(axis=0)
+            std = X.std(axis=0)
+            std[std == 0] = 1.0
+            indexes[country] = {
+                'tree': KDTree((X - mean) / std),
+                'mean': mean,
+                'std': std,
+                'fill': fill,
+                'listings': listings
+            }
+        self.indexes = indexes
+        print(f"Comparables index built for {len(indexes)} countries.")
+
+    def query(self, country, spec, k=10):
+        """
+        spec: dict with 'area_sqm', 'bedrooms', 'bathrooms', 'price_per_sqm' (missing values use the country fill).
+        Returns the k most similar listings with a 'distance' column, nearest first.
+        """
+        index = next((v for name, v in self.indexes.items() if name.lower() == str(country).lower()), None)
+        if index is None:
+            return pd.DataFrame()
+
+        point = np.array([
+            index['fill'][f] if spec.get(f) is None else float(spec[f]) for f in self.FEATURES
+        ])
+        k = max(1, min(int(k), len(index['listings'])))
+        dist, idx = index['tree'].query(((point - index['mean']) / index['std']).reshape(1, -1), k=k)
+
+        result = index['listings'].iloc[idx[0]].copy()
+        result['distance'] = dist[0]
+        return result
+
+class RentalModel(SavedBoosterMixin):
+    model_file = 'dataset_rent_model.txt'
+    registry_name = 'rent'
 
-class RentalModel:
     def __init__(self):
         self.loader = UnifiedDataLoader()
         self.model = None
+        self._load_lock = threading.Lock()
         # Approximate Rent Multipliers relative to Vietnam (Base)
         # Based on GDP/Capita and Market Maturity
         # Dynamic Yield Calculation (Data-Driven Base)
         self.median_yield = self.calculate_baseline_yield()
         
+    def training_data(self, df):
+        return df.loc[df['transaction_type'] == 'rent',
+                      ['country', 'location', 'bedrooms', 'bathrooms', 'area_sqm', 'property_type', 'price_usd']]
+
     def calculate_baseline_yield(self):
         """
         Calculates the median rental yield from the Vietnam dataset (Training Data).
@@ -176,28 +381,43 @@ class RentalModel:
             'verbose': -1
         }
         
-        self.model = lgb.train(params, train_data, num_boost_round=500)
-        self.model.save_model('dataset_rent_model.txt')
+        self._publish(lgb.train(params, train_data, num_boost_round=500))
         print("Rental Model Trained & Saved.")
 
     def predict(self, features):
-        if self.model is None:
-            try:
-                self.model = lgb.Booster(model_file='dataset_rent_model.txt')
-            except:
-                return None
+        rents = self.predict_batch([features])
+        if rents is None or np.isnan(rents[0]):
+            return None
+        return rents[0]
+
+    def predict_batch(self, features):
+        """
+        Monthly USD rent for many properties in one booster call.
+        features: list of feature dicts or a DataFrame. Returns an array in input order
+        (NaN where the country has no rental data), or None if no model is available.
+        """
+        try:
+            model = self._load_booster()
+        except:
+            return None
 
         # --- STRICT REAL-WORLD LOGIC ---
         # If we don't have rental data for this country, we DO NOT predict.
         # Transfer learning from Vietnam to Thailand is theoretically interesting but 
-        # heavily relies on assumptions. For a "Real Data" product, we return None.
+        # heavily relies on assumptions. For a "Real Data" product, we return NaN.
         
         # Currently we only have rental data for Vietnam.
-        if features['country'] != 'Vietnam':
-            return None
+        if isinstance(features, pd.DataFrame):
+            input_df = features.copy()
+        else:
+            input_df = pd.DataFrame(list(features))
+        supported = (input_df['country'] == 'Vietnam').to_numpy()
+        rents = np.full(len(input_df), np.nan)
+        if not supported.any():
+            return rents
 
         # Prepare Input
-        input_df = pd.DataFrame([features])
+        input_df = input_df[supported]
         
         # Mock freq for now (should load from file)
         input_df['location_freq'] = 0.01 
@@ -207,9 +427,10 @@ class RentalModel:
             
         X = input_df[['country', 'location_freq', 'bedrooms', 'bathrooms', 'area_sqm', 'property_type']]
         
-        return self.model.predict(X)[0]
+        rents[supported] = model.predict(X)
+        return rents
 
-class YieldCurveModel:
+class YieldCurveModel(SavedBoosterMixin):
     """
     Winning Logic: Market Proxy Modeling.
     Instead of predicting Rent directly (which varies wildly by currency/economy),
@@ -219,9 +440,17 @@ class YieldCurveModel:
     - Smaller units -> Higher Yield
     - Lower Price/Sqm -> Higher Yield
     """
+    model_file = 'dataset_yield_model.txt'
+    registry_name = 'yield'
+
     def __init__(self):
         self.loader = UnifiedDataLoader()
         self.model = None
+        self._load_lock = threading.Lock()
+
+    def training_data(self, df):
+        return df.loc[df['country'] == 'Vietnam',
+                      ['location', 'bedrooms', 'bathrooms', 'area_sqm', 'transaction_type', 'price_usd']]
         
     def train(self):
         print("Training Yield Curve Model...")
@@ -262,51 +491,64 @@ class YieldCurveModel:
             # Simple Regressor
             train_set = lgb.Dataset(X, label=y)
             params = {'objective': 'regression', 'metric': 'rmse', 'verbose': -1}
-            self.model = lgb.train(params, train_set, num_boost_round=300)
-            self.model.save_model('dataset_yield_model.txt')
+            self._publish(lgb.train(params, train_set, num_boost_round=300))
             print("Yield Curve Model Trained.")
             
     def predict_yield(self, features, predicted_price):
-        if self.model is None:
-            try:
-                self.model = lgb.Booster(model_file='dataset_yield_model.txt')
-            except:
-                return 0.05 # Conservative fallback
+        pred_yield = self.predict_yield_batch([features], [predicted_price])[0]
+        pp_sqm = predicted_price / features['area_sqm'] if features['area_sqm'] > 0 else 0
+        print(f"DEBUG: Yield Prediction - Input PP_SQM: {pp_sqm}, Pred Yield: {pred_yield}")
+        return pred_yield
+
+    def predict_yield_batch(self, features, predicted_prices):
+        """
+        Clamped yields for many properties in one booster call.
+        features: list of feature dicts or a DataFrame (area_sqm, bedrooms, bathrooms).
+        """
+        try:
+            model = self._load_booster()
+        except:
+            return np.full(len(predicted_prices), 0.05) # Conservative fallback
         
+        if isinstance(features, pd.DataFrame):
+            input_df = features
+        else:
+            input_df = pd.DataFrame(list(features))
+        area = input_df['area_sqm'].to_numpy(dtype=float)
+
         # Prepare Features
         # Price Per Sqm is the dominant factor
-        if features['area_sqm'] > 0:
-            pp_sqm = predicted_price / features['area_sqm']
-        else:
-            pp_sqm = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pp_sqm = np.where(area > 0, np.asarray(predicted_prices, dtype=float) / area, 0)
             
-        input_data = pd.DataFrame([{
+        input_data = pd.DataFrame({
             'price_per_sqm': pp_sqm,
-            'area_sqm': features['area_sqm'],
-            'bedrooms': features['bedrooms'],
-            'bathrooms': features['bathrooms']
-        }])
+            'area_sqm': area,
+            'bedrooms': input_df['bedrooms'].to_numpy(),
+            'bathrooms': input_df['bathrooms'].to_numpy()
+        })
         
-        pred_yield = self.model.predict(input_data)[0]
-        print(f"DEBUG: Yield Prediction - Input PP_SQM: {pp_sqm}, Pred Yield: {pred_yield}")
+        pred_yield = model.predict(input_data)
         
         # Safety clamp (2% to 10%)
         # If model outputs <= 0 (it happens with sparse data), force a minimum
-        if pred_yield <= 0.01: 
-             return 0.035 # Minimal viable yield (3.5%)
-             
-        return max(0.02, min(0.12, pred_yield))
+        # (Minimal viable yield: 3.5%)
+        return np.where(pred_yield <= 0.01, 0.035, np.clip(pred_yield, 0.02, 0.12))
 
 class GapScorer:
     def __init__(self):
         self.loader = UnifiedDataLoader()
+        self.engine = analytics_engine(self.loader)
         
-    def analyze_gap(self):
+    def analyze_gap(self, level='location'):
         """
         Identifies Supply/Demand Gaps.
         Gap Score = (Price_Growth_Potential * Yield_Potential) / Supply_Density
+        level: 'location', or a coarser LOCATION_LEVELS rollup (city/province)
         """
-        df = self.loader.load_unified_data()
+        if self.engine is not None:
+            return self._analyze_gap_sql(level)
+        df = self.loader.load_level_data(level)
         # Ensure we have valid price and area data to avoid NaNs
         sales = df[(df['transaction_type'] == 'sale') & (df['price_usd'] > 0) & (df['area_sqm'] > 0)].copy()
         
@@ -326,54 +568,121 @@ class GapScorer:
             median_price = group['price_usd'].median()
             median_pps = (group['price_usd'] / group['area_sqm']).median()
             supply_cnt = len(group)
+            results.append(self._gap_row(country, loc, median_price, median_pps, supply_cnt))
             
-            # Simplified Gap Logic:
-            # High Gap ~ (Low PPS) and (Healthy Supply)
-            
-            # Normalize PPS: Higher score for lower price per sqm
-            # We use log scaling or a capped factor to prevent division by zero or extreme outliers
-            value_potential = 10000 / (median_pps + 1)
-            
-            # Supply Multiplier: We WANT moderate to high supply for a "Market Gap" analysis
-            # because very low supply (1-2 units) is often just bad data.
-            # We use a Sigmoid-like scaling for supply
-            supply_factor = np.tanh(supply_cnt / 50) + 0.5 # 0.5 to 1.5 range
-            
-            gap_score = value_potential * supply_factor
-            
-            results.append({
-                'country': country,
-                'location': loc,
-                'gap_score': gap_score,
-                'supply': supply_cnt,
-                'avg_price': median_price
-            })
-            
         return pd.DataFrame(results).sort_values('gap_score', ascending=False)
 
+    def _analyze_gap_sql(self, level='location'):
+        """Same result as the pandas path; the per-location medians come from the SQL engine."""
+        results = []
+        stats = self.engine.gap_stats(level)
+        for country, loc, supply_cnt, median_price, median_pps in stats.itertuples(index=False):
+            clean_loc = str(loc).strip().lower()
+            if clean_loc == 'unknown' or clean_loc == '': continue
+            results.append(self._gap_row(country, loc, median_price, median_pps, int(supply_cnt)))
+        return pd.DataFrame(results).sort_values('gap_score', ascending=False)
+
+    @staticmethod
+    def _gap_row(country, loc, median_price, median_pps, supply_cnt):
+        # Simplified Gap Logic:
+        # High Gap ~ (Low PPS) and (Healthy Supply)
+        
+        # Normalize PPS: Higher score for lower price per sqm
+        # We use log scaling or a capped factor to prevent division by zero or extreme outliers
+        value_potential = 10000 / (median_pps + 1)
+        
+        # Supply Multiplier: We WANT moderate to high supply for a "Market Gap" analysis
+        # because very low supply (1-2 units) is often just bad data.
+        # We use a Sigmoid-like scaling for supply
+        supply_factor = np.tanh(supply_cnt / 50) + 0.5 # 0.5 to 1.5 range
+        
+        gap_score = value_potential * supply_factor
+        
+        return {
+            'country': country,
+            'location': loc,
+            'gap_score': gap_score,
+            'supply': supply_cnt,
+            'avg_price': median_price
+        }
+
+
+class HotspotFinder:
+    """
+    Emerging hotspots: locations with the lowest median price per sqm (value entry points).
+    """
+    def __init__(self):
+        self.loader = UnifiedDataLoader()
+        self.engine = analytics_engine(self.loader)
+
+    def find_hotspots(self, level='location'):
+        """
+        Returns per-location ['country', 'location', 'count', 'median'] price-per-sqm stats,
+        cheapest first, for locations with more than 5 listings after outlier removal.
+        level: 'location', or a coarser LOCATION_LEVELS rollup (city/province)
+        """
+        df = self.loader.load_level_data(level)
+        if df.empty:
+            return pd.DataFrame()
+        if self.engine is not None:
+            location_stats = self.engine.hotspot_stats(level)
+            location_stats = location_stats[location_stats['count'] > 5]  # Min 5 listings
+            return location_stats.sort_values('median')
+        sales = df[(df['transaction_type'] == 'sale') & (df['area_sqm'] > 0) & (df['price_usd'] > 0)].copy()
+        sales['price_per_sqm'] = sales['price_usd'] / sales['area_sqm']
+
+        # Filter outliers
+        sales = sales[sales['price_per_sqm'].between(
+            sales['price_per_sqm'].quantile(0.05),
+            sales['price_per_sqm'].quantile(0.95)
+        )]
+
+        # Group by location
+        location_stats = sales.groupby(['country', 'location'])['price_per_sqm'].agg(['count', 'median']).reset_index()
+        location_stats = location_stats[location_stats['count'] > 5]  # Min 5 listings
+
+        return location_stats.sort_values('median')
+
 
 class YieldAnalyzer:
     def __init__(self):
         self.loader = UnifiedDataLoader()
+        self.engine = analytics_engine(self.loader)
         self.proxy_model = YieldCurveModel()
-        self.proxy_model.train() # Ensure we have a baseline
+        # Ensure we have a baseline: serves the registry's current version and only trains (and
+        # publishes) when the Vietnam data has changed since it was trained, or nothing exists yet
+        self.proxy_model.retrain_if_needed()
         
-    def analyze_market(self, country_filter=None):
+    def analyze_market(self, country_filter=None, level='location'):
         """
-        Calculates Yield for all locations.
+        Calculates Yield for all locations (or cities/provinces, see LOCATION_LEVELS).
         Uses REAL yield if data exists, PROXY yield if not.
         """
         print(f"\n=== Market Rental Yield Analysis ({country_filter or 'All'}) ===")
-        df = self.loader.load_unified_data()
-        
-        if country_filter:
-            df = df[df['country'].str.lower() == country_filter.lower()].copy()
-            
-        if df.empty:
-            return pd.DataFrame()
+        if self.engine is not None:
+            # Aggregates from SQL (country filter pushed into the scan), pivoted exactly like the groupby/unstack below
+            medians = self.engine.yield_medians(country_filter, level)
+            if medians.empty:
+                return pd.DataFrame()
+            summary = medians.set_index(['country', 'location', 'transaction_type'])['price_usd'].unstack()
+            stats = self.engine.location_feature_medians(country_filter, level).set_index(['country', 'location'])
+        else:
+            df = self.loader.load_level_data(level)
             
-        # Group by location, country, and transaction_type
-        summary = df.groupby(['country', 'location', 'transaction_type'])['price_usd'].median().unstack()
+            if country_filter:
+                df = df[df['country'].str.lower() == country_filter.lower()].copy()
+                
+            if df.empty:
+                return pd.DataFrame()
+                
+            # Group by location, country, and transaction_type
+            summary = df.groupby(['country', 'location', 'transaction_type'])['price_usd'].median().unstack()
+            # We need median area for proxy model
+            stats = df.groupby(['country', 'location']).agg({
+                'area_sqm': 'median',
+                'bedrooms': 'median',
+                'bathrooms': 'median'
+            })
         
         # Fill missing columns if they don't exist in the slice
         if 'rent' not in summary.columns: summary['rent'] = np.nan
@@ -386,13 +695,6 @@ class YieldAnalyzer:
         # 2. Use PROXY logic for locations with ONLY sales data
         proxy_idx = summary[summary['annual_yield_pct'].isna() & summary['sale'].notna()].index
         
-        # We need median area for proxy model
-        stats = df.groupby(['country', 'location']).agg({
-            'area_sqm': 'median',
-            'bedrooms': 'median',
-            'bathrooms': 'median'
-        })
-        
         for idx in proxy_idx:
             try:
                 # country, location
@@ -419,7 +721,7 @@ class YieldAnalyzer:
         valid_yields = valid_yields.reset_index()
         valid_yields = valid_yields[(valid_yields['annual_yield_pct'] > 1) & (valid_yields['annual_yield_pct'] < 25)]
         valid_yields = valid_yields[valid_yields['location'].astype(str).str.lower().str.strip() != 'unknown']
-        valid_yields = valid_yields.sort_values('annual_yield_pct', ascending=False)
+        valid_yields = valid_yields.sort_values('annual_yield_pct', ascending=False, kind='stable')
         
         return valid_yields
 
@@ -449,13 +751,16 @@ class MEICalculator:
 
     def __init__(self):
         self.loader = UnifiedDataLoader()
+        self.engine = analytics_engine(self.loader)
 
-    def calculate_mei(self, country_filter=None):
+    def calculate_mei(self, country_filter=None, level='location'):
         """
-        Calculate MEI for all locations.
+        Calculate MEI for all locations (or cities/provinces, see LOCATION_LEVELS).
         Returns DataFrame ranked by MEI score (descending).
         """
-        df = self.loader.load_unified_data()
+        if self.engine is not None:
+            return self._calculate_mei_sql(country_filter, level)
+        df = self.loader.load_level_data(level)
         sales = df[
             (df['transaction_type'] == 'sale') &
             (df['price_usd'] > 0) &
@@ -502,7 +807,24 @@ class MEICalculator:
             axis=1
         )
         location_stats = location_stats.merge(country_agg[['country', 'country_avg_per_loc']], on='country', how='left')
+        return self._mei_scores(location_stats)
+
+    def _calculate_mei_sql(self, country_filter=None, level='location'):
+        """Same result as the pandas path; supply counts and medians come from the SQL engine."""
+        location_stats, country_agg = self.engine.mei_stats(country_filter, level)
+        # Only include locations with enough data
+        location_stats = location_stats[location_stats['supply_count'] >= 5]
+        if location_stats.empty:
+            return pd.DataFrame()
+        country_agg['country_avg_per_loc'] = [
+            total / max(locations, 1)
+            for total, locations in zip(country_agg['country_total'], country_agg['location_count'])
+        ]
+        location_stats = location_stats.merge(country_agg[['country', 'country_avg_per_loc']], on='country', how='left')
+        return self._mei_scores(location_stats)
 
+    @staticmethod
+    def _mei_scores(location_stats):
         # === Compute MEI Components ===
 
         # 1. Search Volume Index (SVI) proxy:
@@ -0,0 +1,160 @@
+import base64
+import json
+
+import numpy as np
+
+from response_encoder import columnar, dumps, frame_columns, records
+
+
+def top_k_indices(values, k, descending=False):
+    """
+    Indices of the k smallest (or largest) values in order, ties broken by position.
+    O(n + k log k): np.partition finds the cut, only the k winners are sorted.
+    NaN always ranks last.
+    """
+    keys = np.asarray(values, dtype=float)
+    keys = -keys if descending else keys.copy()
+    keys[np.isnan(keys)] = np.inf
+    n = len(keys)
+    k = max(0, min(int(k), n))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    if k == n:
+        return np.lexsort((np.arange(n), keys))
+
+    kth = np.partition(keys, k - 1)[k - 1]
+    better = np.flatnonzero(keys < kth)
+    ties = np.flatnonzero(keys == kth)[:k - len(better)]
+    candidates = np.concatenate([better, ties])
+    return candidates[np.lexsort((candidates, keys[candidates]))]
+
+
+def _encode_state(state):
+    raw = json.dumps(state, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_state(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+
+def encode_cursor(offset, sort=None, version=None):
+    return _encode_state({'o': int(offset), 's': sort, 'v': version})
+
+
+def decode_cursor(cursor):
+    """Returns (offset, sort, version). Raises ValueError on a malformed cursor."""
+    try:
+        state = _decode_state(cursor)
+        return int(state['o']), state.get('s'), state.get('v')
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def encode_keyset_cursor(after, sort=None, version=None):
+    """Cursor for keyset pagination: `after` is the (sort value, id) of the last row served."""
+    return _encode_state({'k': list(after), 's': sort, 'v': version})
+
+
+def decode_keyset_cursor(cursor):
+    """Returns (after, sort, version). Raises ValueError on a malformed cursor."""
+    try:
+        state = _decode_state(cursor)
+        value, row_id = state['k']
+        return (float(value), int(row_id)), state.get('s'), state.get('v')
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+class ResultSet:
+    """
+    One scanner response held in serving form.
+    Keeps the columns as lists (numeric ones also as arrays for top-k selection), the full
+    pre-serialized body, and one pre-serialized JSON line per row, so a page costs
+    O(n + k log k) selection plus concatenating k byte strings.
+    """
+
+    def __init__(self, meta, columns, lines=None):
+        self.meta = dict(meta)
+        self.columns = columns
+        self.version = None
+        self.lines = lines if lines is not None else [dumps(row) for row in records(columns)]
+        self.body = _splice(dumps(self.meta), b'"data"', b'[' + b','.join(self.lines) + b']')
+        self._arrays = {}
+        self._columnar_body = None
+
+    @classmethod
+    def from_frame(cls, meta, df, fields):
+        """Builds straight from DataFrame columns (see response_encoder.frame_columns)."""
+        if df is None or df.empty:
+            return cls(meta, {f[0]: [] for f in fields})
+        return cls(meta, frame_columns(df, fields))
+
+    def subset(self, indices, meta=None):
+        """ResultSet of the given rows in order, reusing their serialized lines (nothing re-encoded)."""
+        columns = {name: [values[i] for i in indices] for name, values in self.columns.items()}
+        result = ResultSet(self.meta if meta is None else meta, columns, [self.lines[i] for i in indices])
+        result.version = self.version
+        return result
+
+    def __len__(self):
+        return len(self.lines)
+
+    def sortable_fields(self):
+        """Numeric columns, judged by their first non-null value (optional fields can start with None)."""
+        fields = []
+        for name, values in self.columns.items():
+            first = next((v for v in values if v is not None), None)
+            if isinstance(first, (int, float)) and not isinstance(first, bool):
+                fields.append(name)
+        return sorted(fields)
+
+    def column(self, field):
+        if field not in self._arrays:
+            if field not in self.sortable_fields():
+                raise ValueError(f"Cannot sort by '{field}'. Sortable fields: {self.sortable_fields()}")
+            self._arrays[field] = np.array(
+                [np.nan if v is None else v for v in self.columns[field]], dtype=float
+            )
+        return self._arrays[field]
+
+    def select(self, sort=None, offset=0, limit=None):
+        """
+        Row indices for one page.
+        sort: field name, '-field' for descending; None keeps the analysis order.
+        """
+        n = len(self)
+        stop = n if limit is None else min(n, offset + limit)
+        if offset >= stop:
+            return np.empty(0, dtype=np.int64)
+        if not sort:
+            return np.arange(offset, stop)
+        descending = sort.startswith('-')
+        ranked = top_k_indices(self.column(sort.lstrip('-')), stop, descending=descending)
+        return ranked[offset:stop]
+
+    def columnar_body(self):
+        """Full response in {'columns': [...], 'data': [[...]]} form (built once on demand)."""
+        if self._columnar_body is None:
+            self._columnar_body = dumps({**self.meta, **columnar(self.columns)})
+        return self._columnar_body
+
+    def page_body(self, indices, extra=None, orient='records'):
+        """JSON body for a page: meta + extra fields, with rows from the pre-serialized lines."""
+        head = dict(self.meta)
+        head.update(extra or {})
+        if orient == 'columnar':
+            return dumps({**head, **columnar(self.columns, indices)})
+        return _splice(dumps(head), b'"data"', b'[' + b','.join(self.lines[i] for i in indices) + b']')
+
+    def ndjson(self, indices):
+        for i in indices:
+            yield self.lines[i] + b'\n'
+
+
+def _splice(object_bytes, key, value_bytes):
+    """Appends '"key": value' to an already serialized JSON object."""
+    if object_bytes.rstrip() == b'{}':
+        return b'{' + key + b':' + value_bytes + b'}'
+    return object_bytes.rstrip()[:-1] + b',' + key + b':' + value_bytes + b'}'
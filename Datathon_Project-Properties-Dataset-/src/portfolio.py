@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+from data_loader import UnifiedDataLoader
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: CSV output works without it
+    pa = None
+
+REQUIRED_FIELDS = ['country', 'location', 'bedrooms', 'bathrooms', 'area_sqm', 'property_type']
+NUMERIC_FIELDS = ['bedrooms', 'bathrooms', 'area_sqm']
+
+LOCAL_CURRENCY = UnifiedDataLoader.COUNTRY_CURRENCY
+
+# Output columns after the input fields (in this order, also the Parquet schema)
+RESULT_COLUMNS = [
+    ('row', 'int64'),
+    ('predicted_price_usd', 'float64'),
+    ('predicted_price_local', 'float64'),
+    ('currency_local', 'string'),
+    ('estimated_monthly_rent_usd', 'float64'),
+    ('estimated_monthly_rent_local', 'float64'),
+    ('gross_yield', 'float64'),
+    ('prediction_method', 'string'),
+    ('error', 'string')
+]
+
+
+class PortfolioValuer:
+    """
+    Values a portfolio chunk by chunk with the same rules as /predict_price (historical rent
+    when it gives a 1-15% yield, else the yield curve model), but with one booster call per
+    model per chunk instead of one request per property.
+    """
+
+    def __init__(self, price_model, rent_model, yield_model):
+        self.price_model = price_model
+        self.rent_model = rent_model
+        self.yield_model = yield_model
+
+    def value(self, chunk, first_row=0):
+        """Returns the valued chunk: the input fields plus RESULT_COLUMNS. Invalid rows get an error and no values."""
+        out = pd.DataFrame({field: chunk[field] for field in REQUIRED_FIELDS})
+        for field in NUMERIC_FIELDS:
+            out[field] = pd.to_numeric(out[field], errors='coerce')
+        for field in ('country', 'location', 'property_type'):
+            out[field] = out[field].where(out[field].isna(), out[field].astype(str))
+        n = len(out)
+        out.insert(0, 'row', np.arange(first_row, first_row + n))
+
+        valid = out[REQUIRED_FIELDS].notna().all(axis=1).to_numpy()
+        price = np.full(n, np.nan)
+        rent = np.full(n, np.nan)
+        yields = np.full(n, np.nan)
+        method = np.full(n, None, dtype=object)
+
+        if valid.any():
+            features = out.loc[valid, REQUIRED_FIELDS]
+            valid_price = self.price_model.predict_batch(features)
+            if valid_price is None:
+                raise RuntimeError('Price model unavailable')
+            raw_rent = self.rent_model.predict_batch(features)
+            if raw_rent is None:
+                raw_rent = np.full(len(features), np.nan)
+
+            # Sanity Check: historical rent must imply a yield between 1% and 15%
+            with np.errstate(divide='ignore', invalid='ignore'):
+                implied = np.where((raw_rent > 0) & (valid_price > 0), raw_rent * 12 / valid_price, 0)
+            historical = (raw_rent > 0) & (implied > 0.01) & (implied < 0.15)
+
+            valid_rent = np.where(historical, raw_rent, np.nan)
+            valid_method = np.full(len(features), 'Historical Data', dtype=object)
+            if (~historical).any():
+                modelled = self.yield_model.predict_yield_batch(features[~historical], valid_price[~historical])
+                valid_rent[~historical] = valid_price[~historical] * modelled / 12
+                valid_method[~historical] = [f"Yield Model ({y:.1%})" for y in modelled]
+
+            price[valid] = valid_price
+            rent[valid] = valid_rent
+            with np.errstate(divide='ignore', invalid='ignore'):
+                yields[valid] = np.where(valid_price > 0, valid_rent * 12 / valid_price, np.nan)
+            method[valid] = valid_method
+
+        # Currency Logic
+        rates = self.price_model.loader.exchange_rates
+        currency = out['country'].map(LOCAL_CURRENCY).fillna('USD')
+        local_rate = 1.0 / currency.map(lambda code: rates.get(code, 1.0)).to_numpy(dtype=float)
+
+        out['predicted_price_usd'] = price
+        out['predicted_price_local'] = price * local_rate
+        out['currency_local'] = currency.to_numpy()
+        out['estimated_monthly_rent_usd'] = rent
+        out['estimated_monthly_rent_local'] = rent * local_rate
+        out['gross_yield'] = yields
+        out['prediction_method'] = method
+        out['error'] = np.where(valid, None, 'Missing or invalid fields')
+        return out
+
+
+def check_columns(columns):
+    """Raises ValueError naming the required fields missing from an uploaded header."""
+    missing = [field for field in REQUIRED_FIELDS if field not in columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+
+
+def csv_stream(frames):
+    """Yields CSV bytes chunk by chunk: the header once, then the rows of each frame."""
+    for i, frame in enumerate(frames):
+        yield frame.to_csv(index=False, header=(i == 0)).encode('utf-8')
+
+
+class _ByteSink:
+    """Write-only file object collecting what ParquetWriter emits so it can be yielded as it is produced."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_available():
+    return pa is not None
+
+
+def parquet_schema():
+    fields = [pa.field(name, pa.string()) for name in ('country', 'location', 'property_type')]
+    fields += [pa.field(name, pa.float64()) for name in NUMERIC_FIELDS]
+    fields += [pa.field(name, pa.int64() if kind == 'int64' else pa.float64() if kind == 'float64' else pa.string())
+               for name, kind in RESULT_COLUMNS]
+    return pa.schema(fields)
+
+
+def parquet_stream(frames):
+    """Yields a Parquet file as it is written: one row group per frame, the footer last."""
+    if pa is None:
+        raise RuntimeError('Parquet output requires pyarrow')
+    schema = parquet_schema()
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    for frame in frames:
+        writer.write_table(pa.Table.from_pandas(frame[schema.names], schema=schema, preserve_index=False))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,353 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (KLL): level h holds sorted-sample items of weight 2**h.
+    A level over its capacity is compacted: sorted, every other item (random offset) promoted to
+    the next level. Capacities shrink geometrically below the top level, so a sketch keeps
+    O(k) items whatever the stream length, with rank error around 1.7/k. Until a sketch has seen
+    more than k values nothing is compacted and every answer is exact.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+        self._capacities = [k]
+
+    def _grow(self):
+        """Adds a top level; capacities shrink by 2/3 per level below the top."""
+        self.levels.append(np.empty(0))
+        top = len(self.levels) - 1
+        self._capacities = [max(2, int(np.ceil(self.k * (2 / 3) ** (top - level)))) for level in range(top + 1)]
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacities[level]:
+                if level + 1 == len(self.levels):
+                    self._grow()
+                items = np.sort(items)
+                keep = items[len(items) - len(items) % 2:]  # An odd item out stays on this level
+                promoted = items[int(self._rng.integers(2)):len(items) - len(items) % 2:2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                level = 0  # A new top level shrinks the capacities below it: recheck from the bottom
+                continue
+            level += 1
+
+    def update(self, values):
+        """Adds a batch of values (NaN skipped)."""
+        values = np.asarray(values, dtype=float)
+        return self._extend(values[~np.isnan(values)])
+
+    def _extend(self, values):
+        """update() for a float array known to hold no NaN."""
+        if len(values):
+            self.n += len(values)
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            if len(self.levels[0]) > self._capacities[0]:  # Only level 0 changed: nothing to do below capacity
+                self._compress()
+        return self
+
+    def merge(self, other):
+        """Folds another sketch (e.g. from another partition or worker) into this one."""
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def copy(self):
+        """Independent clone with a fresh (fixed-seed) compaction RNG: copying leaves this sketch untouched,
+        so rollups of a reused sketch come out the same as of a newly ingested one."""
+        clone = KLLSketch(self.k)
+        clone.n = self.n
+        clone.levels = [items.copy() for items in self.levels]
+        clone._capacities = list(self._capacities)
+        return clone
+
+    def weighted_items(self, low=None, high=None):
+        """(sorted values, weights), optionally only values within [low, high]."""
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        if low is not None:
+            inside = (values >= low) & (values <= high)
+            values, weights = values[inside], weights[inside]
+        order = np.argsort(values, kind='stable')
+        return values[order], weights[order]
+
+    def count(self, low=None, high=None):
+        """Number of values seen (estimated within [low, high] when given)."""
+        if low is None:
+            return self.n
+        return int(round(self.weighted_items(low, high)[1].sum()))
+
+    def quantiles(self, qs, low=None, high=None):
+        """
+        Quantiles with the same linear interpolation as pandas/numpy (each item standing for
+        `weight` equal values), optionally of the values within [low, high]. NaN when empty.
+        """
+        values, weights = self.weighted_items(low, high)
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+        if not len(values):
+            return np.full(len(qs), np.nan)
+        last_rank = np.cumsum(weights) - 1  # 0-based rank of each item's last copy
+        position = qs * (weights.sum() - 1)
+        lower = np.searchsorted(last_rank, np.floor(position))
+        upper = np.searchsorted(last_rank, np.ceil(position))
+        return values[lower] + (values[upper] - values[lower]) * (position - np.floor(position))
+
+    def quantile(self, q, low=None, high=None):
+        return float(self.quantiles([q], low, high)[0])
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'levels': [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['k'])
+        sketch.n = state['n']
+        for _ in state['levels'][1:]:
+            sketch._grow()
+        sketch.levels = [np.asarray(items, dtype=float) for items in state['levels']]
+        return sketch
+
+
+class MarketSketches:
+    """
+    One KLLSketch per (country, location) and metric, fed batch by batch from listing frames:
+    - sale_pps / sale_price: price per sqm and price of sales with a positive price and area
+    - price:<transaction_type>: listing price
+    - area_sqm, bedrooms, bathrooms: all listings
+    Keys may hold None for a missing country/location (those rows still count toward global cuts).
+    """
+
+    FEATURES = ('area_sqm', 'bedrooms', 'bathrooms')
+
+    def __init__(self, k=200):
+        self.k = k
+        self.sketches = {}  # (country, location) -> {metric: KLLSketch}
+
+    def _sketch(self, key, metric):
+        metrics = self.sketches.setdefault(key, {})
+        if metric not in metrics:
+            metrics[metric] = KLLSketch(self.k)
+        return metrics[metric]
+
+    def _update_metric(self, keys, codes, metric, values, mask):
+        """One sketch update per group: rows sorted by group code and split at the boundaries."""
+        with np.errstate(invalid='ignore'):
+            rows = np.flatnonzero(mask & ~np.isnan(values))
+        if not len(rows):
+            return
+        rows = rows[np.argsort(codes[rows], kind='stable')]
+        sorted_values, sorted_codes = values[rows], codes[rows]
+        bounds = np.r_[0, np.flatnonzero(np.diff(sorted_codes)) + 1, len(rows)]
+        for begin, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            self._sketch(keys[sorted_codes[begin]], metric)._extend(sorted_values[begin:end])
+
+    def update(self, frame):
+        """Adds a batch of unified-schema listings."""
+        if frame.empty:
+            return self
+        grouped = frame.groupby(['country', 'location'], sort=False, dropna=False)
+        codes = grouped.ngroup().to_numpy()
+        keys = [tuple(None if pd.isna(part) else part for part in key) for key in grouped.size().index]  # ngroup() order
+        price = frame['price_usd'].to_numpy(dtype=float)
+        area = frame['area_sqm'].to_numpy(dtype=float)
+        transaction = frame['transaction_type'].to_numpy()
+        with np.errstate(invalid='ignore'):
+            valid_sale = (transaction == 'sale') & (price > 0) & (area > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._update_metric(keys, codes, 'sale_pps', price / area, valid_sale)
+        self._update_metric(keys, codes, 'sale_price', price, valid_sale)
+        for kind in pd.unique(transaction[pd.notna(transaction)]):
+            self._update_metric(keys, codes, f'price:{kind}', price, transaction == kind)
+        for feature in self.FEATURES:
+            values = frame[feature].to_numpy(dtype=float)
+            self._update_metric(keys, codes, feature, values, ~np.isnan(values))
+        return self
+
+    def merge(self, other, key_map=None):
+        """Folds another set in (from another partition or worker); key_map renames its keys first (rollups)."""
+        for key, metrics in other.sketches.items():
+            target = key_map.get(key, key) if key_map is not None else key
+            for metric, sketch in metrics.items():
+                current = self.sketches.setdefault(target, {}).get(metric)
+                if current is None:
+                    self.sketches[target][metric] = sketch.copy()
+                else:
+                    current.merge(sketch)
+        return self
+
+    def combined(self, metric, keys=None):
+        """One sketch of `metric` merged over the given keys (default: all)."""
+        total = KLLSketch(self.k)
+        for key in (self.sketches if keys is None else keys):
+            sketch = self.sketches[key].get(metric)
+            if sketch is not None:
+                total.merge(sketch)
+        return total
+
+    def located_keys(self, country_filter=None):
+        """Keys with a known country and location (optionally one country), sorted."""
+        keys = [key for key in self.sketches if key[0] is not None and key[1] is not None]
+        if country_filter:
+            keys = [key for key in keys if str(key[0]).lower() == country_filter.lower()]
+        return sorted(keys)
+
+
+class SketchEngine:
+    """
+    Answers the scanner aggregations (gap, hotspots, yields, MEI) from MarketSketches instead of
+    the full listing columns: the same frames as DuckDBEngine, so the analyzers are unchanged.
+
+    Sketches are built by refresh(), which the ingestion path runs when the data changes (the
+    scanner snapshot build); queries only read the latest set. Location-level sketches are kept
+    per market (country) and ingested in INGEST_CHUNK_ROWS batches, so a refresh re-ingests only
+    the markets whose source files changed and reuses the others' sketches from the previous
+    version. City/province sketches are merged from them along the location hierarchy, and
+    global or per-country cuts merge the per-location sketches. Counts and medians are exact for
+    any group of up to SKETCH_K values; above that they carry the sketch's rank error.
+    """
+
+    def __init__(self, loader, k=None, chunk_rows=None):
+        self.loader = loader
+        self.k = k or int(os.environ.get('SKETCH_K', 400))
+        self.chunk_rows = chunk_rows or int(os.environ.get('INGEST_CHUNK_ROWS', 500000))
+        self._cache = (None, {})  # (data_version, {level: MarketSketches})
+        self._markets = {}  # country -> (its source files' fingerprint, location-level MarketSketches)
+        self._lock = threading.Lock()
+
+    def ingest(self, frame):
+        """Location-level sketches for a listing frame, streamed in chunks."""
+        sketches = MarketSketches(self.k)
+        for begin in range(0, len(frame), self.chunk_rows):
+            sketches.update(frame.iloc[begin:begin + self.chunk_rows])
+        return sketches
+
+    def refresh(self):
+        """
+        Brings the sketches up to the current data version. Markets whose source files are
+        unchanged keep their sketches; only the others' rows are ingested again. Returns the
+        number of markets re-ingested.
+        """
+        with self._lock:
+            version = self.loader.data_version()
+            if self._cache[0] == version:
+                return 0
+            frame = self.loader.load_unified_data()
+            stamps = self.loader.market_versions()
+            countries = frame['country'].to_numpy() if not frame.empty else np.empty(0, dtype=object)
+            present = pd.unique(countries)
+            markets, changed = {}, 0
+            for country in present:
+                # Rows without a known market are re-ingested on every data change
+                stamp = stamps.get(country, version) if not pd.isna(country) else version
+                key = None if pd.isna(country) else country
+                previous = self._markets.get(key)
+                if previous is not None and previous[0] == stamp:
+                    markets[key] = previous
+                    continue
+                rows = pd.isna(countries) if key is None else countries == country
+                markets[key] = (stamp, self.ingest(frame[rows]))
+                changed += 1
+
+            # Keys are (country, location), so the markets' sketch sets never overlap
+            location = MarketSketches(self.k)
+            for _, sketches in markets.values():
+                location.sketches.update(sketches.sketches)
+            levels = {'location': location}
+            hierarchy = self.loader.location_hierarchy()
+            for level in self.loader.LOCATION_LEVELS[1:]:
+                key_map = dict(zip(zip(hierarchy['country'], hierarchy['location']),
+                                   zip(hierarchy['country'], hierarchy[level])))
+                levels[level] = MarketSketches(self.k).merge(location, key_map)
+            self._markets = markets
+            self._cache = (version, levels)
+            print(f"Sketches refreshed for data version {version}: {changed} of {len(markets)} markets ingested")
+            return changed
+
+    def sketches(self, level='location'):
+        """The latest sketches for a level. Built here only on first use; afterwards refresh() keeps them current."""
+        levels = self._cache[1]
+        if not levels:
+            self.refresh()
+            levels = self._cache[1]
+        return levels[level]
+
+    def gap_stats(self, level='location'):
+        sketches = self.sketches(level)
+        rows = []
+        for key in sketches.located_keys():
+            pps = sketches.sketches[key].get('sale_pps')
+            if pps is not None and pps.n >= 5:
+                rows.append((*key, pps.n, sketches.sketches[key]['sale_price'].quantile(0.5), pps.quantile(0.5)))
+        return pd.DataFrame(rows, columns=['country', 'location', 'supply', 'median_price', 'median_pps'])
+
+    @staticmethod
+    def _cut_stats(sketches, keys, low, high):
+        """(key, count, median) of sale price/sqm within [low, high], for keys with values in the cut."""
+        stats = []
+        for key in keys:
+            pps = sketches.sketches[key].get('sale_pps')
+            if pps is None:
+                continue
+            count = pps.count(low, high)
+            if count > 0:
+                stats.append((key, count, pps.quantile(0.5, low, high)))
+        return stats
+
+    def hotspot_stats(self, level='location'):
+        sketches = self.sketches(level)
+        low, high = sketches.combined('sale_pps').quantiles([0.05, 0.95])
+        rows = [(*key, count, median) for key, count, median in self._cut_stats(sketches, sketches.located_keys(), low, high)]
+        return pd.DataFrame(rows, columns=['country', 'location', 'count', 'median'])
+
+    def yield_medians(self, country_filter=None, level='location'):
+        sketches = self.sketches(level)
+        rows = []
+        for key in sketches.located_keys(country_filter):
+            for metric, sketch in sorted(sketches.sketches[key].items()):
+                if metric.startswith('price:'):
+                    rows.append((*key, metric[len('price:'):], sketch.quantile(0.5)))
+        return pd.DataFrame(rows, columns=['country', 'location', 'transaction_type', 'price_usd'])
+
+    def location_feature_medians(self, country_filter=None, level='location'):
+        sketches = self.sketches(level)
+        rows = []
+        for key in sketches.located_keys(country_filter):
+            metrics = sketches.sketches[key]
+            rows.append((*key, *(metrics[f].quantile(0.5) if f in metrics else np.nan for f in MarketSketches.FEATURES)))
+        return pd.DataFrame(rows, columns=['country', 'location', *MarketSketches.FEATURES])
+
+    def mei_stats(self, country_filter=None, level='location'):
+        sketches = self.sketches(level)
+        keys = list(sketches.sketches)
+        if country_filter:
+            keys = [key for key in keys if key[0] is not None and str(key[0]).lower() == country_filter.lower()]
+        low, high = sketches.combined('sale_pps', keys).quantiles([0.05, 0.95])
+        stats = self._cut_stats(sketches, keys, low, high)
+        located = [(key, count, median) for key, count, median in stats if key[1] is not None]
+        locations = pd.DataFrame(
+            sorted((*key, count, median) for key, count, median in located if key[0] is not None),
+            columns=['country', 'location', 'supply_count', 'median_pps'])
+        totals = {}
+        for key, count, _ in stats:
+            if key[0] is not None:
+                total = totals.setdefault(key[0], [0, 0])
+                total[0] += count
+                total[1] += 0 if key[1] is None else 1
+        countries = pd.DataFrame(sorted((country, total, n) for country, (total, n) in totals.items()),
+                                 columns=['country', 'country_total', 'location_count'])
+        return locations, countries
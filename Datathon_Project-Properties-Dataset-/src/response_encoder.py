@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib encoder
+    orjson = None
+
+
+def dumps(obj):
+    """JSON bytes with sorted keys (same key order as Flask's jsonify). Uses orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, default=_numpy_default).encode('utf-8')
+
+
+def _numpy_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def frame_columns(df, fields):
+    """
+    Converts a DataFrame to {output_name: list} column by column (no iterrows).
+    fields: list of (output_name, source_column, kind[, round_digits]) where kind is
+        'raw'    - values as-is
+        'rawn'   - values as-is, missing values as null
+        'float'  - float
+        'float0' - float with missing values as 0
+        'floatn' - float with missing values as null
+        'int'    - int64
+    """
+    columns = {}
+    for field in fields:
+        name, source, kind = field[:3]
+        values = df[source]
+        if kind in ('float', 'float0', 'floatn'):
+            values = values.astype(float)
+            if len(field) > 3:
+                values = values.round(field[3])
+            if kind == 'float0':
+                values = values.fillna(0.0)
+        elif kind == 'int':
+            values = values.astype('int64')
+        if kind in ('rawn', 'floatn'):
+            values = values.astype(object).where(values.notna(), None)
+        columns[name] = values.tolist()
+    return columns
+
+
+def records(columns):
+    """Row dicts from column lists."""
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def columnar(columns, indices=None):
+    """Compact {'columns': [...], 'data': [[...], ...]} form, optionally for a subset of rows."""
+    names = list(columns)
+    lists = list(columns.values())
+    if indices is None:
+        rows = [list(values) for values in zip(*lists)]
+    else:
+        rows = [[col[i] for col in lists] for i in indices]
+    return {'columns': names, 'data': rows}
+
@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Default scenario assumptions (annual rates); any of them can be overridden per request
+DEFAULT_ASSUMPTIONS = {
+    'horizon_years': 10,
+    'vacancy_mean': 0.08,          # Share of the year a unit sits empty (Beta distributed)
+    'vacancy_concentration': 20.0,  # Beta a + b: higher = less dispersion around the mean
+    'rent_growth_mean': 0.03,
+    'rent_growth_vol': 0.02,
+    'appreciation_mean': 0.03,
+    'appreciation_vol': 0.08,
+    'fx_drift': 0.0,               # Local currency vs USD, log drift per year
+    'fx_vol': None,                # None: per-currency default from FX_VOLATILITY
+    'operating_cost_pct': 0.20,    # Share of collected rent
+    'selling_cost_pct': 0.03       # Share of the exit price
+}
+
+# Annual volatility of each local currency against USD
+FX_VOLATILITY = {'THB': 0.07, 'PHP': 0.06, 'MYR': 0.07, 'VND': 0.04, 'USD': 0.0}
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+# Paths are simulated in blocks of about this many (year, path) cells, so a location's working
+# arrays stay around 100 MB whatever the path count and horizon; only per-path IRR/ROI are kept
+BLOCK_CELLS = int(os.environ.get('SIMULATION_BLOCK_CELLS', 1000000))
+
+
+def location_seed(seed, country, location):
+    """Seed sequence for one location: the same (seed, location) gives the same paths in any request or process."""
+    return np.random.SeedSequence([int(seed), zlib.crc32(f"{country}|{location}".encode())])
+
+
+def irr(cash_flows, iterations=50, tol=1e-12):
+    """
+    Per-path IRR for a (periods + 1, paths) cash flow matrix whose first row is the outlay.
+    Vectorized Newton on the discount factor d = 1 / (1 + r), with the NPV polynomial and its
+    derivative evaluated by Horner's rule (one pass over the periods, no powers).
+    NaN where it does not converge.
+    """
+    horizon = len(cash_flows) - 1
+    roi = cash_flows[1:].sum(axis=0) / -cash_flows[0]
+    guess = np.clip(np.nan_to_num(np.abs(1 + roi) ** (1.0 / horizon) - 1), -0.5, 1.0)  # Annualized ROI
+    d = 1 / (1 + guess)
+
+    def npv(d):
+        value, slope = cash_flows[-1].copy(), np.zeros_like(d)
+        for c in cash_flows[-2::-1]:
+            slope *= d
+            slope += value
+            value *= d
+            value += c
+        return value, slope
+
+    for _ in range(iterations):
+        value, slope = npv(d)
+        step = np.divide(value, slope, out=np.zeros_like(value), where=slope != 0)
+        d = np.clip(d - step, 1e-6, 100.0)
+        if np.max(np.abs(step)) < tol:
+            break
+    converged = np.abs(npv(d)[0]) < 1e-8
+    return np.where(converged, 1 / d - 1, np.nan)
+
+
+def _simulate_paths(rng, gross_yield, a, fx_vol, years, n):
+    """ROI and IRR of n paths (one block)."""
+    k = a['vacancy_concentration']
+    vacancy = rng.beta(a['vacancy_mean'] * k, (1 - a['vacancy_mean']) * k, size=(years, n))
+    rent_growth = rng.normal(a['rent_growth_mean'], a['rent_growth_vol'], size=(years, n))
+    appreciation = rng.normal(a['appreciation_mean'], a['appreciation_vol'], size=(years, n))
+    fx_steps = rng.normal(a['fx_drift'] - fx_vol ** 2 / 2, fx_vol, size=(years, n))
+
+    # Rent index: year 1 earns the current yield, growth compounds from year 2
+    rent_growth[0] = 0.0
+    rent_index = np.cumprod(1 + rent_growth, axis=0)
+    fx = np.exp(np.cumsum(fx_steps, axis=0))  # USD value of one unit of local currency, relative to t0
+    value = np.prod(np.maximum(1 + appreciation, 0), axis=0)  # Exit price relative to entry
+
+    cash_flows = np.empty((years + 1, n))
+    cash_flows[0] = -1.0
+    cash_flows[1:] = gross_yield * (1 - a['operating_cost_pct']) * rent_index * (1 - vacancy) * fx
+    cash_flows[-1] += value * (1 - a['selling_cost_pct']) * fx[-1]
+
+    return cash_flows[1:].sum(axis=0) - 1.0, irr(cash_flows)
+
+
+def simulate_location(task):
+    """
+    Simulates one location. task: dict with country, location, currency, price_usd, gross_yield,
+    paths, seed and the assumptions. Cash flows are in USD per 1 USD invested at t0 (IRR and ROI
+    do not depend on the price level), converted at a simulated FX path each year.
+    Arrays are (years, paths) so every per-year step works on contiguous rows; paths run in
+    blocks of BLOCK_CELLS / years. Returns the percentile bands and summary stats.
+    """
+    a = task['assumptions']
+    n, years = int(task['paths']), int(a['horizon_years'])
+    rng = np.random.default_rng(location_seed(task['seed'], task['country'], task['location']))
+    fx_vol = a['fx_vol'] if a['fx_vol'] is not None else FX_VOLATILITY.get(task['currency'], 0.05)
+
+    block = max(1, BLOCK_CELLS // years)
+    roi, rates = np.empty(n), np.empty(n)
+    for begin in range(0, n, block):
+        end = min(n, begin + block)
+        roi[begin:end], rates[begin:end] = _simulate_paths(rng, task['gross_yield'], a, fx_vol, years, end - begin)
+
+    def bands(values):
+        return dict(zip((f"p{p}" for p in PERCENTILES), np.round(np.nanpercentile(values, PERCENTILES) * 100, 2).tolist()))
+
+    return {
+        'country': task['country'],
+        'location': task['location'],
+        'median_sale_price_usd': round(task['price_usd'], 0),
+        'gross_yield_pct': round(task['gross_yield'] * 100, 2),
+        'irr_pct': bands(rates),
+        'roi_pct': bands(roi),
+        'probability_of_loss': round(float((roi < 0).mean()), 4),
+        'expected_profit_usd': round(float(roi.mean() * task['price_usd']), 0),
+        'irr_unconverged_paths': int(np.isnan(rates).sum())
+    }
+
+
+class ReturnSimulator:
+    """
+    Monte Carlo IRR/ROI distributions per location from vacancy, rent growth, price appreciation
+    and FX paths. Each location is simulated in blocks of (years x paths) NumPy arrays; locations run in this
+    process, or across a process pool of up to SIMULATION_PROCESSES workers.
+    """
+
+    def __init__(self, max_processes=None):
+        self.max_processes = max_processes if max_processes is not None else int(os.environ.get('SIMULATION_PROCESSES', 0))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # fork: spawn/forkserver children would re-run the server module's startup code.
+                # The children only run simulate_location (NumPy), not the parent's threads.
+                self._pool = ProcessPoolExecutor(max_workers=self.max_processes,
+                                                 mp_context=multiprocessing.get_context('fork'))
+            return self._pool
+
+    def run(self, locations, paths=100000, seed=0, assumptions=None, parallel=True):
+        """
+        locations: dicts with country, location, currency, price_usd and gross_yield (fraction).
+        Returns one result per location, in input order.
+        """
+        merged = dict(DEFAULT_ASSUMPTIONS)
+        merged.update({k: v for k, v in (assumptions or {}).items() if k in DEFAULT_ASSUMPTIONS})
+        tasks = [dict(loc, paths=paths, seed=seed, assumptions=merged) for loc in locations]
+        if parallel and self.max_processes > 1 and len(tasks) > 1:
+            return list(self._executor().map(simulate_location, tasks))
+        return [simulate_location(task) for task in tasks]
@@ -0,0 +1,123 @@
+import glob
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # Optional: without pyarrow every process keeps its own frame
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishers are not serialized
+    fcntl = None
+
+
+class SharedDatasetStore:
+    """
+    Publishes the unified frame once as an Arrow IPC file and lets every co-located process
+    attach to it through a read-only memory map, so Product 1 and Product 2 hold one copy of
+    the data in RAM (the page cache) instead of one each.
+
+    Point SHARED_DATASET_DIR at a directory both services can see (ideally tmpfs, e.g. /dev/shm/byteme).
+    Files are named by data version; the first process to need a version builds and publishes it,
+    the others wait on a lock file and attach.
+
+    In pandas, numeric columns are zero-copy views of the mapped file (NaN is stored as a value,
+    not as a null, so no conversion is needed). String columns are dictionary-encoded in the file
+    and come back as object columns pointing at one Python string per distinct value.
+
+    Facts about how the frame was built (e.g. the deduplication report) are published with it in
+    the file's schema metadata, so processes that only attach can still report them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._mapped = {}  # version -> (DataFrame, metadata dict) attached in this process
+
+    @staticmethod
+    def available():
+        return pa is not None
+
+    def _path(self, version):
+        return os.path.join(self.directory, f"unified-{version}.arrow")
+
+    def load(self, version, build, metadata=None):
+        """
+        DataFrame for a data version: attach if published, else build(), publish and attach.
+        metadata: optional callable, run after build(), returning a JSON-serializable dict to publish with it.
+        """
+        if version in self._mapped:
+            return self._mapped[version][0]
+        path = self._path(version)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, '.publish.lock'), 'w') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                if not os.path.exists(path):
+                    df = build()
+                    if df.empty:
+                        return df  # Nothing worth sharing
+                    self._publish(df, path, metadata() if metadata is not None else {})
+                    self._remove_old_versions(keep=path)
+        self._mapped = {version: self._attach(path)}  # Older mappings are released once nothing references them
+        return self._mapped[version][0]
+
+    def metadata(self, version):
+        """Metadata published with an attached version ({} if none or not attached)."""
+        return self._mapped[version][1] if version in self._mapped else {}
+
+    def _publish(self, df, path, metadata):
+        columns, names = [], []
+        for name in df.columns:
+            series = df[name]
+            if series.dtype == object:
+                array = pa.array(series, type=pa.string(), from_pandas=True).dictionary_encode()
+            else:
+                # Keep NaN as a float value (from_pandas=False) so readers get a zero-copy view
+                array = pa.array(series.to_numpy())
+            columns.append(array)
+            names.append(name)
+        batch = pa.record_batch(columns, names=names).replace_schema_metadata({'dataset_metadata': json.dumps(metadata)})
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        os.close(fd)
+        try:
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, batch.schema) as writer:
+                    writer.write_batch(batch)  # One batch: every column is one contiguous buffer
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        print(f"Published shared dataset {path} ({len(df)} rows)")
+
+    def _remove_old_versions(self, keep):
+        # Processes still attached keep their mapping after unlink (POSIX); new ones attach to `keep`
+        for path in glob.glob(os.path.join(self.directory, 'unified-*.arrow')):
+            if path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _attach(self, path):
+        source = pa.memory_map(path, 'r')
+        table = pa.ipc.open_file(source).read_all()
+        metadata = json.loads((table.schema.metadata or {}).get(b'dataset_metadata', b'{}'))
+        data = {}
+        for name in table.column_names:
+            column = table.column(name)
+            array = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+            if pa.types.is_dictionary(array.type):
+                data[name] = np.asarray(array.to_pandas().astype(object))
+            else:
+                data[name] = array.to_numpy(zero_copy_only=False)
+        return pd.DataFrame(data, copy=False), metadata
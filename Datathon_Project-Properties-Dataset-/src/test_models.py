@@ -1,6 +1,24 @@
-from models import PricingModel, YieldAnalyzer
+from models import PricingModel, YieldAnalyzer, YieldCurveModel, GapScorer
+from approximate import ApproximateScanner
+from model_registry import ModelRegistry
+from deduplication import ListingDeduplicator
+import os
+import tempfile
+import lightgbm as lgb
+import numpy as np
 import pandas as pd
 
+def check(label, passed, detail=''):
+    print(f"{'✅' if passed else '❌'} {label}{f': {detail}' if detail and not passed else ''}")
+    assert passed, f"{label}: {detail}"
+    return passed
+
+def _tiny_booster(seed):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(200, 3))
+    return lgb.train({'objective': 'regression', 'verbose': -1, 'num_threads': 1},
+                     lgb.Dataset(X, label=X[:, 0] * 2 + rng.normal(size=200)), num_boost_round=5)
+
 def test_pricing_model():
     print("\n--- 1. Testing Global Pricing Model ---")
     pm = PricingModel()
@@ -79,6 +97,135 @@ def test_yield_analyzer():
     else:
         print("Verification Failed: No yields calculated (possibly unified data issue).")
 
+def test_model_registry():
+    print("\n--- 3. Testing Model Registry (publish / activate / rollback) ---")
+    with tempfile.TemporaryDirectory() as outer:
+        registry = ModelRegistry(os.path.join(outer, 'model_registry'))
+        first = registry.publish('demo', _tiny_booster(1), metadata={'data_fingerprint': 'a'})
+        second = registry.publish('demo', _tiny_booster(2), metadata={'data_fingerprint': 'b'})
+        check("Publish makes the new version current", registry.current_version('demo') == second and registry.versions('demo') == sorted([first, second]))
+
+        again = registry.publish('demo', _tiny_booster(2), metadata={'data_fingerprint': 'c'})
+        check("Republishing the current model stores nothing new", again == second and len(registry.versions('demo')) == 2, registry.versions('demo'))
+        check("...but refreshes its metadata", registry.metadata('demo').get('data_fingerprint') == 'c')
+
+        registry.activate('demo', first)
+        check("Rollback points CURRENT at the older version", registry.current_version('demo') == first)
+
+        # A loadable model file outside the registry must not be reachable through the version id
+        _tiny_booster(3).save_model(os.path.join(outer, 'outside.txt'))
+        for bad in ['../../outside', f"../demo/{second}", '20260101-000000-deadbeef', '', None]:
+            try:
+                registry.activate('demo', bad)
+                rejected = False
+            except ValueError:
+                rejected = True
+            check(f"Activate rejects {bad!r}", rejected and registry.current_version('demo') == first)
+
+def test_yield_analyzer_startup():
+    print("\n--- 4. Testing that restarts reuse the published yield model ---")
+    with tempfile.TemporaryDirectory() as root:
+        # The models share a class-level registry; point it at a temporary one, not the served registry
+        registry, served = ModelRegistry(root), YieldCurveModel.registry
+        YieldCurveModel.registry = registry
+        try:
+            YieldAnalyzer()  # Publishes the first version into the empty registry
+            before = (registry.current_version('yield'), registry.versions('yield'))
+            analyzer = YieldAnalyzer()
+            after = (registry.current_version('yield'), registry.versions('yield'))
+            check("A second start publishes no new version", before[0] is not None and before == after, f"{before} -> {after}")
+            check("...and serves the current one", analyzer.proxy_model.model_version == after[0], analyzer.proxy_model.model_version)
+            check("Unchanged training data is not retrained", analyzer.proxy_model.retrain_if_needed() is False)
+        finally:
+            YieldCurveModel.registry = served
+
+def test_retrain_if_needed():
+    print("\n--- 5. Testing the startup retrain check ---")
+    with tempfile.TemporaryDirectory() as root:
+        model = YieldCurveModel()
+        model.registry = ModelRegistry(root)
+        check("Empty registry: trains and publishes", model.retrain_if_needed() is True and model.registry.current_version('yield') is not None)
+        version = model.registry.current_version('yield')
+        check("Same training data: keeps the current version", model.retrain_if_needed() is False and model.registry.current_version('yield') == version)
+
+        # Pretend the data changed since publishing: retrains, but the identical booster is not republished
+        metadata_path = os.path.join(root, 'yield', f"{version}.json")
+        with open(metadata_path, 'w') as f:
+            f.write('{"data_fingerprint": "stale"}')
+        check("Changed fingerprint: retrains", model.retrain_if_needed() is True)
+        check("...without a duplicate version", model.registry.versions('yield') == [version], model.registry.versions('yield'))
+        check("...and records the new fingerprint", model.registry.metadata('yield').get('data_fingerprint') == model.training_fingerprint())
+
+def _repost_fixture():
+    """
+    30 distinct listings plus known reposts: 3 exact copies, 3 near copies (retitled case/punctuation,
+    area or price within 2%, one untitled within 0.5%), and 3 look-alikes that must be kept.
+    """
+    streets = ['Ayala Avenue', 'Bonifacio High Street', 'Katipunan', 'Ortigas Center', 'Eastwood', 'Rockwell']
+    rows = []
+    for i in range(30):
+        country = 'Philippines' if i < 20 else 'Thailand'
+        rows.append({
+            'country': country,
+            'location': f"{streets[i % len(streets)]}, Metro Manila" if country == 'Philippines' else 'Sukhumvit',
+            'transaction_type': 'sale',
+            'title': f"{1 + i % 3}BR {['condo', 'townhouse', 'loft'][i % 3]} for sale along {streets[i % len(streets)]}" if country == 'Philippines' else None,
+            'price_usd': round(100000 * 1.15 ** i, 2),
+            'area_sqm': 40.0 + 7 * i,
+            'bedrooms': 1 + i % 3,
+            'bathrooms': 1.0
+        })
+    df = pd.DataFrame(rows)
+    exact = df.iloc[[0, 5, 22]]
+    near = df.iloc[[1, 2, 21]].copy()
+    near.loc[near.index[0], 'title'] = near.loc[near.index[0], 'title'].upper() + '!!'
+    near.loc[near.index[0], 'price_usd'] *= 1.01
+    near.loc[near.index[1], 'area_sqm'] *= 0.99
+    near.loc[near.index[2], 'price_usd'] *= 1.003  # Untitled: only 0.5% tolerance
+    kept = df.iloc[[3, 4, 23]].copy()
+    kept.loc[kept.index[0], 'price_usd'] *= 1.10  # Same title, different price
+    kept.loc[kept.index[1], 'transaction_type'] = 'rent'  # Same listing text in another feed
+    kept.loc[kept.index[2], 'price_usd'] *= 1.01  # Untitled and beyond 0.5%
+    return pd.concat([df, exact, near, kept], ignore_index=True)
+
+def test_deduplication():
+    print("\n--- 6. Testing repost deduplication ---")
+    fixture = _repost_fixture()
+    out, report = ListingDeduplicator().dedupe(fixture)
+    check("Exact copies removed", report['exact_removed'] == 3, report['exact_removed'])
+    check("Near copies removed", report['near_removed'] == 3, report['near_removed'])
+    check("Look-alikes kept", report['rows_out'] == len(out) == 33, report['rows_out'])
+    check("Counts per country", report['by_country'] == {
+        'Philippines': {'exact_removed': 2, 'near_removed': 2},
+        'Thailand': {'exact_removed': 1, 'near_removed': 1}
+    }, report['by_country'])
+    check("First copy of each listing kept", out.head(30).equals(fixture.head(30)))
+    _, exact_only = ListingDeduplicator().dedupe(fixture, near=False)
+    check("Exact mode skips the near pass", exact_only['exact_removed'] == 3 and exact_only['near_removed'] == 0)
+
+def test_approximate_coverage():
+    print("\n--- 7. Testing approx=true intervals against the exact results ---")
+    scanner = ApproximateScanner(GapScorer().loader, YieldCurveModel(), per_stratum=20)
+    check("No sample before the ingestion path has run", scanner.sample() is None)
+    scanner.refresh()
+    check("Refresh is a no-op for an unchanged data version", scanner.refresh() == 0)
+    exact = GapScorer().analyze_gap().set_index(['country', 'location'])
+    approx = scanner.gap().set_index(['country', 'location'])
+    both = approx.index.intersection(exact.index)
+    covered = ((approx.loc[both, 'avg_price_ci_low'] <= exact.loc[both, 'avg_price'])
+               & (exact.loc[both, 'avg_price'] <= approx.loc[both, 'avg_price_ci_high']))
+    print(f"Median price inside the 95% interval for {covered.sum()} of {len(both)} locations")
+    check("Intervals cover the exact median for most locations", len(both) > 0 and covered.mean() >= 0.85, f"{covered.mean():.0%}")
+    # Strata no larger than the sample are kept whole, so their medians are exact
+    small = [key for key in both if exact.loc[key, 'supply'] <= 20]
+    check("Fully sampled locations match exactly", all(np.isclose(approx.loc[key, 'avg_price'], exact.loc[key, 'avg_price']) for key in small),
+          f"{len(small)} locations")
+
 if __name__ == "__main__":
     test_pricing_model()
+    test_model_registry()
+    test_yield_analyzer_startup()
+    test_retrain_if_needed()
+    test_deduplication()
+    test_approximate_coverage()
     test_yield_analyzer()
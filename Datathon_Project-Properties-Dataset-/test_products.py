@@ -5,6 +5,108 @@ import sys
 import os
 import signal
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+def check(label, passed, detail=''):
+    print(f"{'✅' if passed else '❌'} {label}{f': {detail}' if detail and not passed else ''}")
+    assert passed, f"{label}: {detail}"
+    return passed
+
+def test_scanner_paging(base="http://localhost:5002"):
+    """Product 2 paging: limit/sort/cursor pages, NDJSON, and 400s for bad paging parameters."""
+    print("\n[TEST] Product 2: Scanner paging, cursors and NDJSON")
+    full = requests.get(f"{base}/get_yields").json()['data']
+    expected = sorted(full, key=lambda r: -r['annual_yield_pct'])
+
+    pages, url = [], f"{base}/get_yields?limit=5&sort=-annual_yield_pct"
+    while url and len(pages) <= len(full):
+        page = requests.get(url).json()
+        pages.append(page)
+        url = f"{base}/get_yields?limit=5&cursor={page['next_cursor']}" if page['next_cursor'] else None
+    rows = [row for page in pages for row in page['data']]
+    check("Cursor pages cover every row once, in sort order",
+          [r['annual_yield_pct'] for r in rows] == [r['annual_yield_pct'] for r in expected] and len(rows) == len(full),
+          f"{len(rows)} rows paged vs {len(full)}")
+    check("Pages report the total", all(page['total'] == len(full) for page in pages))
+
+    res = requests.get(f"{base}/get_yields?format=ndjson&limit=7")
+    lines = [line for line in res.text.splitlines() if line]
+    check("NDJSON streams one row per line", res.headers['Content-Type'].startswith('application/x-ndjson') and len(lines) == min(7, len(full)),
+          f"{len(lines)} lines")
+
+    first = pages[0]
+    bad = {
+        'limit=abc': "limit=abc",
+        'limit=-5': "limit=-5",
+        'unknown sort field': "limit=5&sort=no_such_field",
+        'cursor with a different sort': f"limit=5&sort=annual_yield_pct&cursor={first['next_cursor']}" if first['next_cursor'] else None
+    }
+    for label, query in bad.items():
+        if query is not None:
+            status = requests.get(f"{base}/get_yields?{query}").status_code
+            check(f"400 for {label}", status == 400, f"got {status}")
+
+    from pagination import ResultSet
+    result = ResultSet({}, {'score': [None, 2.0, 1.0], 'name': ['a', 'b', 'c']})
+    check("Numeric columns starting with null stay sortable", result.sortable_fields() == ['score'], result.sortable_fields())
+
+def test_listings_store():
+    """Keyset pages over a small store: every row once, in order, ties broken by id, location-only filters indexed."""
+    print("\n[TEST] Listings store keyset pagination")
+    import tempfile
+    import sqlite3
+    import pandas as pd
+    from listings_store import ListingsStore
+
+    df = pd.DataFrame({
+        'country': ['Thailand'] * 6 + ['Vietnam'] * 4,
+        'location': ['Sukhumvit', 'Sukhumvit', 'Silom', 'Sukhumvit', 'Silom', 'Sukhumvit', 'Quận 1', 'Quận 1', 'Quận 3', 'Quận 1'],
+        'transaction_type': ['sale'] * 8 + ['rent'] * 2,
+        'property_type': ['Condo'] * 10,
+        'price_usd': [100.0, 250.0, 250.0, None, 90.0, 250.0, 120.0, 80.0, 5.0, 6.0],
+        'price_local': [1.0] * 10,
+        'area_sqm': [30.0, 50.0, 45.0, 40.0, 25.0, 60.0, 70.0, 35.0, 20.0, 30.0],
+        'bedrooms': [1, 2, 2, 1, 1, 3, 2, 1, 1, 1],
+        'bathrooms': [1] * 10
+    })
+    with tempfile.TemporaryDirectory() as directory:
+        store = ListingsStore(os.path.join(directory, 'listings.sqlite'))
+        store.ingest(df, 'v1')
+        for sort in ('price_usd', '-price_usd'):
+            filters = {'transaction_type': 'sale'}
+            expected, _, _ = store.search(filters, sort=sort, limit=100)
+            paged, after = [], None
+            while True:
+                rows, after, version = store.search(filters, sort=sort, limit=2, after=after)
+                paged.extend(rows)
+                if len(rows) < 2:
+                    break
+            check(f"Keyset pages ({sort}) match one full query", [r['id'] for r in paged] == [r['id'] for r in expected] and version == 'v1')
+            check(f"...skip rows without a price and keep ties in id order ({sort})",
+                  len(paged) == 7 and [r['id'] for r in paged if r['price_usd'] == 250.0] == sorted((r['id'] for r in paged if r['price_usd'] == 250.0), reverse=sort.startswith('-')))
+
+        rows, _, _ = store.search({'location': 'sukhumvit'}, sort='price_usd', limit=100)
+        check("Location filter is case-insensitive", len(rows) == 3, len(rows))  # 4 Sukhumvit rows, one without a price
+        with sqlite3.connect(store.path) as conn:
+            plan = ' '.join(str(row[-1]) for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM listings WHERE location = ? AND transaction_type = ? ORDER BY price_usd", ['Silom', 'sale']))
+        check("Location-only filters use a location-leading index", 'idx_listings_location' in plan, plan)
+
+def test_listings_search(base="http://localhost:5001"):
+    """Product 1 /listings/search: cursor pages cover the same rows as one large page."""
+    print("\n[TEST] Product 1: Listings search cursors")
+    query = "country=Thailand&transaction_type=sale&sort=-price_usd"
+    full = requests.get(f"{base}/listings/search?{query}&limit=60").json()
+    pages, url = [], f"{base}/listings/search?{query}&limit=7"
+    while url and len(pages) * 7 < 60:
+        pages.append(requests.get(url).json())
+        url = f"{base}/listings/search?{query}&limit=7&cursor={pages[-1]['next_cursor']}" if pages[-1]['next_cursor'] else None
+    rows = [row for page in pages for row in page['results']]
+    check("Cursor pages match a single page", [r['id'] for r in rows[:60]] == [r['id'] for r in full['results']], f"{len(rows)} vs {full['count']}")
+    if pages[0]['next_cursor']:
+        status = requests.get(f"{base}/listings/search?country=Thailand&sort=price_usd&limit=7&cursor={pages[0]['next_cursor']}").status_code
+        check("400 for a cursor with a different sort", status == 400, f"got {status}")
+
 def run_tests():
     print("--- Innovation Challenge: Product Verification ---")
     
@@ -35,6 +137,9 @@ def run_tests():
         else:
             print(f"❌ Product 1 Failed: {res.text}")
 
+        test_listings_search()
+        test_listings_store()
+
         # Test Product 2
         print("\n[TEST] Product 2: Investment Opportunity Scanner")
         url = "http://localhost:5002/get_yields"
@@ -45,6 +150,8 @@ def run_tests():
         else:
             print(f"❌ Product 2 Failed: {res.text}")
 
+        test_scanner_paging()
+
         # Test Product 3
         print("\n[TEST] Product 3: Cultural AI Assistant")
         # Test Yield Intent
@@ -64,6 +171,7 @@ def run_tests():
 
     except Exception as e:
         print(f"❌ Test Exception: {e}")
+        raise
     finally:
         print("\nStopping Servers...")
         p1.terminate()